@@ -1,8 +1,9 @@
 from abc import abstractmethod
 import numpy as np
-from typing import Tuple, Union
+from typing import Tuple, Union, Optional, Sequence
 from tools.rl_constants import Experience, ExperienceBatch, BrainSet, Action
-from tools.parameter_capture import ParameterCapture
+from tools.metrics import MetricsRecorder
+from tools.timer import PhaseTimer, DISABLED_TIMER
 
 
 class Agent:
@@ -14,12 +15,27 @@ class Agent:
         self.warmup = False
         self.t_step = 0
         self.episode_counter = 0
-        self.param_capture = ParameterCapture()
+        self.param_capture = MetricsRecorder()
         self.training = True
+        self.timer: PhaseTimer = DISABLED_TIMER
+
+    def set_timer(self, timer: PhaseTimer):
+        """ Set the timer of the phases of the agent's updates (sampling, learning, target updates) """
+        self.timer = timer
 
     def set_warmup(self, warmup: bool):
         self.warmup = warmup
 
+    def reset_envs(self, env_indices: Optional[Sequence[int]] = None):
+        """ Clear any state kept between acting steps (eg. stacked frames) for the given rows of the acting batch,
+        or for all rows, when the environments of these rows start a new episode """
+        pass
+
+    def select_envs(self, env_indices: Sequence[int]):
+        """ Keep the acting state of the given rows of the acting batch only, in this order, when environments
+        leave the batch """
+        pass
+
     @abstractmethod
     def set_mode(self, mode: str):
         pass
@@ -10,6 +10,7 @@ from tools.misc import soft_update
 import torch
 from agents.base import Agent
 from agents.policies.base_policy import Policy
+from tools.mixed_precision import MixedPrecision
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 torch.autograd.set_detect_anomaly(True)
@@ -55,7 +56,8 @@ class DDPGAgent(Agent):
             policy_update_frequency: int = 2,
             critic_grad_norm_clip: float = 1,
             td3: bool = False,
-            shared_agent_brain: bool = False
+            shared_agent_brain: bool = False,
+            mixed_precision: bool = False
     ):
         """Initialize an Agent object.
         Params
@@ -79,11 +81,13 @@ class DDPGAgent(Agent):
             policy_update_frequency (int, default=1): The number of time steps to wait before optimizing the policy &
                 updating the target networks. Introduced in TD3.
             shared_agent_brain (bool): Use a shared brain/model/optimizer for all agents
+            mixed_precision (bool): Train under autocast (fp16 on GPU, bf16 on CPU) with gradient scaling
         """
         super().__init__(action_size=action_size, state_shape=state_shape)
 
         self.agent_id = agent_id
         self.shared_agent_brain = shared_agent_brain
+        self.mixed_precision = MixedPrecision(enabled=mixed_precision)
         if not self.shared_agent_brain:
 
             # Shared Memory
@@ -149,10 +153,12 @@ class DDPGAgent(Agent):
 
     def set_mode(self, mode: str):
         if mode == 'train':
+            self.training = True
             DDPGAgent.online_actor.train()
             DDPGAgent.online_critic.train()
             self.policy.train()
         elif mode == 'eval':
+            self.training = False
             DDPGAgent.online_actor.eval()
             DDPGAgent.online_critic.eval()
             self.policy.eval()
@@ -170,8 +176,10 @@ class DDPGAgent(Agent):
             # Learn, if enough samples are available in memory
             if self.t_step % self.update_frequency == 0 and len(DDPGAgent.memory) > self.batch_size:
                 for i in range(self.n_learning_iterations):
-                    experience_batch: ExperienceBatch = DDPGAgent.memory.sample(self.batch_size)
-                    critic_loss, critic_errors, actor_loss, actor_errors = self.learn(experience_batch)
+                    with self.timer.phase('sample'):
+                        experience_batch: ExperienceBatch = DDPGAgent.memory.sample(self.batch_size)
+                    with self.timer.phase('learn'):
+                        critic_loss, critic_errors, actor_loss, actor_errors = self.learn(experience_batch)
 
                     # Update the priority replay buffer
                     with torch.no_grad():
@@ -208,22 +216,8 @@ class DDPGAgent(Agent):
             actor_errors
         """
         experience_batch = experience_batch.to(device)
-        critic_loss, critic_errors = self.policy.compute_critic_errors(
-            experience_batch,
-            online_actor=DDPGAgent.online_actor,
-            online_critic=DDPGAgent.online_critic,
-            target_actor=DDPGAgent.target_actor,
-            target_critic=DDPGAgent.target_critic,
-        )
-
-        DDPGAgent.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        torch.nn.utils.clip_grad_norm_(DDPGAgent.online_critic.parameters(), self.critic_grad_norm_clip)
-        DDPGAgent.critic_optimizer.step()
-
-        if self.t_step % self.policy_update_frequency == 0:
-            # Delay the policy update as in TD3
-            actor_loss, actor_errors = self.policy.compute_actor_errors(
+        with self.mixed_precision.autocast():
+            critic_loss, critic_errors = self.policy.compute_critic_errors(
                 experience_batch,
                 online_actor=DDPGAgent.online_actor,
                 online_critic=DDPGAgent.online_critic,
@@ -231,12 +225,32 @@ class DDPGAgent(Agent):
                 target_critic=DDPGAgent.target_critic,
             )
 
+        DDPGAgent.critic_optimizer.zero_grad()
+        self.mixed_precision.backward(critic_loss)
+        self.mixed_precision.unscale_(DDPGAgent.critic_optimizer)
+        torch.nn.utils.clip_grad_norm_(DDPGAgent.online_critic.parameters(), self.critic_grad_norm_clip)
+        self.mixed_precision.step(DDPGAgent.critic_optimizer)
+
+        if self.t_step % self.policy_update_frequency == 0:
+            # Delay the policy update as in TD3
+            with self.mixed_precision.autocast():
+                actor_loss, actor_errors = self.policy.compute_actor_errors(
+                    experience_batch,
+                    online_actor=DDPGAgent.online_actor,
+                    online_critic=DDPGAgent.online_critic,
+                    target_actor=DDPGAgent.target_actor,
+                    target_critic=DDPGAgent.target_critic,
+                )
+
             DDPGAgent.actor_optimizer.zero_grad()
-            actor_loss.backward()
-            DDPGAgent.actor_optimizer.step()
+            self.mixed_precision.backward(actor_loss)
+            self.mixed_precision.step(DDPGAgent.actor_optimizer)
+            self.mixed_precision.update()
 
             # Update target networks
-            soft_update(DDPGAgent.online_critic, DDPGAgent.target_critic, self.tau)
-            soft_update(DDPGAgent.online_actor, DDPGAgent.target_actor, self.tau)
+            with self.timer.phase('target_update'):
+                soft_update(DDPGAgent.online_critic, DDPGAgent.target_critic, self.tau)
+                soft_update(DDPGAgent.online_actor, DDPGAgent.target_actor, self.tau)
             return critic_loss, critic_errors, actor_loss, actor_errors
+        self.mixed_precision.update()
         return critic_loss, critic_errors, None, None
@@ -1,6 +1,6 @@
 import os
 import numpy as np
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Sequence
 from agents.base import Agent
 from agents.policies.base_policy import Policy
 from copy import deepcopy
@@ -12,6 +12,8 @@ from tools.misc import set_seed
 from agents.models.base import BaseModel
 from tools.misc import soft_update
 from tools.rl_constants import ExperienceBatch, Action
+from tools.mixed_precision import MixedPrecision
+from agents.models.components.cnn import disable_batchnorm_fusion
 
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -35,6 +37,7 @@ class DQNAgent(Agent):
                  seed: int = None,
                  action_repeats: int = 1,
                  gradient_clip: float = 1,
+                 mixed_precision: bool = False,
                  ):
         """Initialize an Agent object.
 
@@ -51,6 +54,7 @@ class DQNAgent(Agent):
             tau: float = 1e-3,
             update_frequency: int = 5,
             seed: int = None
+            mixed_precision (bool): Train under autocast (fp16 on GPU, bf16 on CPU) with gradient scaling
         """
         super().__init__(action_size=action_size, state_shape=state_shape)
 
@@ -59,6 +63,7 @@ class DQNAgent(Agent):
         self.tau = tau
         self.update_frequency = update_frequency
         self.gradient_clip = gradient_clip
+        self.mixed_precision = MixedPrecision(enabled=mixed_precision)
 
         self.previous_action: Optional[Action] = None
         self.action_repeats = action_repeats
@@ -66,6 +71,8 @@ class DQNAgent(Agent):
         # Double DQN
         self.online_qnetwork = model.to(device)
         self.target_qnetwork = deepcopy(model).to(device).eval()
+        # The target network is soft-updated at every learning step, so folding its batchnorms would not pay off
+        disable_batchnorm_fusion(self.target_qnetwork)
 
         self.memory = memory
 
@@ -80,12 +87,22 @@ class DQNAgent(Agent):
             self.online_qnetwork.set_seed(seed)
             self.target_qnetwork.set_seed(seed)
 
+    def reset_envs(self, env_indices: Optional[Sequence[int]] = None):
+        if hasattr(self.online_qnetwork, 'reset_envs'):
+            self.online_qnetwork.reset_envs(env_indices)
+
+    def select_envs(self, env_indices: Sequence[int]):
+        if hasattr(self.online_qnetwork, 'select_envs'):
+            self.online_qnetwork.select_envs(env_indices)
+
     def set_mode(self, mode: str):
         if mode == 'train':
+            self.training = True
             self.online_qnetwork.train()
             self.target_qnetwork.train()
             self.policy.train()
         elif mode == 'eval':
+            self.training = False
             self.online_qnetwork.eval()
             self.target_qnetwork.eval()
             self.policy.eval()
@@ -120,10 +137,12 @@ class DQNAgent(Agent):
             self.t_step += 1
             # If enough samples are available in memory, get random subset and learn
             if self.t_step % self.update_frequency == 0 and len(self.memory) > self.batch_size:
-                experience_batch = self.memory.sample(self.batch_size)
-                experience_batch = experience_batch.to(device)
+                with self.timer.phase('sample'):
+                    experience_batch = self.memory.sample(self.batch_size)
+                    experience_batch = experience_batch.to(device)
 
-                loss, errors = self.learn(experience_batch)
+                with self.timer.phase('learn'):
+                    loss, errors = self.learn(experience_batch)
 
                 with torch.no_grad():
                     if errors.min() < 0:
@@ -179,21 +198,25 @@ class DQNAgent(Agent):
         """
 
         # By default, calculate TD errors. Some DQN modifications (eg. categorical DQN) use custom errors/loss
-        loss, errors = self.policy.compute_errors(
-            self.online_qnetwork,
-            self.target_qnetwork,
-            experience_batch,
-            gamma=self.gamma
-        )
+        with self.mixed_precision.autocast():
+            loss, errors = self.policy.compute_errors(
+                self.online_qnetwork,
+                self.target_qnetwork,
+                experience_batch,
+                gamma=self.gamma
+            )
         assert errors.min() >= 0
 
-        # Perform optimization step
+        # Perform optimization step, unscaling the gradients before clamping them
         self.optimizer.zero_grad()
-        loss.backward()
+        self.mixed_precision.backward(loss)
+        self.mixed_precision.unscale_(self.optimizer)
         for param in self.online_qnetwork.parameters():
             param.grad.data.clamp_(-self.gradient_clip, self.gradient_clip)
-        self.optimizer.step()
+        self.mixed_precision.step(self.optimizer)
+        self.mixed_precision.update()
 
         # Perform a soft update of the target -> local network
-        soft_update(self.online_qnetwork, self.target_qnetwork, self.tau)
+        with self.timer.phase('target_update'):
+            soft_update(self.online_qnetwork, self.target_qnetwork, self.tau)
         return loss, errors
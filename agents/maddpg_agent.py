@@ -1,8 +1,10 @@
-from typing import Callable
+from typing import Callable, Optional
 from agents.base import Agent
 from tools.misc import *
 from tools.rl_constants import Experience, ExperienceBatch, Action
 from tools.misc import set_seed
+from tools.mixed_precision import MixedPrecision
+from tools.agent_layout import AgentLayout
 import numpy as np
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 # torch.autograd.set_detect_anomaly(True)
@@ -33,7 +35,8 @@ class MADDPGAgent(Agent):
             num_learning_updates=10,
             tau: float = 1e-2, batch_size: int = 512, update_frequency: int = 20,
             critic_grad_norm_clip: int = 1, policy_update_frequency: int = 2,
-            homogeneous_agents: bool = False
+            homogeneous_agents: bool = False,
+            mixed_precision: bool = False
         ):
 
         super().__init__(action_size=action_size, state_shape=state_shape)
@@ -53,6 +56,7 @@ class MADDPGAgent(Agent):
         self.policy = policy
 
         self.homogeneous_agents = homogeneous_agents
+        self.mixed_precision = MixedPrecision(enabled=mixed_precision)
 
         # critic local and target network (Q-Learning)
         if self.homogeneous_agents and MADDPGAgent.online_critic is None:
@@ -97,10 +101,12 @@ class MADDPGAgent(Agent):
 
     def set_mode(self, mode: str):
         if mode == 'train':
+            self.training = True
             self.online_actor.train()
             self.online_critic.train()
             self.policy.train()
         elif mode == 'eval':
+            self.training = False
             self.online_actor.eval()
             self.online_critic.eval()
             self.policy.eval()
@@ -118,10 +124,12 @@ class MADDPGAgent(Agent):
             if self.t_step % self.update_frequency == 0 and len(self.memory) > self.batch_size:
                 # If enough samples are available in memory, get random subset and learn
                 for i in range(self.num_learning_updates):
-                    experience_batch = self.memory.sample(self.batch_size)
-                    experience_batch = experience_batch.to(device)
+                    with self.timer.phase('sample'):
+                        experience_batch = self.memory.sample(self.batch_size)
+                        experience_batch = experience_batch.to(device)
 
-                    critic_loss, critic_errors, actor_loss, actor_errors = self.learn(experience_batch)
+                    with self.timer.phase('learn'):
+                        critic_loss, critic_errors, actor_loss, actor_errors = self.learn(experience_batch)
 
                     with torch.no_grad():
                         if critic_errors.min() < 0:
@@ -160,23 +168,8 @@ class MADDPGAgent(Agent):
             actor_errors
         """
         experience_batch = experience_batch.to(device)
-        critic_loss, critic_errors = self.policy.compute_critic_errors(
-            experience_batch,
-            online_actor=self.online_actor,
-            online_critic=self.online_critic,
-            target_actor=self.target_actor,
-            target_critic=self.target_critic,
-            agent_num=self.agent_id
-        )
-
-        self.critic_optimizer.zero_grad()
-        critic_loss.backward()
-        torch.nn.utils.clip_grad_norm_(self.online_critic.parameters(), self.critic_grad_norm_clip)
-        self.critic_optimizer.step()
-
-        if self.t_step % self.policy_update_frequency == 0:
-            # Delay the policy update as in TD3
-            actor_loss, actor_errors = self.policy.compute_actor_errors(
+        with self.mixed_precision.autocast():
+            critic_loss, critic_errors = self.policy.compute_critic_errors(
                 experience_batch,
                 online_actor=self.online_actor,
                 online_critic=self.online_critic,
@@ -185,20 +178,41 @@ class MADDPGAgent(Agent):
                 agent_num=self.agent_id
             )
 
+        self.critic_optimizer.zero_grad()
+        self.mixed_precision.backward(critic_loss)
+        self.mixed_precision.unscale_(self.critic_optimizer)
+        torch.nn.utils.clip_grad_norm_(self.online_critic.parameters(), self.critic_grad_norm_clip)
+        self.mixed_precision.step(self.critic_optimizer)
+
+        if self.t_step % self.policy_update_frequency == 0:
+            # Delay the policy update as in TD3
+            with self.mixed_precision.autocast():
+                actor_loss, actor_errors = self.policy.compute_actor_errors(
+                    experience_batch,
+                    online_actor=self.online_actor,
+                    online_critic=self.online_critic,
+                    target_actor=self.target_actor,
+                    target_critic=self.target_critic,
+                    agent_num=self.agent_id
+                )
+
             self.actor_optimizer.zero_grad()
-            actor_loss.backward()
-            self.actor_optimizer.step()
+            self.mixed_precision.backward(actor_loss)
+            self.mixed_precision.step(self.actor_optimizer)
+            self.mixed_precision.update()
 
             # Update target networks
-            soft_update(self.online_critic, self.target_critic, self.tau)
-            soft_update(self.online_actor, self.target_actor, self.tau)
+            with self.timer.phase('target_update'):
+                soft_update(self.online_critic, self.target_critic, self.tau)
+                soft_update(self.online_actor, self.target_actor, self.tau)
             return critic_loss, critic_errors, actor_loss, actor_errors
+        self.mixed_precision.update()
         return critic_loss, critic_errors, None, None
 
 
 class DummyMADDPGAgent(Agent):
     """Interacts with and learns from the environment."""
-    def __init__(self, state_shape, action_size, seed, map_agent_to_state_slice, map_agent_to_action_slice):
+    def __init__(self, state_shape, action_size, seed, agent_layout: Optional[AgentLayout] = None):
         """Initialize an Agent object.
 
         Params
@@ -206,6 +220,7 @@ class DummyMADDPGAgent(Agent):
             state_shape (int): dimension of each state
             action_size (int): dimension of each action
             seed (int): random seed
+            agent_layout (AgentLayout): layout of the agents' blocks in the joint states and actions
         """
         super().__init__(action_size=action_size, state_shape=state_shape)
         if seed is not None:
@@ -213,8 +228,7 @@ class DummyMADDPGAgent(Agent):
         self.target_actor = lambda x: torch.randint(0, self.action_size + 1, (len(x), 1)).to(device)
         self.online_actor = lambda x: torch.randint(0, self.action_size + 1, (len(x), 1)).to(device)
         self.online_critic = {}
-        self.map_agent_to_state_slice = map_agent_to_state_slice
-        self.map_agent_to_action_slice = map_agent_to_action_slice
+        self.agent_layout = agent_layout
 
     def set_mode(self, mode: str):
         pass
@@ -0,0 +1,296 @@
+import numpy as np
+import torch
+from typing import Callable, Optional, Tuple
+from agents.base import Agent
+from agents.memory.memory import Memory
+from agents.models.components.grouped import clip_grad_norm_per_group_
+from agents.models.components.noise import Noise, GaussianNoise
+from tools.agent_layout import AgentLayout
+from tools.misc import set_seed, soft_update
+from tools.mixed_precision import MixedPrecision
+from tools.rl_constants import Experience, Transition, ExperienceBatch, Action, to_primitive
+from tools.timer import DISABLED_TIMER
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+class MADDPGLearner:
+    """ Centralized MADDPG learner, updating the actors and critics of all agents in one batched pass
+
+    The actors and critics of the N agents are grouped models (eg. GroupedMLP with N groups), whose stacked weights
+    are evaluated with one batched matmul per layer. Per update, the target actions of every agent are computed
+    once and shared by all critics, rather than each agent re-running the target actors over the other agents'
+    next states. Each critic sees the joint state and joint action from its own agent's point of view, ie. its own
+    block followed by the other agents' blocks.
+
+    Agents must share the same state and action sizes, and act in a continuous action space, as in tennis (see
+    tasks/tennis/solutions/maddpg/train_maddpg.py). Soccer is not supported: its goalies and strikers choose
+    discrete actions among different numbers of choices, which the deterministic, clamped continuous actors cannot
+    produce, so the soccer scripts keep per-agent MADDPGAgents. The simulator interacts with the learner through the
+    CentralizedMADDPGAgent views in self.agents, which can be placed in Brains as usual
+    """
+    def __init__(
+            self,
+            agent_layout: AgentLayout,
+            actor_factory: Callable[[], torch.nn.Module],
+            critic_factory: Callable[[], torch.nn.Module],
+            actor_optimizer_factory: Callable,
+            critic_optimizer_factory: Callable,
+            memory_factory: Callable[[], Memory],
+            noise_factory: Callable[[], Noise] = lambda: GaussianNoise(),
+            gamma: float = 0.99,
+            tau: float = 1e-2,
+            batch_size: int = 512,
+            update_frequency: int = 20,
+            num_learning_updates: int = 10,
+            critic_grad_norm_clip: float = 1,
+            policy_update_frequency: int = 2,
+            continuous_action_range: Tuple[float, float] = (-1, 1),
+            seed: Optional[int] = None,
+            mixed_precision: bool = False,
+    ):
+        """
+        :param agent_layout: Layout of the agents in the joint states and actions
+        :param actor_factory: Return a grouped actor with one group per agent, mapping (N, batch, state_size) to
+            (N, batch, action_size)
+        :param critic_factory: Return a grouped critic with one group per agent, mapping
+            (N, batch, joint_state_size + joint_action_size) to (N, batch, 1)
+        :param actor_optimizer_factory: Return an optimizer for the actor parameters
+        :param critic_optimizer_factory: Return an optimizer for the critic parameters
+        :param memory_factory: Return a Memory storing joint transitions
+        :param noise_factory: Return the exploration noise added to the actions while training
+        :param gamma: Discount factor
+        :param tau: Parameter used for soft copying; tau=1 -> a hard copy
+        :param batch_size: Minibatch size
+        :param update_frequency: Number of time steps between updates
+        :param num_learning_updates: Number of learning iterations to perform at each update step
+        :param critic_grad_norm_clip: Maximum gradient norm of each agent's critic
+        :param policy_update_frequency: Number of critic updates per actor update, as in TD3
+        :param continuous_action_range: Range to clip actions to
+        :param seed: Random seed
+        :param mixed_precision: Whether to train with mixed precision, see MixedPrecision
+        """
+        if seed is not None:
+            set_seed(seed)
+        for attribute in AgentLayout.ATTRIBUTES:
+            if len(set(agent_layout.sizes[attribute].values())) > 1:
+                raise ValueError("All agents must share the same {} size".format(attribute))
+
+        self.agent_layout = agent_layout
+        self.num_agents = agent_layout.num_agents
+        self.action_size = agent_layout.sizes['action'][agent_layout.agent_ids[0]]
+
+        self.online_actor = actor_factory().to(device).float()
+        self.target_actor = actor_factory().to(device).float().eval()
+        self.target_actor.load_state_dict(self.online_actor.state_dict())
+
+        self.online_critic = critic_factory().to(device).float()
+        self.target_critic = critic_factory().to(device).float().eval()
+        self.target_critic.load_state_dict(self.online_critic.state_dict())
+
+        self.actor_optimizer = actor_optimizer_factory(self.online_actor.parameters())
+        self.critic_optimizer = critic_optimizer_factory(self.online_critic.parameters())
+
+        self.memory = memory_factory()
+        self.noise = noise_factory()
+
+        self.gamma = gamma
+        self.tau = tau
+        self.batch_size = batch_size
+        self.update_frequency = update_frequency
+        self.num_learning_updates = num_learning_updates
+        self.critic_grad_norm_clip = critic_grad_norm_clip
+        self.policy_update_frequency = policy_update_frequency
+        self.continuous_action_range = continuous_action_range
+
+        self.t_step = 0
+        self.learning_steps = 0
+        self.training = True
+        self.warmup = False
+        self.timer = DISABLED_TIMER
+        self.huber_errors = torch.nn.SmoothL1Loss(reduction='none')
+        self.mixed_precision = MixedPrecision(enabled=mixed_precision)
+
+        # Actions of all agents for the most recent joint state, shared by the agent views
+        self.cached_joint_state = None
+        self.cached_actions = None
+        # Rewards and dones reported by the agent views for the current time step
+        self.pending_experiences = {}
+
+        self.agents = [
+            CentralizedMADDPGAgent(self, agent_number, agent_id)
+            for agent_number, agent_id in enumerate(agent_layout.agent_ids)
+        ]
+
+    def set_mode(self, mode: str):
+        if mode == 'train':
+            self.online_actor.train()
+            self.online_critic.train()
+            self.training = True
+        elif mode == 'eval':
+            self.online_actor.eval()
+            self.online_critic.eval()
+            self.training = False
+        else:
+            raise ValueError('Invalid mode: {}'.format(mode))
+
+    def get_actions(self, joint_state: torch.Tensor) -> np.ndarray:
+        """ Actions of every agent for the joint state, computed in a single grouped forward pass and cached
+        until the joint state changes
+
+        :return: Array of shape (num_agents, 1, action_size)
+        """
+        if joint_state is not self.cached_joint_state:
+            states = self.agent_layout.stack_agent_attributes(joint_state.view(1, -1).float().to(device), 'state')
+            self.online_actor.eval()
+            with torch.no_grad():
+                actions = self.online_actor(states)
+            self.online_actor.train(self.training)
+            if self.training:
+                actions += self.noise.sample(actions)
+            actions = actions.clamp(*self.continuous_action_range).cpu().numpy()
+            self.cached_joint_state = joint_state
+            self.cached_actions = actions
+        return self.cached_actions
+
+    def step(self, agent_number: int, experience: Experience):
+        """ Collect an agent's experience, storing the joint transition once every agent has reported """
+        self.pending_experiences[agent_number] = experience
+        if len(self.pending_experiences) < self.num_agents:
+            return
+        experiences = [self.pending_experiences[i] for i in range(self.num_agents)]
+        self.pending_experiences = {}
+
+        joint_experience = Transition(
+            state=experience.joint_state.view(1, -1),
+            action=Action(value=experience.joint_action.view(1, -1).cpu().numpy()),
+            reward=tuple(to_primitive(e.reward) for e in experiences),
+            next_state=experience.joint_next_state.view(1, -1),
+            done=tuple(to_primitive(e.done) for e in experiences),
+            t_step=experience.t_step,
+        )
+        self.memory.add(joint_experience)
+
+        if self.warmup:
+            return
+        self.t_step += 1
+        if self.t_step % self.update_frequency == 0 and len(self.memory) > self.batch_size:
+            for _ in range(self.num_learning_updates):
+                with self.timer.phase('sample'):
+                    experience_batch = self.memory.sample(self.batch_size).to(device)
+                with self.timer.phase('learn'):
+                    critic_loss, critic_errors, actor_loss, _ = self.learn(experience_batch)
+                self.memory.update(experience_batch.sample_idxs, critic_errors.mean(0).detach().cpu().numpy())
+                for agent in self.agents:
+                    agent.param_capture.add('critic_loss', critic_loss)
+                    agent.param_capture.add('actor_loss', actor_loss)
+
+    def step_episode(self, episode: int):
+        self.noise.reset()
+        self.memory.step_episode(episode)
+
+    def learn(self, experience_batch: ExperienceBatch) -> tuple:
+        """ Update the critics, and periodically the actors, of all agents from a batch of joint transitions
+
+        :return: critic_loss, critic_errors of shape (num_agents, batch, 1), actor_loss, actor_errors
+        """
+        layout = self.agent_layout
+        bsize = experience_batch.states.shape[0]
+
+        # (N, batch, size) views of the batch
+        states = layout.stack_agent_attributes(experience_batch.states, 'state')
+        next_states = layout.stack_agent_attributes(experience_batch.next_states, 'state')
+        rewards = experience_batch.rewards.view(bsize, self.num_agents).t().unsqueeze(-1)
+        dones = experience_batch.dones.view(bsize, self.num_agents).t().unsqueeze(-1)
+        critic_states = layout.agent_centric_attributes(experience_batch.states, 'state')
+
+        with torch.no_grad(), self.mixed_precision.autocast():
+            # The target actions of every agent are computed once and shared by all critics
+            next_actions = self.target_actor(next_states)
+            joint_next_actions = next_actions.transpose(0, 1).reshape(bsize, -1)
+            q_target_next = self.target_critic(torch.cat((
+                layout.agent_centric_attributes(experience_batch.next_states, 'state'),
+                layout.agent_centric_attributes(joint_next_actions.float(), 'action'),
+            ), dim=-1)).float()
+            q_targets = rewards + self.gamma * q_target_next * (1 - dones)
+
+        with self.mixed_precision.autocast():
+            q_expected = self.online_critic(torch.cat((
+                critic_states, layout.agent_centric_attributes(experience_batch.actions, 'action')
+            ), dim=-1)).float()
+        critic_errors = self.huber_errors(q_expected, q_targets)
+        # Sum of the per-agent mean losses, so each agent's critic receives the gradient of its own loss
+        critic_loss = critic_errors.mean(dim=(1, 2)).sum()
+
+        self.critic_optimizer.zero_grad()
+        self.mixed_precision.backward(critic_loss)
+        self.mixed_precision.unscale_(self.critic_optimizer)
+        clip_grad_norm_per_group_(self.online_critic.parameters(), self.critic_grad_norm_clip, self.num_agents)
+        self.mixed_precision.step(self.critic_optimizer)
+
+        self.learning_steps += 1
+        if self.learning_steps % self.policy_update_frequency != 0:
+            self.mixed_precision.update()
+            return critic_loss, critic_errors, None, None
+
+        with self.mixed_precision.autocast():
+            actions = self.online_actor(states)
+            # Each agent's critic sees its own action with gradients, and the other agents' actions detached
+            joint_actions = actions.detach().transpose(0, 1).reshape(bsize, -1)
+            other_agent_actions = layout.agent_centric_attributes(joint_actions, 'action')[:, :, self.action_size:]
+            actor_errors = -self.online_critic(torch.cat((critic_states, actions, other_agent_actions), dim=-1)).float()
+        actor_loss = actor_errors.mean(dim=(1, 2)).sum()
+
+        self.actor_optimizer.zero_grad()
+        self.mixed_precision.backward(actor_loss)
+        self.mixed_precision.step(self.actor_optimizer)
+        self.mixed_precision.update()
+
+        with self.timer.phase('target_update'):
+            soft_update(self.online_critic, self.target_critic, self.tau)
+            soft_update(self.online_actor, self.target_actor, self.tau)
+        return critic_loss, critic_errors, actor_loss, actor_errors
+
+
+class CentralizedMADDPGAgent(Agent):
+    """ View of a single agent of a MADDPGLearner, delegating acting and learning to the learner """
+    def __init__(self, learner: MADDPGLearner, agent_number: int, agent_id: str):
+        super().__init__(
+            state_shape=learner.agent_layout.sizes['state'][agent_id],
+            action_size=learner.agent_layout.sizes['action'][agent_id]
+        )
+        self.learner = learner
+        self.agent_number = agent_number
+        self.agent_id = agent_id
+
+    def set_mode(self, mode: str):
+        self.learner.set_mode(mode)
+        self.training = mode == 'train'
+
+    def set_warmup(self, warmup: bool):
+        super().set_warmup(warmup)
+        self.learner.warmup = warmup
+
+    def set_timer(self, timer):
+        super().set_timer(timer)
+        self.learner.timer = timer
+
+    def get_action(self, state: torch.Tensor, joint_state: Optional[torch.Tensor] = None, *args, **kwargs) -> Action:
+        if joint_state is None:
+            raise ValueError("The joint state is required to act with a centralized learner")
+        return Action(value=self.learner.get_actions(joint_state)[self.agent_number])
+
+    def get_random_action(self, *args, **kwargs) -> Action:
+        low, high = self.learner.continuous_action_range
+        return Action(value=np.random.uniform(low, high, (1, self.action_size)))
+
+    def step(self, experience: Experience, **kwargs):
+        self.learner.step(self.agent_number, experience)
+
+    def step_episode(self, episode: int, *args):
+        # The learner is stepped once per episode, by the first agent
+        if self.agent_number == 0:
+            self.learner.step_episode(episode)
+
+    def learn(self, experience_batch: ExperienceBatch) -> tuple:
+        return self.learner.learn(experience_batch)
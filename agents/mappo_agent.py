@@ -1,11 +1,11 @@
 import torch
 import torch.nn as nn
-from typing import Callable
 from agents.models.ppo import PPO_Actor_Critic
 from agents.ppo_agent import PPOAgent
-from typing import Optional, Dict
+from typing import Optional, Callable
 from tools.parameter_scheduler import ParameterScheduler
 from tools.rl_constants import Action
+from tools.agent_layout import AgentLayout
 from torch.nn import functional as F
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -20,8 +20,7 @@ class MAPPOAgent(PPOAgent):
             action_size: int,
             actor_critic_factory: Callable[[], PPO_Actor_Critic],
             optimizer_factory: Callable[[torch.nn.Module.parameters], torch.optim.Optimizer],
-            map_agent_to_state_slice: Dict[str, Callable[[torch.Tensor], torch.Tensor]],
-            map_agent_to_action_slice: Dict[str, Callable[[torch.Tensor], torch.Tensor]],
+            agent_layout: AgentLayout,
             grad_clip: float = 1.,
             gamma: float = 0.99,
             batch_size: int = 1024,
@@ -42,6 +41,7 @@ class MAPPOAgent(PPOAgent):
             min_batches_for_training: int = 16,
             num_learning_updates: int = 10,
             seed: Optional[int] = None,
+            mixed_precision: bool = False,
     ):
         """
         :param agent_id: The identifier for the agent, used to identify other agents' states/actions
@@ -50,10 +50,7 @@ class MAPPOAgent(PPOAgent):
         :param seed: Seed for reproducibility
         :param actor_critic_factory: Function returning the actor-critic model
         :param optimizer_factory: Function returning the optimizer for the actor-critic model
-        :param map_agent_to_state_slice: Dictionary mapping the agent_id to a function which slices the joint_state
-         tensor such that it extracts the agents state
-        :param map_agent_to_action_slice: Dictionary mapping the agent_id to a function which slices the joint_action
-         tensor such that it extracts the agents action
+        :param agent_layout: Layout of the agents' blocks in the joint_state and joint_action tensors
         :param grad_clip: Clip absolute value of the gradient above this value
         :param gamma: Discount factor
         :param batch_size: SGD minibatch size
@@ -66,6 +63,7 @@ class MAPPOAgent(PPOAgent):
         :param continuous_action_range_clip: The range to clip continuous actions above. Only used for continuous actions
         :param min_batches_for_training: Minimum number of batches to accumulate before performing training
         :param num_learning_updates: Number of epochs to train for over before discarding samples
+        :param mixed_precision: Train under autocast (fp16 on GPU, bf16 on CPU) with gradient scaling
         """
         super().__init__(
             state_size,
@@ -84,11 +82,11 @@ class MAPPOAgent(PPOAgent):
             continuous_action_range_clip,
             min_batches_for_training,
             num_learning_updates,
+            mixed_precision,
         )
 
         self.agent_id = agent_id
-        self.map_agent_to_state_slice = map_agent_to_state_slice
-        self.map_agent_to_action_slice = map_agent_to_action_slice
+        self.agent_layout = agent_layout
 
     def get_action(self, agent_state: torch.FloatTensor, joint_state: torch.FloatTensor, joint_action: Optional[torch.FloatTensor]=None, action: Optional[torch.FloatTensor]=None, *args, **kwargs) -> Action:
         """Returns actions for given states as per target policy.
@@ -102,8 +100,8 @@ class MAPPOAgent(PPOAgent):
             - log_prob (Tensor): log probability of current action distribution
             - value (Tensor): estimate value function
         """
-        other_agent_states = self.get_other_agent_attributes(joint_state, self.map_agent_to_state_slice, flatten=False)
-        other_agent_actions = self.get_other_agent_attributes(joint_action, self.map_agent_to_action_slice, flatten=False) if joint_action is not None else None
+        other_agent_states = self.get_other_agent_attributes(joint_state, 'state', flatten=False)
+        other_agent_actions = self.get_other_agent_attributes(joint_action, 'action', flatten=False) if joint_action is not None else None
 
         self.target_actor_critic.eval()
         with torch.no_grad():
@@ -120,47 +118,34 @@ class MAPPOAgent(PPOAgent):
 
         return Action(value=actions, log_probs=log_probs, critic_values=values)
 
-    def get_other_agent_attributes(self, x: torch.Tensor, agent_slicing_dict: Dict[str, Callable[[torch.Tensor], torch.Tensor]], apply_fn_map: Dict[str, Callable[[torch.Tensor], torch.Tensor]] = None, flatten: bool = True):
+    def get_other_agent_attributes(self, x: torch.Tensor, attribute: str = 'state', flatten: bool = True):
         """ Get the attributes for all other agents
-        :param x: Tensor containing states or actions
-        :param agent_slicing_dict: Dictionary mapping the agent_id to a function which slices the tensor to extract
-            agent attributes
-        :param apply_fn_map: Mapping from agent_id to a function for pre-processing a tensor
-        :param flatten: Whether to flatten the joint attributes into a 1d vector
+        :param x: Tensor containing joint states or joint actions
+        :param attribute: Either 'state' or 'action'
+        :param flatten: Whether to flatten the other agents' attributes into a single vector per sample, otherwise
+            they are stacked with shape (batch, num_other_agents, size)
         :return: torch.Tensor of other agent attributes
         """
-        output = []
-        for k, f in agent_slicing_dict.items():
-            if k != self.agent_id:
-                if apply_fn_map:
-                    output.append(apply_fn_map[k](f(x)).reshape(1, -1))
-                else:
-                    output.append(f(x).reshape(1, -1))
-
-        if flatten:
-            output = torch.cat(output, dim=1)
-        else:
-            output = torch.cat(output, dim=0)
-        return output
-
-    def get_agent_attributes(self, x: torch.Tensor, agent_slicing_dict: dict):
+        return self.agent_layout.other_agent_attributes(x, self.agent_id, attribute, flatten=flatten)
+
+    def get_agent_attributes(self, x: torch.Tensor, attribute: str = 'state'):
         """ Get the agent's attributes
-        :param x: Tensor containing states or actions
-        :param agent_slicing_dict: Dictionary mapping the agent_id to a function which slices the tensor to extract
-            agent attributes
+        :param x: Tensor containing joint states or joint actions
+        :param attribute: Either 'state' or 'action'
         """
-        return agent_slicing_dict[self.agent_id](x)
+        return self.agent_layout.agent_attributes(x, self.agent_id, attribute)
 
     def _learn(self, sampled_log_probs: torch.Tensor, sampled_joint_states: torch.Tensor, sampled_joint_actions: torch.Tensor, sampled_states: torch.Tensor, sampled_actions: torch.Tensor, sampled_advantages: torch.Tensor, sampled_returns: torch.Tensor):
-        other_agent_states = self.get_other_agent_attributes(sampled_joint_states, self.map_agent_to_state_slice, flatten=False)
-        other_agent_actions = self.get_other_agent_attributes(sampled_joint_actions, self.map_agent_to_action_slice, flatten=False)
+        other_agent_states = self.get_other_agent_attributes(sampled_joint_states, 'state', flatten=False)
+        other_agent_actions = self.get_other_agent_attributes(sampled_joint_actions, 'action', flatten=False)
 
         bsize = len(sampled_states)
 
-        _, log_probs, entropy_loss, values = self.online_actor_critic(
-            agent_state=sampled_states, other_agent_states=other_agent_states,
-            other_agent_actions=other_agent_actions, action=sampled_actions
-        )
+        with self.mixed_precision.autocast():
+            _, log_probs, entropy_loss, values = self.online_actor_critic(
+                agent_state=sampled_states, other_agent_states=other_agent_states,
+                other_agent_actions=other_agent_actions, action=sampled_actions
+            )
         sampled_log_probs = sampled_log_probs.view(bsize, -1)
         log_probs = log_probs.view(bsize, -1)
 
@@ -176,9 +161,11 @@ class MAPPOAgent(PPOAgent):
         # Update actor critic
         # Combine loss functions from actor/critic
         self.optimizer.zero_grad()
-        (value_loss + policy_loss).backward()
+        self.mixed_precision.backward(value_loss + policy_loss)
+        self.mixed_precision.unscale_(self.optimizer)
         nn.utils.clip_grad_norm_(self.online_actor_critic.parameters(), self.grad_clip)
-        self.optimizer.step()
+        self.mixed_precision.step(self.optimizer)
+        self.mixed_precision.update()
 
     def step_episode(self, episode, *args):
         self.process_trajectory()
@@ -0,0 +1,189 @@
+import random
+import numpy as np
+import torch
+from typing import Optional, Union
+from agents.memory.prioritized_memory import PrioritizedMemory
+from tools.agent_layout import AgentLayout
+from tools.misc import set_seed
+from tools.parameter_scheduler import ParameterScheduler
+from tools.rl_constants import ExperienceBatch, Transition, StepRecord
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+class JointMemory:
+    """ Replay storage shared by all agents of a multi-agent environment
+
+    Each environment step is stored once, as a row of joint state, action and next state tensors along
+    with one reward and done per agent, rather than once per agent memory. The agents sample through their own
+    view of the storage (see agent_memory and prioritized_agent_memory), which rebuilds the agent's states, actions,
+    rewards and dones from the sampled joint rows with the agent layout.
+
+    Transitions must be emitted from a StepRecord, as done by simulation.utils.multi_agent_step_agents_fn
+    """
+    MIN_ALLOCATION = 1024
+
+    def __init__(self, capacity: int, agent_layout: AgentLayout, continuous_actions: bool = True, seed: Optional[int] = None):
+        """
+        :param capacity: Maximum number of environment steps to store
+        :param agent_layout: Layout of the agents in the joint states and actions
+        :param continuous_actions: Whether the sampled actions are floats, or longs for discrete actions
+        :param seed: Random seed
+        """
+        if seed is not None:
+            set_seed(seed)
+        self.capacity = capacity
+        self.agent_layout = agent_layout
+        self.continuous_actions = continuous_actions
+        self.agent_numbers = {agent_id: i for i, agent_id in enumerate(agent_layout.agent_ids)}
+
+        self.joint_state_size = sum(agent_layout.sizes['state'].values())
+        self.joint_action_size = sum(agent_layout.sizes['action'].values())
+        # Storage grows geometrically up to the capacity, rather than being allocated in full upfront
+        self.num_allocated = 0
+        self.joint_states = torch.zeros(0, self.joint_state_size)
+        self.joint_actions = torch.zeros(0, self.joint_action_size)
+        self.joint_next_states = torch.zeros(0, self.joint_state_size)
+        self.rewards = torch.zeros(0, agent_layout.num_agents)
+        self.dones = torch.zeros(0, agent_layout.num_agents)
+
+        self.curr_write_idx = 0
+        self.available_samples = 0
+        # The most recently stored record and its row, shared by the transitions of all agents at that step
+        self.last_step_record = None
+        self.last_idx = None
+
+    def add(self, experience: Transition) -> int:
+        """ Store the step of the transition, unless it was already stored through another agent
+
+        :return: The row holding the step
+        """
+        step_record: StepRecord = getattr(experience, 'step_record', None)
+        if step_record is None:
+            raise ValueError("JointMemory requires transitions emitted from a StepRecord")
+        if step_record is self.last_step_record:
+            return self.last_idx
+        if step_record.num_agents != self.agent_layout.num_agents:
+            raise ValueError("Expected {} agents, found {}".format(self.agent_layout.num_agents, step_record.num_agents))
+
+        idx = self.curr_write_idx
+        if idx >= self.num_allocated:
+            self._grow(min(self.capacity, max(2 * self.num_allocated, self.MIN_ALLOCATION)))
+        self.joint_states[idx] = step_record.joint_state.view(-1)
+        self.joint_actions[idx] = step_record.joint_action.view(-1)
+        self.joint_next_states[idx] = step_record.joint_next_state.view(-1)
+        self.rewards[idx] = torch.from_numpy(step_record.rewards)
+        self.dones[idx] = torch.from_numpy(step_record.dones)
+
+        self.curr_write_idx = (self.curr_write_idx + 1) % self.capacity
+        self.available_samples = min(self.available_samples + 1, self.capacity)
+        self.last_step_record = step_record
+        self.last_idx = idx
+        return idx
+
+    def _grow(self, num_rows: int):
+        def grow(x: torch.Tensor) -> torch.Tensor:
+            output = torch.zeros(num_rows, x.shape[1], dtype=x.dtype)
+            output[:x.shape[0]] = x
+            return output
+
+        self.joint_states = grow(self.joint_states)
+        self.joint_actions = grow(self.joint_actions)
+        self.joint_next_states = grow(self.joint_next_states)
+        self.rewards = grow(self.rewards)
+        self.dones = grow(self.dones)
+        self.num_allocated = num_rows
+
+    def get_batch(self, agent_id: str, idxs: Union[list, np.ndarray]) -> ExperienceBatch:
+        """ Build the agent's batch from the joint rows at idxs, the joint tensors being gathered once """
+        idxs = torch.as_tensor(np.asarray(idxs), dtype=torch.long)
+        agent_number = self.agent_numbers[agent_id]
+        joint_states = self.joint_states[idxs]
+        joint_actions = self.joint_actions[idxs]
+        joint_next_states = self.joint_next_states[idxs]
+        if not self.continuous_actions:
+            joint_actions = joint_actions.long()
+
+        return ExperienceBatch(
+            states=self.agent_layout.agent_attributes(joint_states, agent_id, 'state'),
+            actions=self.agent_layout.agent_attributes(joint_actions, agent_id, 'action'),
+            rewards=self.rewards[idxs, agent_number].view(-1, 1),
+            dones=self.dones[idxs, agent_number].view(-1, 1),
+            next_states=self.agent_layout.agent_attributes(joint_next_states, agent_id, 'state'),
+            joint_states=joint_states,
+            joint_actions=joint_actions,
+            joint_next_states=joint_next_states,
+            agent_num=agent_number,
+        )
+
+    def agent_memory(self, agent_id: str) -> 'AgentMemory':
+        """ A uniformly sampled memory view for the agent """
+        return AgentMemory(self, agent_id)
+
+    def prioritized_agent_memory(self, agent_id: str, beta_scheduler: ParameterScheduler, alpha_scheduler: ParameterScheduler,
+                                 min_priority: float = 1e-3) -> 'PrioritizedAgentMemory':
+        """ A memory view for the agent, sampled according to the agent's own priorities """
+        return PrioritizedAgentMemory(self, agent_id, beta_scheduler, alpha_scheduler, min_priority)
+
+    def __len__(self):
+        return self.available_samples
+
+
+class AgentMemory:
+    """ Uniformly sampled view of a JointMemory for a single agent, with the interface of Memory """
+    def __init__(self, joint_memory: JointMemory, agent_id: str):
+        self.joint_memory = joint_memory
+        self.agent_id = agent_id
+        self.capacity = joint_memory.capacity
+
+    def update(self, *args):
+        pass
+
+    def step_episode(self, i_episode: int):
+        pass
+
+    def add(self, experience: Transition):
+        if experience is not None:
+            self.joint_memory.add(experience)
+
+    def sample(self, batch_size: int) -> ExperienceBatch:
+        idxs = random.sample(range(len(self.joint_memory)), k=batch_size)
+        return self.joint_memory.get_batch(self.agent_id, idxs).to(device)
+
+    def __len__(self):
+        return len(self.joint_memory)
+
+
+class PrioritizedAgentMemory(PrioritizedMemory):
+    """ View of a JointMemory for a single agent, sampled according to the agent's own priorities
+
+    Only the priority sum-tree is held per agent, the experience is stored in the joint memory
+    """
+    def __init__(self, joint_memory: JointMemory, agent_id: str, beta_scheduler: ParameterScheduler,
+                 alpha_scheduler: ParameterScheduler, min_priority: float = 1e-3):
+        self.joint_memory = joint_memory
+        self.agent_id = agent_id
+        super().__init__(
+            capacity=joint_memory.capacity,
+            state_shape=(1, joint_memory.agent_layout.sizes['state'][agent_id]),
+            beta_scheduler=beta_scheduler,
+            alpha_scheduler=alpha_scheduler,
+            min_priority=min_priority,
+            continuous_actions=joint_memory.continuous_actions,
+        )
+
+    def build_buffer(self):
+        return None
+
+    def add(self, experience: Transition, priority: float = 0):
+        if experience is not None:
+            idx = self.joint_memory.add(experience)
+            self.update(idx, priority)
+            self.available_samples = len(self.joint_memory)
+
+    def sample(self, num_samples: int, *args) -> ExperienceBatch:
+        sampled_idxs, is_weights = self.sample_indices(num_samples)
+        experience_batch = self.joint_memory.get_batch(self.agent_id, sampled_idxs)
+        experience_batch.sample_idxs = torch.LongTensor(sampled_idxs).view(num_samples, 1)
+        experience_batch.is_weights = torch.from_numpy(is_weights).view(num_samples, 1).float()
+        return experience_batch.to(device)
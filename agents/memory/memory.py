@@ -1,9 +1,8 @@
 import random
 from collections import deque, namedtuple
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import torch
-import numpy as np
-from tools.rl_constants import ExperienceBatch, Experience
+from tools.rl_constants import ExperienceBatch, Experience, Transition, TransitionBatch
 from tools.misc import set_seed
 from collections import Counter
 
@@ -30,7 +29,7 @@ class Memory:
     def step_episode(self, i_episode: int):
         pass
 
-    def add(self, experience: Experience):
+    def add(self, experience: Union[Experience, Transition]):
         """Add a new experience to memory."""
         if experience is not None:
             self.buffer.append(experience.cpu())
@@ -38,31 +37,7 @@ class Memory:
     def sample(self, batch_size: int):
         """Randomly sample a batch of experiences from memory."""
         experiences = random.sample(self.buffer, k=batch_size)
-        states = [e.state for e in experiences if e.state is not None]
-        actions = [e.action.value for e in experiences if e.action is not None]
-        rewards = [e.reward for e in experiences if e.reward is not None]
-        next_states = [e.next_state for e in experiences if e.next_state  is not None]
-        dones = [e.done for e in experiences if e.done is not None]
-        joint_states = [e.joint_state for e in experiences if e.joint_state is not None]
-        joint_actions = [e.joint_action for e in experiences if e.joint_action is not None]
-        joint_next_states = [e.joint_next_state for e in experiences if e.joint_next_state is not None]
-
-        states = None if len(states) == 0 else torch.from_numpy(np.concatenate(states)).float().to(device)
-        actions = None if len(actions) == 0 else torch.from_numpy(np.concatenate(actions)).float().to(device)
-
-        rewards = torch.from_numpy(np.concatenate(rewards)).float().to(device)
-        next_states = None if len(next_states) == 0 else torch.from_numpy(np.concatenate(next_states)).float().to(device)
-        dones = torch.from_numpy(np.concatenate(dones).astype(np.uint8)).float().to(device)
-
-        joint_states = None if len(joint_next_states) == 0 else torch.from_numpy(np.concatenate(joint_states)).float().to(device)
-        joint_actions = None if len(joint_next_states) == 0 else torch.from_numpy(np.concatenate(joint_actions)).float().to(device)
-        joint_next_states = None if len(joint_next_states) == 0 else torch.from_numpy(np.concatenate(joint_next_states)).float().to(device)
-
-        return ExperienceBatch(
-            states=states, actions=actions, rewards=rewards, next_states=next_states,
-            dones=dones, joint_states=joint_states, joint_actions=joint_actions,
-            joint_next_states=joint_next_states
-        )
+        return TransitionBatch.from_transitions(experiences).build(device)
 
     def __len__(self):
         """Return the current size of internal memory."""
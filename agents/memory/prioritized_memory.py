@@ -63,7 +63,7 @@ class PrioritizedMemory:
         self.available_samples = 0
 
         # Memory buffer and priority sum-tree
-        self.buffer = ReplayBuffer(state_shape, capacity)
+        self.buffer = self.build_buffer()
         self.sum_tree = SumTree([0 for _ in range(self.capacity)])
 
         self.beta_scheduler = beta_scheduler
@@ -79,6 +79,10 @@ class PrioritizedMemory:
         if seed:
             set_seed(seed)
 
+    def build_buffer(self):
+        """Create the buffer storing the experience tuples"""
+        return ReplayBuffer(self.state_shape, self.capacity)
+
     def step_episode(self, episode: int):
         """Update internal memory parameters at the end of an episode
 
@@ -132,8 +136,13 @@ class PrioritizedMemory:
         for i, idx in enumerate(indices):
             self.sum_tree.update_node(self.sum_tree.leaf_nodes[idx], float(priorities[i]))
 
-    def sample(self, num_samples: int, *args) -> ExperienceBatch:
-        """Sample a batch of experience from the memory buffer"""
+    def sample_indices(self, num_samples: int) -> tuple:
+        """Sample buffer indices proportionally to their priority
+
+        Returns:
+            sampled_idxs (List[int]): Size of num_samples
+            is_weights (np.ndarray): The importance sampling weights of the samples, shape (num_samples,)
+        """
         sampled_idxs = []
         is_weights = []
         sample_no = 0
@@ -148,6 +157,11 @@ class PrioritizedMemory:
         # apply the beta factor and normalize so that the maximum is_weight < 1
         is_weights = np.array(is_weights)
         is_weights = np.power(is_weights, - self.beta)
+        return sampled_idxs, is_weights
+
+    def sample(self, num_samples: int, *args) -> ExperienceBatch:
+        """Sample a batch of experience from the memory buffer"""
+        sampled_idxs, is_weights = self.sample_indices(num_samples)
         # now load up the state and next state variables according to sampled idxs
         states, next_states, actions, rewards, terminal, joint_states, joint_next_states,\
         joint_actions = [], [], [], [], [], [], [], []
@@ -1,3 +1,4 @@
+import copy
 import torch
 import torch.nn as nn
 from typing import Optional, Union, Tuple
@@ -5,8 +6,111 @@ from agents.models.components.misc import Flatten
 from agents.models.components import BaseComponent
 
 
+def fold_batchnorm(conv: Union[nn.Conv2d, nn.Conv3d], batchnorm: Union[nn.BatchNorm2d, nn.BatchNorm3d],
+                   memory_format: Optional[torch.memory_format] = None,
+                   out: Optional[Union[nn.Conv2d, nn.Conv3d]] = None) -> Union[nn.Conv2d, nn.Conv3d]:
+    """ Return a copy of conv with the eval-mode batchnorm folded into its weights and bias
+
+    conv followed by batchnorm computes gamma * (W * x + b - mean) / sqrt(var + eps) + beta, which is a single
+    convolution with weights W * scale and bias (b - mean) * scale + beta, for scale = gamma / sqrt(var + eps).
+    If out, a convolution previously returned by fold_batchnorm, is given, the folded weights are copied into it
+    in place instead
+    """
+    with torch.no_grad():
+        scale = torch.rsqrt(batchnorm.running_var + batchnorm.eps)
+        shift = -batchnorm.running_mean * scale
+        if batchnorm.affine:
+            scale = scale * batchnorm.weight
+            shift = shift * batchnorm.weight + batchnorm.bias
+        weight = conv.weight * scale.view(-1, *([1] * (conv.weight.dim() - 1)))
+        bias = shift if conv.bias is None else conv.bias * scale + shift
+        if out is not None:
+            out.weight.copy_(weight)
+            out.bias.copy_(bias)
+            return out
+
+        fused_conv = copy.deepcopy(conv)
+        fused_conv.weight.copy_(weight)
+        fused_conv.bias = nn.Parameter(bias.clone())
+        if memory_format is not None:
+            fused_conv.weight.data = fused_conv.weight.data.contiguous(memory_format=memory_format)
+    return fused_conv.requires_grad_(False)
+
+
+def conv_batchnorm_pairs(layers: nn.Sequential) -> list:
+    """ Group layers into (conv, batchnorm) pairs, for every batchnorm directly following a convolution, and
+    (module, None) for the other layers """
+    modules = list(layers)
+    pairs = []
+    i = 0
+    while i < len(modules):
+        module = modules[i]
+        next_module = modules[i + 1] if i + 1 < len(modules) else None
+        if isinstance(module, (nn.Conv2d, nn.Conv3d)) and isinstance(next_module, (nn.BatchNorm2d, nn.BatchNorm3d)):
+            pairs.append((module, next_module))
+            i += 2
+        else:
+            pairs.append((module, None))
+            i += 1
+    return pairs
+
+
+def fuse_conv_batchnorm(layers: nn.Sequential, memory_format: Optional[torch.memory_format] = None) -> nn.Sequential:
+    """ Return an inference copy of layers, folding every batchnorm that directly follows a convolution
+
+    Only the folded convolutions are copied; the other layers are shared with layers
+    """
+    return nn.Sequential(*[
+        module if batchnorm is None else fold_batchnorm(module, batchnorm, memory_format)
+        for module, batchnorm in conv_batchnorm_pairs(layers)
+    ])
+
+
+def refold_conv_batchnorm(layers: nn.Sequential, fused: nn.Sequential):
+    """ Refresh, in place, the folded convolutions of fused, returned by fuse_conv_batchnorm(layers) """
+    for (module, batchnorm), fused_module in zip(conv_batchnorm_pairs(layers), fused):
+        if batchnorm is not None:
+            fold_batchnorm(module, batchnorm, out=fused_module)
+
+
+def disable_batchnorm_fusion(model: nn.Module):
+    """ Run the CNNs of model through their batchnorms in eval mode too
+
+    For models such as target networks, which are only run in eval mode and updated at every learning step: the
+    folded convolutions would be refreshed before every forward pass, costing more than the batchnorms themselves
+    """
+    for module in model.modules():
+        if isinstance(module, CNN):
+            module.fuse_batchnorm_in_eval = False
+
+
+def conv_output_shape(input_shape: Tuple[int, ...], kernel_sizes: tuple, stride_sizes: tuple) -> Tuple[int, ...]:
+    """ Spatial output shape of a stack of unpadded convolutions
+
+    :param input_shape: Spatial input shape, eg. (depth, width, height) for 3D convolutions
+    :param kernel_sizes: Kernel size of each convolution, an int or a tuple with one entry per spatial dimension
+    :param stride_sizes: Stride of each convolution, an int or a tuple with one entry per spatial dimension
+    """
+    shape = tuple(input_shape)
+    for kernel_size, stride in zip(kernel_sizes, stride_sizes):
+        kernel_size = (kernel_size,) * len(shape) if isinstance(kernel_size, int) else tuple(kernel_size)
+        stride = (stride,) * len(shape) if isinstance(stride, int) else tuple(stride)
+        shape = tuple((size - k) // s + 1 for size, k, s in zip(shape, kernel_size, stride))
+        if min(shape) < 1:
+            raise ValueError("Input of shape {} is too small for kernels {} and strides {}".format(input_shape, kernel_sizes, stride_sizes))
+    return shape
+
+
 class CNN(BaseComponent):
-    """ Helper module for creating CNNs """
+    """ Helper module for creating CNNs
+
+    In eval mode, the forward pass runs through a copy of the featurizer in which the batchnorms are folded into
+    the preceding convolutions. The copy is built once, and its folded weights are refreshed in place on the next
+    eval forward pass after being marked stale: by any forward pass in train mode (which precedes every optimizer
+    step and updates the batchnorm statistics), by loading a state dict, or explicitly with
+    mark_fused_features_stale, eg. by soft_update. Weights modified in any other way must be followed by
+    mark_fused_features_stale
+    """
     def __init__(
             self,
             image_shape,
@@ -16,8 +120,16 @@ class CNN(BaseComponent):
             kernel_sizes: Union[Tuple[int, ...], Tuple[tuple, ...]] = ((1, 8, 8), (1, 4, 4), (4, 3, 3)),
             stride_sizes=((1, 4, 4), (1, 2, 2), (1, 1, 1)),
             output_layer: Optional[nn.Module] = None,
+            fuse_batchnorm_in_eval: bool = True,
+            channels_last: bool = False,
             **kwargs
     ):
+        """
+        :param fuse_batchnorm_in_eval: Whether to fold the batchnorms into the convolutions in eval mode
+        :param channels_last: Whether to run the convolutions in the channels-last memory format, which avoids the
+            layout conversions of the NHWC/NDHWC CPU and tensor core kernels. Inputs should be provided in this
+            format; see memory_format
+        """
         super().__init__()
         self.grayscale = grayscale
         self.kernel_sizes = kernel_sizes
@@ -26,6 +138,12 @@ class CNN(BaseComponent):
         self.num_stacked_frames = num_stacked_frames
         self.output_layer = output_layer
 
+        self.fuse_batchnorm_in_eval = fuse_batchnorm_in_eval
+        self.memory_format = self.get_memory_format(grayscale) if channels_last else None
+        # (device, fused featurizer); kept in a tuple so it is not registered as a submodule
+        self.fused_features = (None, None)
+        self.fused_features_stale = True
+
         self.activation = nn.ReLU()
         self.features = self.get_featurizer()
         self.output = None
@@ -37,7 +155,40 @@ class CNN(BaseComponent):
         else:
             state_shape = (1, 3, self.num_stacked_frames, image_shape[0], image_shape[1])
 
-        self.output_size = self.output_feature_size(state_shape)
+        # The output size is computed from the kernels and strides, and checked on the first forward pass
+        self.output_size = self.get_output_size(state_shape)
+        self.output_size_checked = False
+
+        if self.memory_format is not None:
+            for module in self.features:
+                if isinstance(module, (nn.Conv2d, nn.Conv3d)):
+                    module.weight.data = module.weight.data.contiguous(memory_format=self.memory_format)
+
+    @staticmethod
+    def get_memory_format(grayscale: bool) -> Optional[torch.memory_format]:
+        """ The channels-last memory format of the inputs, when supported by the installed torch version """
+        if grayscale:
+            return torch.channels_last
+        return getattr(torch, 'channels_last_3d', None)
+
+    def mark_fused_features_stale(self):
+        """ Refresh the folded weights of the fused featurizer before its next use """
+        self.fused_features_stale = True
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self.fused_features_stale = True
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def get_fused_features(self) -> nn.Sequential:
+        device_ = str(next(self.features.parameters()).device)
+        fused_device, fused_features = self.fused_features
+        if fused_features is None or fused_device != device_:
+            fused_features = fuse_conv_batchnorm(self.features, self.memory_format).eval()
+            self.fused_features = (device_, fused_features)
+        elif self.fused_features_stale:
+            refold_conv_batchnorm(self.features, fused_features)
+        self.fused_features_stale = False
+        return fused_features
 
     def set_output(self, output: nn.Module):
         self.output = output
@@ -75,13 +226,41 @@ class CNN(BaseComponent):
 
         return featurizer
 
+    def get_output_size(self, shape: tuple) -> int:
+        """ Flattened size of the featurizer output for inputs of the given shape """
+        if self.output_layer is not None:
+            if hasattr(self.output_layer, 'out_features'):
+                return self.output_layer.out_features
+            # The output size of an arbitrary output layer can only be found by running it
+            return self.output_feature_size(shape)
+        spatial_shape = conv_output_shape(shape[2:], self.kernel_sizes, self.stride_sizes)
+        output_size = self.filters[-1]
+        for size in spatial_shape:
+            output_size *= size
+        return output_size
+
     def output_feature_size(self, shape):
         x = torch.rand(shape)
         x = self.features(x)
         return x.data.view(1, -1).size(1)
 
     def forward(self, x: torch.Tensor):
-        x = self.features(x)
+        if self.memory_format is not None:
+            # A no-op for a single RGB stack from a RollingFrameBuffer in the channels-last format. The stacks of
+            # several environments, and grayscale stacks (whose narrowed frame dimension is the channel dimension),
+            # are not channels-last contiguous and are copied here
+            x = x.contiguous(memory_format=self.memory_format)
+        if self.training or not self.fuse_batchnorm_in_eval:
+            if self.training:
+                # The weights or batchnorm statistics are about to change
+                self.fused_features_stale = True
+            x = self.features(x)
+        else:
+            x = self.get_fused_features()(x)
+        if not self.output_size_checked:
+            if x.shape[1] != self.output_size:
+                raise ValueError("Expected features of size {}, found {}".format(self.output_size, x.shape[1]))
+            self.output_size_checked = True
         if self.output:
             x = self.output(x)
         return x
@@ -39,7 +39,7 @@ class Critic(BaseComponent):
         if self.action_featurizer:
             action = self.action_featurizer(action)
         x = torch.cat((state, action), dim=1)
-        return self.output_module(x)
+        return self.output_module(x).float()
 
 
 class MACritic(BaseComponent):
@@ -88,4 +88,4 @@ class MACritic(BaseComponent):
 
         action = action.view(bsize, -1)
         x = torch.cat((state, action), dim=1)
-        return self.output_module(x)
+        return self.output_module(x).float()
@@ -0,0 +1,92 @@
+import torch
+from typing import Optional, Sequence
+
+
+class RollingFrameBuffer:
+    """ Stack of the most recent frames of one or several environments, held in a preallocated tensor
+
+    Frames are stored in the layout expected by the convolutions, (num_envs, channels, frames, width, height) for
+    RGB frames or (num_envs, frames, width, height) for grayscale frames. Each frame slot is allocated twice,
+    and every frame is written at both its circular index i and i + num_stacked_frames, so that the last
+    num_stacked_frames frames, from oldest to newest, are always a single narrow() view of the storage. Appending a
+    frame is therefore one in-place write, without concatenating the stack.
+
+    When an environment has no frames yet, its first frame is repeated over the whole stack
+    """
+    def __init__(self, num_stacked_frames: int, grayscale: bool = False, memory_format: Optional[torch.memory_format] = None):
+        """
+        :param num_stacked_frames: The number of frames in the stack
+        :param grayscale: Whether the frames are grayscale (num_envs, width, height), rather than RGB frames of
+            shape (num_envs, width, height, channels)
+        :param memory_format: Optional memory format of the storage, eg. torch.channels_last_3d for RGB frames,
+            so that the frames are converted to the layout of the convolutions once, when they are appended
+        """
+        self.num_stacked_frames = num_stacked_frames
+        self.grayscale = grayscale
+        self.memory_format = memory_format
+        self.frame_dim = 1 if grayscale else 2
+        self.buffer: Optional[torch.Tensor] = None
+        self.empty: Optional[torch.Tensor] = None
+        self.write_idx = 0
+
+    def _allocate(self, frames: torch.Tensor):
+        num_envs = frames.shape[0]
+        if self.grayscale:
+            shape = (num_envs, 2 * self.num_stacked_frames) + tuple(frames.shape[1:])
+        else:
+            shape = (num_envs, frames.shape[-1], 2 * self.num_stacked_frames) + tuple(frames.shape[1:-1])
+        self.buffer = torch.zeros(shape, dtype=frames.dtype, device=frames.device)
+        if self.memory_format is not None:
+            self.buffer = self.buffer.contiguous(memory_format=self.memory_format)
+        self.empty = torch.ones(num_envs, dtype=torch.bool, device=frames.device)
+        self.write_idx = 0
+
+    def reset(self, env_indices: Optional[Sequence[int]] = None):
+        """ Clear the frames of the given environments, or of all environments """
+        if self.empty is None:
+            return
+        if env_indices is None:
+            self.empty.fill_(True)
+        else:
+            self.empty[torch.as_tensor(env_indices, dtype=torch.long, device=self.empty.device)] = True
+
+    def select(self, env_indices: Sequence[int]):
+        """ Keep the frames of the given environments only, in this order, eg. when environments leave the batch """
+        if self.buffer is None:
+            return
+        idxs = torch.as_tensor(env_indices, dtype=torch.long, device=self.buffer.device)
+        self.buffer = self.buffer[idxs]
+        if self.memory_format is not None:
+            self.buffer = self.buffer.contiguous(memory_format=self.memory_format)
+        self.empty = self.empty[idxs]
+
+    def append(self, frames: torch.Tensor):
+        """ Write the newest frame of each environment
+
+        :param frames: Shape (num_envs, width, height, channels), or (num_envs, width, height) for grayscale frames
+        """
+        if self.buffer is None or self.buffer.shape[0] != frames.shape[0]:
+            self._allocate(frames)
+        if not self.grayscale:
+            frames = frames.permute(0, 3, 1, 2)
+
+        if bool(self.empty.any()):
+            # Fill every slot of the new environments with their first frame
+            new_frames = frames[self.empty].unsqueeze(self.frame_dim)
+            self.buffer[self.empty] = new_frames.expand(-1, *self.buffer.shape[1:])
+            self.empty.fill_(False)
+
+        self.buffer.select(self.frame_dim, self.write_idx).copy_(frames)
+        self.buffer.select(self.frame_dim, self.write_idx + self.num_stacked_frames).copy_(frames)
+        self.write_idx = (self.write_idx + 1) % self.num_stacked_frames
+
+    def get(self) -> torch.Tensor:
+        """ View of the stacked frames, from oldest to newest, in the convolution layout
+
+        The view spans half of the doubled frame slots, so it is generally not contiguous: only the stack of a
+        single environment is, for grayscale frames in the default layout, or for RGB frames stored in the
+        channels_last_3d format. Consumers needing contiguous input (eg. CNN.forward) copy it
+        """
+        if self.buffer is None:
+            raise ValueError("No frames have been appended")
+        return self.buffer.narrow(self.frame_dim, self.write_idx, self.num_stacked_frames)
@@ -0,0 +1,113 @@
+import math
+import torch
+import torch.nn as nn
+from typing import Tuple, Optional, Callable, Iterable
+from agents.models.components import BaseComponent
+
+
+class GroupedLinear(nn.Module):
+    """ A group of independent linear layers evaluated with a single batched matmul
+
+    Weights are stored stacked with shape (num_groups, in_features, out_features), so G layers cost one
+    baddbmm kernel rather than G separate matmuls
+    """
+    def __init__(self, num_groups: int, in_features: int, out_features: int):
+        super().__init__()
+        self.num_groups = num_groups
+        self.in_features = in_features
+        self.out_features = out_features
+        self.weight = nn.Parameter(torch.empty(num_groups, in_features, out_features))
+        self.bias = nn.Parameter(torch.empty(num_groups, 1, out_features))
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        """ Initialize each group as torch.nn.Linear would """
+        bound = 1. / math.sqrt(self.in_features)
+        self.weight.data.uniform_(-bound, bound)
+        self.bias.data.uniform_(-bound, bound)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        :param x: Input of shape (num_groups, batch, in_features), or (batch, in_features) to feed the same
+            input to every group
+        :return: Output of shape (num_groups, batch, out_features)
+        """
+        if x.dim() == 2:
+            x = x.unsqueeze(0).expand(self.num_groups, -1, -1)
+        return torch.baddbmm(self.bias, x, self.weight)
+
+    def forward_group(self, x: torch.Tensor, group: int) -> torch.Tensor:
+        """ Evaluate a single group on input of shape (batch, in_features) """
+        return torch.addmm(self.bias[group], x, self.weight[group])
+
+    def extra_repr(self) -> str:
+        return 'num_groups={}, in_features={}, out_features={}'.format(self.num_groups, self.in_features, self.out_features)
+
+
+class GroupedMLP(BaseComponent):
+    """ A group of independent MLPs with identical architecture, evaluated together one layer at a time """
+    def __init__(
+            self,
+            num_groups: int,
+            layer_sizes: Tuple[int, ...],
+            activation_function: torch.nn.Module = nn.ReLU(True),
+            output_function: Optional[torch.nn.Module] = None,
+            seed: int = None,
+            output_layer_initialization_fn: Optional[Callable] = None,
+    ):
+        """
+        :param num_groups: Number of independent MLPs
+        :param layer_sizes: Size for each linear layer
+        :param activation_function: Activation between layers
+        :param output_function: Any output torch.nn.Module to be applied at the head
+        :param seed: Random seed
+        :param output_layer_initialization_fn: Returns the range to uniformly initialize the last layer within
+
+        Batchnorm and dropout are not supported, as their statistics would be shared across groups
+        """
+        super().__init__()
+        if len(layer_sizes) < 2:
+            raise ValueError("Must provide at least 2 layer sizes")
+        if seed:
+            self.set_seed(seed)
+        self.num_groups = num_groups
+
+        layers = []
+        for i, (n_in, n_out) in enumerate(zip(layer_sizes[:-1], layer_sizes[1:])):
+            if i > 0:
+                layers.append(activation_function)
+            layers.append(GroupedLinear(num_groups, n_in, n_out))
+
+        if output_layer_initialization_fn:
+            layers[-1].weight.data.uniform_(*output_layer_initialization_fn(layers[-1]))
+            layers[-1].bias.data.uniform_(*output_layer_initialization_fn(layers[-1]))
+
+        if output_function:
+            layers.append(output_function)
+
+        self.mlp_layers = nn.Sequential(*layers)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.mlp_layers(x)
+
+    def forward_group(self, x: torch.Tensor, group: int) -> torch.Tensor:
+        """ Evaluate a single MLP of the group on input of shape (batch, in_features) """
+        for layer in self.mlp_layers:
+            x = layer.forward_group(x, group) if isinstance(layer, GroupedLinear) else layer(x)
+        return x
+
+
+def clip_grad_norm_per_group_(parameters: Iterable[nn.Parameter], max_norm: float, num_groups: int) -> torch.Tensor:
+    """ Clip the gradient norm of each group separately, for parameters stacked along their first dimension
+
+    Equivalent to calling torch.nn.utils.clip_grad_norm_ on each group's parameters in turn
+    :return: The total gradient norm of each group
+    """
+    grads = [p.grad for p in parameters if p.grad is not None]
+    if len(grads) == 0:
+        return torch.zeros(num_groups)
+    group_norms = torch.stack([g.reshape(num_groups, -1).pow(2).sum(1) for g in grads]).sum(0).sqrt()
+    clip_coef = (max_norm / (group_norms + 1e-6)).clamp(max=1.0)
+    for g in grads:
+        g.mul_(clip_coef.view(-1, *([1] * (g.dim() - 1))))
+    return group_norms
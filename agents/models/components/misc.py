@@ -8,7 +8,8 @@ class Flatten(nn.Module):
         super().__init__()
 
     def forward(self, input):
-        return input.view(input.size(0), -1)
+        # reshape, as channels-last convolution outputs cannot be viewed
+        return input.reshape(input.size(0), -1)
 
 
 class SoftmaxSelection(nn.Module):
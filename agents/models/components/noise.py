@@ -1,15 +1,20 @@
 import numpy as np
-import random
-from copy import copy
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
 import torch
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
 
 class Noise:
-    def __init__(self):
-        pass
+    """ Base class for exploration noise processes
+
+    Noise for numpy arrays is drawn in a single vectorized call from a seeded np.random.Generator.
+    Noise for torch tensors is drawn directly on the device of the tensor, avoiding host/device copies
+    """
+    def __init__(self, seed: Optional[int] = None):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.torch_generators = {}
 
     def reset(self, *args):
         pass
@@ -17,49 +22,90 @@ class Noise:
     def sample(self, *args):
         raise NotImplementedError
 
+    def get_torch_generator(self, device_: torch.device) -> Optional[torch.Generator]:
+        """ Get a seeded torch generator for the device, or None to use the global generator """
+        if self.seed is None:
+            return None
+        key = str(device_)
+        if key not in self.torch_generators:
+            generator = torch.Generator(device=device_)
+            generator.manual_seed(self.seed)
+            self.torch_generators[key] = generator
+        return self.torch_generators[key]
+
+    def standard_normal_like(self, x: Union[np.ndarray, torch.Tensor]) -> Union[np.ndarray, torch.Tensor]:
+        """ Draw standard normal noise with the shape of x, on the device of x for tensors """
+        if isinstance(x, torch.Tensor):
+            dtype = x.dtype if x.is_floating_point() else torch.float32
+            return torch.randn(x.shape, dtype=dtype, device=x.device, generator=self.get_torch_generator(x.device))
+        x = np.asarray(x)
+        return self.rng.standard_normal(x.shape, dtype=np.float64 if x.dtype == np.float64 else np.float32)
 
-class OUNoise(Noise):
-    """Ornstein-Uhlenbeck process."""
 
-    def __init__(self, size: int, seed: int, mu: float = 0., theta: float = 0.15, sigma: float = 0.2, noise_clip: Tuple[int, int] = (-0.5, 0.5)):
-        """Initialize parameters and noise process."""
-        super().__init__()
-        self.mu = mu * np.ones(size)
+class OUNoise(Noise):
+    """Ornstein-Uhlenbeck process.
+
+    The process state has shape (num_agents, size), so a single noise process serves every agent
+    of a brain and is advanced with one vectorized draw of Gaussian increments per step
+    """
+
+    def __init__(self, size: int, seed: int, mu: float = 0., theta: float = 0.15, sigma: float = 0.2,
+                 noise_clip: Optional[Tuple[float, float]] = (-0.5, 0.5), num_agents: int = 1):
+        """Initialize parameters and noise process.
+
+        :param size: Dimension of the noise of each agent
+        :param seed: Random seed
+        :param mu: Long-running mean of the process
+        :param theta: Rate of mean reversion
+        :param sigma: Standard deviation of the Gaussian increments
+        :param noise_clip: Optional range the samples are clipped to. The process state itself is not clipped
+        :param num_agents: The number of agents sharing the process, each with its own row of the state
+        """
+        super().__init__(seed)
+        self.num_agents = num_agents
+        self.mu = mu * np.ones((num_agents, size))
         self.theta = theta
         self.sigma = sigma
-        self.seed = random.seed(seed)
         self.noise_clip = noise_clip
         self.state = None
         self.reset()
 
     def reset(self):
         """Reset the internal state (= noise) to mean (mu)."""
-        self.state = copy(self.mu)
-
-    def sample(self, *args):
-        """Update internal state and return it as a noise sample."""
-        x = self.state
-        dx = self.theta * (self.mu - x) + self.sigma * np.array([random.random() for _ in range(len(x))])
-        self.state = x + dx
-        return self.state
+        self.state = self.mu.copy()
+
+    def sample(self, x: Optional[Union[np.ndarray, torch.Tensor]] = None, *args):
+        """Update internal state and return it as a noise sample.
+
+        If x is a torch tensor, the sample is returned as a tensor on the device of x
+        """
+        dx = self.theta * (self.mu - self.state) + self.sigma * self.rng.standard_normal(self.state.shape)
+        self.state += dx
+        # A new array, so the samples never alias the process state
+        if self.noise_clip:
+            noise = np.clip(self.state, self.noise_clip[0], self.noise_clip[1])
+        else:
+            noise = self.state.copy()
+        if isinstance(x, torch.Tensor):
+            return torch.as_tensor(noise, dtype=x.dtype if x.is_floating_point() else torch.float32, device=x.device)
+        return noise
 
 
 class GaussianNoise(Noise):
-    def __init__(self, scale: float = 0.2, clip: Optional[Tuple[float, float]] = (-0.5, 0.5)):
-        super().__init__()
+    def __init__(self, scale: float = 0.2, clip: Optional[Tuple[float, float]] = (-0.5, 0.5), seed: Optional[int] = None):
+        super().__init__(seed)
         self.scale = scale
         self.clip = clip
 
-    def sample(self, x: torch.Tensor):
-        output_as_numpy = False
-        if isinstance(x, np.ndarray):
-            output_as_numpy = True
-            x = torch.from_numpy(x)
-        noise = torch.randn_like(x) * self.scale
+    def sample(self, x: Union[np.ndarray, torch.Tensor]):
+        """ Sample noise with the shape of x, for all agents at once """
+        noise = self.standard_normal_like(x)
+        noise *= self.scale
         if self.clip:
-            noise = noise.clamp(self.clip[0], self.clip[1])
-        if output_as_numpy:
-            noise = noise.numpy()
+            if isinstance(noise, torch.Tensor):
+                noise = noise.clamp_(self.clip[0], self.clip[1])
+            else:
+                noise = np.clip(noise, self.clip[0], self.clip[1], out=noise)
         return noise
 
 
@@ -70,17 +116,20 @@ class RandomProcess(object):
 
 class GaussianProcess(Noise, RandomProcess):
     def __init__(self, std_fn, clip: Optional[Tuple[float, float]] = (-0.5, 0.5), seed=None):
-        super().__init__()
-        if seed:
-            np.random.seed(seed)
+        super().__init__(seed)
         self.std_fn = std_fn
         self.clip = clip
 
-    def sample(self, x: torch.Tensor):
-        if isinstance(x, np.ndarray):
-            x = torch.from_numpy(x)
-        x = torch.randn_like(x) * self.std_fn()
+    def sample(self, x: Union[np.ndarray, torch.Tensor]):
+        """ Sample noise with the shape of x, scaled by the current value of std_fn
+
+        Numpy inputs produce numpy noise; tensor inputs produce noise on the device of the tensor
+        """
+        noise = self.standard_normal_like(x)
+        noise *= self.std_fn()
         if self.clip:
-            x = x.clamp(self.clip[0], self.clip[1])
-        x = x.cpu().numpy()
-        return x
\ No newline at end of file
+            if isinstance(noise, torch.Tensor):
+                noise = noise.clamp_(self.clip[0], self.clip[1])
+            else:
+                noise = np.clip(noise, self.clip[0], self.clip[1], out=noise)
+        return noise
@@ -1,9 +1,8 @@
 import math
 import torch
-from typing import Optional, Type
+from typing import Optional, List
 from torch import nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 from agents.models.components import BaseComponent
 
 
@@ -38,18 +37,17 @@ class NoisyMLP(BaseComponent):
             layers.append(output_function)
 
         self.model = nn.Sequential(*layers)
+        self.noisy_layers = NoisyLinearGroup(self.model)
 
     def forward(self, x):
         return self.model(x)
 
     def reset_noise(self):
-        for module in self.model.modules():
-            if hasattr(module, 'reset_noise'):
-                module.reset_noise()
+        self.noisy_layers.reset_noise()
 
 
 class NoisyLinear(nn.Module):
-    """Create a noisy linear layer
+    """Create a noisy linear layer with factorized gaussian noise
 
     Adapted from https://github.com/higgsfield/RL-Adventure/blob/master/5.noisy%20dqn.ipynb
     """
@@ -72,12 +70,9 @@ class NoisyLinear(nn.Module):
         self.reset_noise()
 
     def forward(self, x):
-        weight_epsilon = self.weight_epsilon.to(device)
-        bias_epsilon = self.bias_epsilon.to(device)
-
         if self.training:
-            weight = self.weight_mu + self.weight_sigma.mul(Variable(weight_epsilon))
-            bias = self.bias_mu + self.bias_sigma.mul(Variable(bias_epsilon))
+            weight = torch.addcmul(self.weight_mu, self.weight_sigma, self.weight_epsilon)
+            bias = torch.addcmul(self.bias_mu, self.bias_sigma, self.bias_epsilon)
         else:
             weight = self.weight_mu
             bias = self.bias_mu
@@ -93,14 +88,56 @@ class NoisyLinear(nn.Module):
         self.bias_mu.data.uniform_(-mu_range, mu_range)
         self.bias_sigma.data.fill_(self.std_init / math.sqrt(self.bias_sigma.size(0)))
 
+    def set_noise(self, epsilon_in: torch.Tensor, epsilon_out: torch.Tensor):
+        """ Write the factorized noise epsilon_out x epsilon_in into the existing epsilon buffers """
+        torch.mul(epsilon_out.unsqueeze(1), epsilon_in.unsqueeze(0), out=self.weight_epsilon)
+        self.bias_epsilon.copy_(epsilon_out)
+
     def reset_noise(self):
         epsilon_in = self._scale_noise(self.in_features)
         epsilon_out = self._scale_noise(self.out_features)
-
-        self.weight_epsilon.copy_(epsilon_out.ger(epsilon_in))
-        self.bias_epsilon.copy_(self._scale_noise(self.out_features))
+        self.set_noise(epsilon_in, epsilon_out)
 
     def _scale_noise(self, size):
-        x = torch.randn(size)
+        x = torch.randn(size, device=self.weight_epsilon.device)
         x = x.sign().mul(x.abs().sqrt())
         return x
+
+
+class NoisyLinearGroup:
+    """ Resample the noise of all NoisyLinear layers in a module together
+
+    The factorized noise for every layer is drawn with a single RNG call into one flat buffer, which is
+    scaled in place and written into the existing epsilon buffers of each layer, so resampling does not
+    allocate new tensors
+    """
+    def __init__(self, module: nn.Module):
+        self.layers: List[NoisyLinear] = [m for m in module.modules() if isinstance(m, NoisyLinear)]
+        self.size = sum(layer.in_features + layer.out_features for layer in self.layers)
+        self.noise = None
+        self.noise_magnitude = None
+
+    def _ensure_buffers(self):
+        device_ = self.layers[0].weight_epsilon.device
+        if self.noise is None or self.noise.device != device_:
+            self.noise = torch.empty(self.size, device=device_)
+            self.noise_magnitude = torch.empty(self.size, device=device_)
+
+    def reset_noise(self):
+        if not self.layers:
+            return
+        self._ensure_buffers()
+
+        # f(x) = sign(x) * sqrt(|x|), computed in place
+        self.noise.normal_()
+        torch.abs(self.noise, out=self.noise_magnitude)
+        self.noise_magnitude.sqrt_()
+        self.noise.sign_().mul_(self.noise_magnitude)
+
+        offset = 0
+        for layer in self.layers:
+            epsilon_in = self.noise[offset: offset + layer.in_features]
+            offset += layer.in_features
+            epsilon_out = self.noise[offset: offset + layer.out_features]
+            offset += layer.out_features
+            layer.set_noise(epsilon_in, epsilon_out)
@@ -1,10 +1,10 @@
 import torch
 from torch import nn
-from collections import deque
-from typing import Optional
+from typing import Optional, Sequence
 from agents.models.base import BaseModel
 from agents.models.components.mlp import MLP
-from agents.models.components.noisy_mlp import NoisyMLP
+from agents.models.components.noisy_mlp import NoisyMLP, NoisyLinearGroup
+from agents.models.components.frame_buffer import RollingFrameBuffer
 import torch.nn.functional as F
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -40,6 +40,7 @@ class DQN(BaseModel):
             output_hidden_dropout: Optional[float] = None,
             dueling_output: bool = True,
             noisy_output: bool = True,
+            noise_resample_frequency: int = 1,
             # Only used when categorical_output=True
             categorical_output: bool = True,
             categorical_num_atoms: int = 51,
@@ -61,6 +62,7 @@ class DQN(BaseModel):
             output_hidden_dropout: Optional[float] = None: Dropout between layers of the hidden layers
             dueling_output: bool = True: Flag dueling DQN
             noisy_output: bool = True: Flag noisy DQN
+            noise_resample_frequency: int = 1: Resample the noisy layer noise every k learning steps
             categorical_output: bool = True, Flag categorical DQN
             categorical_num_atoms: int = 51 : Generate distributions of Q(s, a) of shape (batch_size, -1)
             categorical_v_min: int = -10: Minimum support in categorical DQN
@@ -88,6 +90,8 @@ class DQN(BaseModel):
 
         # noisy_output DQN
         self.noisy_output = noisy_output
+        self.noise_resample_frequency = noise_resample_frequency
+        self.learning_steps = 0
 
         # categorical_output DQN
         self.categorical_output = categorical_output
@@ -96,21 +100,34 @@ class DQN(BaseModel):
         self.categorical_num_atoms = categorical_num_atoms
         self.categorical_support = torch.linspace(self.categorical_v_min, self.categorical_v_max, self.categorical_num_atoms).to(device)
 
-        # State buffer
-        self.state_buffer = deque(maxlen=self.num_stacked_frames)
+        # Frames stacked when acting
+        self.state_buffer = RollingFrameBuffer(
+            self.num_stacked_frames, grayscale=self.grayscale, memory_format=getattr(featurizer, 'memory_format', None)
+        )
 
         # Child modules for obtaining features and output
         self.features = featurizer
         self.output = self.get_output()
+        self.noisy_layers = NoisyLinearGroup(self.output)
 
     def step(self):
         """Perform actions after each learning step"""
         if self.noisy_output:
-            self.output.reset_noise()
+            self.learning_steps += 1
+            if self.learning_steps % self.noise_resample_frequency == 0:
+                self.noisy_layers.reset_noise()
 
     def step_episode(self, episode: int):
         """Perform actions after each episode"""
-        self.state_buffer.clear()
+        self.state_buffer.reset()
+
+    def reset_envs(self, env_indices: Optional[Sequence[int]] = None):
+        """Clear the stacked frames of the given rows of the acting batch, or of all rows"""
+        self.state_buffer.reset(env_indices)
+
+    def select_envs(self, env_indices: Sequence[int]):
+        """Keep the stacked frames of the given rows of the acting batch only, in this order"""
+        self.state_buffer.select(env_indices)
 
     def get_output(self):
         """ Get the output layer for the forward pass for the flavours of DQN
@@ -217,7 +234,8 @@ class DQN(BaseModel):
             state = self.prepare_for_forward(state, act)
             features = self.features(state)
 
-            q = self.output(features)
+            # Q-values are returned in fp32 as they feed the loss and the replay priorities
+            q = self.output(features).float()
             return q
 
     def dist(self, x: torch.Tensor, act=False) -> torch.Tensor:
@@ -227,7 +245,8 @@ class DQN(BaseModel):
         x = self.prepare_for_forward(x, act=act)
         feature = self.features(x)  # (batch, -1)
         q_atoms = self.output(feature)  # (batch, )
-        dist = F.softmax(q_atoms, dim=-1)
+        # The distribution is kept in fp32 under autocast, for the categorical projection and its log
+        dist = F.softmax(q_atoms.float(), dim=-1)
         dist = dist.clamp(min=1e-3)  # for avoiding nans
         return dist
 
@@ -254,6 +273,7 @@ class VisualDQN(DQN):
             output_hidden_dropout: Optional[float] = None,
             dueling_output: bool = True,
             noisy_output: bool = True,
+            noise_resample_frequency: int = 1,
             categorical_output: bool = True,
             categorical_num_atoms: int = 51,
             categorical_v_min: int = -10,
@@ -271,6 +291,7 @@ class VisualDQN(DQN):
             output_hidden_layer_size=output_hidden_layer_size,
             output_hidden_dropout=output_hidden_dropout,
             noisy_output=noisy_output,
+            noise_resample_frequency=noise_resample_frequency,
             categorical_output=categorical_output,
             categorical_num_atoms=categorical_num_atoms,
             categorical_v_min=categorical_v_min,
@@ -280,18 +301,13 @@ class VisualDQN(DQN):
     def prepare_for_forward(self, state: torch.FloatTensor, act: bool = False):
         """Build a network that maps state -> action values.
 
-        act: Whether to expect a single sample (i.e. not a training batch) and to supplement
-        frames from the state buffer
+        act: Whether to expect the current frame of each environment (i.e. not a training batch) and to
+        supplement frames from the state buffer
         """
         if act:
+            # The buffer already holds the frames stacked in the convolution layout
             self.state_buffer.append(state)
-            # Ensure the state buffer has at least num_stacked_frames states
-            while len(self.state_buffer) < self.num_stacked_frames:
-                self.state_buffer.appendleft(self.state_buffer[0])
-            # Stack over the frames dimension
-            state = torch.cat(list(self.state_buffer), dim=0)
-            # Add the batch dimension
-            state = state.unsqueeze(0)
+            return self.state_buffer.get()
 
         if not self.grayscale:
             # Reshape as batch x channels x depth x width x height for pytorch CNN
@@ -9,10 +9,22 @@ device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
 
 class PPO_Actor_Critic(nn.Module):
-    def __init__(self, actor_model, critic_model, action_size, continuous_actions: bool, initial_std=0.2, continuous_action_range_clip: Optional[tuple] = (-1, 1), seed=None):
+    def __init__(self, actor_model, critic_model, action_size, continuous_actions: bool, initial_std=0.2, continuous_action_range_clip: Optional[tuple] = (-1, 1), seed=None, shared_trunk: Optional[nn.Module] = None):
+        """
+        :param actor_model: Model producing the action means (continuous) or action probabilities (discrete)
+        :param critic_model: Model producing the state value
+        :param action_size: The action size of the agent
+        :param continuous_actions: Whether the action space is continuous or discrete
+        :param initial_std: Initial std of the normal distribution for continuous actions
+        :param continuous_action_range_clip: The range to clip continuous actions to
+        :param seed: Random seed
+        :param shared_trunk: Optional feature extractor shared by the actor and critic. When provided, the state is
+            passed through the trunk once and actor_model/critic_model act as heads on the trunk features
+        """
         super(PPO_Actor_Critic, self).__init__()
         if seed is not None:
             set_seed(seed)
+        self.shared_trunk = shared_trunk
         self.actor = actor_model
         self.critic = critic_model
         self.action_size = action_size
@@ -23,15 +35,27 @@ class PPO_Actor_Critic(nn.Module):
     def step_episode(self):
         pass
 
-    def forward(self, state, action=None, scale=1, min_std=0.05, *args, **kargs):
-        assert min_std >= 0 and scale >= 0
+    def get_features(self, state: torch.Tensor) -> torch.Tensor:
+        """ Features consumed by the actor and critic heads, the state itself when there is no shared trunk """
+        if self.shared_trunk is None:
+            return state
+        return self.shared_trunk(state)
+
+    def get_distribution(self, actor_output: torch.Tensor, min_std: float, scale: float) -> torch.distributions.Distribution:
+        """ Build the action distribution from the actor output
+
+        Distributions are built in fp32 under autocast, keeping the log-probabilities precise
+        """
         if self.continuous_actions:
-            action_mean = self.actor(state)
             std = F.hardtanh(self.std, min_val=min_std, max_val=scale)
-            dist = torch.distributions.Normal(action_mean, std)
-        else:
-            action_probs = self.actor(state)
-            dist = torch.distributions.Categorical(probs=action_probs)
+            return torch.distributions.Normal(actor_output.float(), std)
+        return torch.distributions.Categorical(probs=actor_output.float())
+
+    def forward(self, state, action=None, scale=1, min_std=0.05, *args, **kargs):
+        assert min_std >= 0 and scale >= 0
+        # Single traversal of the shared trunk for both the policy and the value
+        features = self.get_features(state)
+        dist = self.get_distribution(self.actor(features), min_std, scale)
 
         if action is None:
             action = dist.sample()
@@ -39,56 +63,49 @@ class PPO_Actor_Critic(nn.Module):
         log_probs = torch.sum(dist.log_prob(action), dim=1, keepdim=True)
         dist_entropy = dist.entropy().mean()
 
-        critic_value = self.critic(state)
-        # critic_value = self.critic(state, action)
+        critic_value = self.critic(features).float()
         if self.continuous_actions and self.continuous_action_range_clip:
             action = action.clamp(self.continuous_action_range_clip[0], self.continuous_action_range_clip[1])
         return action, log_probs, dist_entropy, critic_value
 
 
-class MAPPO_Actor_Critic(nn.Module):
-    def __init__(self, actor_model, critic_model, action_size, continuous_actions: bool, initial_std=0.2, continuous_action_range_clip: Optional[tuple] = (-1, 1), seed=None):
-        super(MAPPO_Actor_Critic, self).__init__()
-        if seed is not None:
-            set_seed(seed)
-        self.actor = actor_model
-        self.critic = critic_model
-        self.action_size = action_size
-        self.continuous_actions = continuous_actions
-        self.std = nn.Parameter(torch.ones(1, action_size) * initial_std)
-        self.continuous_action_range_clip = continuous_action_range_clip
+class MAPPO_Actor_Critic(PPO_Actor_Critic):
+    """ Multi-agent actor-critic, the critic additionally conditions on the other agents' states and actions
 
-    def step_episode(self):
-        pass
+    When the other agents' actions are not provided they are sampled from this agent's actor. The agent's state
+    and the other agents' states are then stacked and passed through the trunk and actor in a single forward pass,
+    and the actor outputs are reused for both this agent's and the other agents' distributions.
+    With a shared trunk, the critic receives the trunk features of all agents in place of their raw states
+    """
 
     def forward(self, agent_state: torch.FloatTensor, other_agent_states: torch.FloatTensor,
                 other_agent_actions: Optional[torch.FloatTensor] = None, action: Optional[torch.FloatTensor] = None,  min_std=0.05, scale=1,):
         assert min_std > 0 and scale >= 0, (min_std, scale)
+        bsize = agent_state.shape[0]
+        sample_other_actions = other_agent_actions is None
 
-        if self.continuous_actions:
-            action_mean = self.actor(agent_state)
-            std = F.hardtanh(self.std, min_val=min_std, max_val=scale)
-            dist = torch.distributions.Normal(action_mean, std)
+        if sample_other_actions or self.shared_trunk is not None:
+            other_agent_states = other_agent_states.reshape(-1, agent_state.shape[-1])
+            features = self.get_features(torch.cat((agent_state, other_agent_states), dim=0))
         else:
-            action_probs = self.actor(agent_state)
-            dist = torch.distributions.Categorical(probs=action_probs)
+            features = agent_state
+
+        actor_output = self.actor(features if sample_other_actions else features[:bsize])
+        dist = self.get_distribution(actor_output[:bsize], min_std, scale)
 
         if action is None:
             action = dist.sample().to(device)
 
         if action.ndim > 1:
             action = action.squeeze().to(device)
-        if other_agent_actions is None:
-            if self.continuous_actions:
-                other_agent_action_mean = self.actor(agent_state)
-                std = F.hardtanh(self.std, min_val=min_std, max_val=scale)
-                other_agent_dist = torch.distributions.Normal(other_agent_action_mean, std)
-            else:
-                other_action_probs = self.actor(other_agent_states)
-                other_agent_dist = torch.distributions.Categorical(probs=other_action_probs)
+        if sample_other_actions:
+            other_agent_dist = self.get_distribution(actor_output[bsize:], min_std, scale)
             other_agent_actions = other_agent_dist.sample().to(device)
 
-        critic_value = self.critic(agent_state, other_agent_states, other_agent_actions, action)
+        if self.shared_trunk is not None:
+            agent_state, other_agent_states = features[:bsize], features[bsize:]
+
+        critic_value = self.critic(agent_state, other_agent_states, other_agent_actions, action).float()
 
         log_probs = dist.log_prob(action)
 
@@ -0,0 +1,51 @@
+import numpy as np
+from typing import Optional
+
+
+class SparseLinearQFunction:
+    """ Linear action-value function over sparse binary features, in NumPy
+
+    Each state activates a fixed number of features (eg. one tile per tiling), so Q(s, a) is the sum of the weights of
+    the active features for action a. Values and updates only touch the active features, in a single vectorized
+    operation over a batch
+    """
+    def __init__(self, num_features: int, action_size: int, step_size: float = 0.1, initial_value: float = 0.):
+        """
+        :param num_features: Total number of features
+        :param action_size: Number of possible integer actions
+        :param step_size: Step size of the updates, divided among the active features of a state
+        :param initial_value: Initial value of Q(s, a) for all states and actions
+        """
+        self.num_features = num_features
+        self.action_size = action_size
+        self.step_size = step_size
+        self.initial_value = initial_value
+        self.weights: Optional[np.ndarray] = None
+
+    def _initialize(self, num_active_features: int):
+        self.weights = np.full((self.num_features, self.action_size), self.initial_value / num_active_features)
+
+    def values(self, features: np.ndarray) -> np.ndarray:
+        """
+        Action values of a batch of states
+        :param features: Active features of each state, of shape (batch_size, num_active_features)
+        :return: Q(s, a) of shape (batch_size, action_size)
+        """
+        if self.weights is None:
+            self._initialize(features.shape[1])
+        return self.weights[features].sum(axis=1)
+
+    def update(self, features: np.ndarray, actions: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """
+        Move Q(s, a) towards the targets by a semi-gradient step
+        :param features: Active features of each state, of shape (batch_size, num_active_features)
+        :param actions: Actions of shape (batch_size,)
+        :param targets: Targets of shape (batch_size,)
+        :return: The TD errors, of shape (batch_size,)
+        """
+        q = self.values(features)[np.arange(len(actions)), actions]
+        td_errors = targets - q
+        increments = (self.step_size / features.shape[1]) * td_errors
+        # Unbuffered, so that states of the batch sharing a feature all contribute to its update
+        np.add.at(self.weights, (features, actions[:, np.newaxis]), increments[:, np.newaxis])
+        return td_errors
@@ -0,0 +1,70 @@
+import numpy as np
+from typing import Optional
+
+
+class TabularQFunction:
+    """ Q-table over integer state ids (eg. from SpaceDiscretizer.get_state_ids), in NumPy
+
+    Q-learning and SARSA updates are applied to a batch of transitions in a single vectorized operation. Transitions
+    of the batch sharing a (state, action) pair all contribute to its update
+    """
+    def __init__(self, num_states: int, action_size: int, step_size: float = 0.1, gamma: float = 0.99,
+                 initial_value: float = 0., seed: Optional[int] = None):
+        """
+        :param num_states: Number of states
+        :param action_size: Number of possible integer actions
+        :param step_size: Step size of the TD updates
+        :param gamma: Discount factor
+        :param initial_value: Initial value of Q(s, a) for all states and actions
+        :param seed: Seed of the epsilon-greedy action selection
+        """
+        self.num_states = num_states
+        self.action_size = action_size
+        self.step_size = step_size
+        self.gamma = gamma
+        self.q_table = np.full((num_states, action_size), initial_value, dtype=np.float64)
+        self.random_state = np.random.RandomState(seed)
+
+    def values(self, state_ids: np.ndarray) -> np.ndarray:
+        """ Q(s, a) of shape (batch_size, action_size) """
+        return self.q_table[state_ids]
+
+    def get_actions(self, state_ids: np.ndarray, epsilon: float = 0.) -> np.ndarray:
+        """ Epsilon-greedy actions of a batch of states, of shape (batch_size,) """
+        actions = self.q_table[state_ids].argmax(axis=1)
+        if epsilon > 0:
+            explore = self.random_state.random_sample(len(actions)) < epsilon
+            actions[explore] = self.random_state.randint(0, self.action_size, int(explore.sum()))
+        return actions
+
+    def td_update(self, state_ids: np.ndarray, actions: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        """ Move Q(s, a) towards the targets, returning the TD errors """
+        td_errors = targets - self.q_table[state_ids, actions]
+        np.add.at(self.q_table, (state_ids, actions), self.step_size * td_errors)
+        return td_errors
+
+    def q_learning_update(self, state_ids: np.ndarray, actions: np.ndarray, rewards: np.ndarray,
+                          next_state_ids: np.ndarray, dones: np.ndarray) -> np.ndarray:
+        """ Off-policy update towards r + gamma * max_a' Q(s', a') """
+        next_values = self.q_table[next_state_ids].max(axis=1)
+        targets = rewards + self.gamma * (1 - dones) * next_values
+        return self.td_update(state_ids, actions, targets)
+
+    def sarsa_update(self, state_ids: np.ndarray, actions: np.ndarray, rewards: np.ndarray,
+                     next_state_ids: np.ndarray, next_actions: np.ndarray, dones: np.ndarray) -> np.ndarray:
+        """ On-policy update towards r + gamma * Q(s', a'), for the next actions a' taken """
+        next_values = self.q_table[next_state_ids, next_actions]
+        targets = rewards + self.gamma * (1 - dones) * next_values
+        return self.td_update(state_ids, actions, targets)
+
+    def expected_sarsa_update(self, state_ids: np.ndarray, actions: np.ndarray, rewards: np.ndarray,
+                              next_state_ids: np.ndarray, dones: np.ndarray, epsilon: float) -> np.ndarray:
+        """ Update towards r + gamma * E[Q(s', a')], under the epsilon-greedy policy """
+        next_q = self.q_table[next_state_ids]
+        next_values = (1 - epsilon) * next_q.max(axis=1) + epsilon * next_q.mean(axis=1)
+        targets = rewards + self.gamma * (1 - dones) * next_values
+        return self.td_update(state_ids, actions, targets)
+
+    def get_policy(self) -> np.ndarray:
+        """ Greedy action of every state, of shape (num_states,) """
+        return self.q_table.argmax(axis=1)
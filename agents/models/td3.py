@@ -1,7 +1,10 @@
 import torch
 import torch.nn as nn
-from typing import Callable
+from typing import Callable, Tuple, Optional
+from agents.models.components import BaseComponent
 from agents.models.components.critics import Critic
+from agents.models.components.grouped import GroupedMLP
+from tools.misc import ensure_batch
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -44,3 +47,85 @@ class MATD3Critic(nn.Module):
     def qa(self, state, other_agent_states, other_agent_actions, action):
         """ Forward pass through only one stream"""
         return self.q_network_a(state, other_agent_states, other_agent_actions, action)
+
+
+class EnsembleCritic(BaseComponent):
+    """ Ensemble of Q-networks held as stacked weights, evaluating all heads with one batched matmul per layer
+
+    The (state, action) input is concatenated once and shared by every head. Calling the critic returns one
+    Q-value tensor per head, so a 2 head ensemble is a drop-in replacement for TD3Critic. Larger ensembles
+    (eg. REDQ) can use q_values() to obtain all heads stacked
+    """
+    def __init__(
+            self,
+            state_size: int,
+            action_size: int,
+            hidden_layer_sizes: Tuple[int, ...] = (400, 300),
+            num_heads: int = 2,
+            activation_function: nn.Module = nn.ReLU(True),
+            output_layer_initialization_fn: Optional[Callable] = None,
+            seed: int = 123
+    ):
+        """
+        :param state_size: Dimension of the state
+        :param action_size: Dimension of the action
+        :param hidden_layer_sizes: Hidden layer sizes of each head
+        :param num_heads: Number of Q-networks in the ensemble
+        :param activation_function: Activation between layers
+        :param output_layer_initialization_fn: Returns the range to uniformly initialize the output layer within
+        :param seed: Random seed
+        """
+        super().__init__()
+        self.num_heads = num_heads
+        self.q_networks = GroupedMLP(
+            num_groups=num_heads,
+            layer_sizes=(state_size + action_size,) + tuple(hidden_layer_sizes) + (1,),
+            activation_function=activation_function,
+            output_layer_initialization_fn=output_layer_initialization_fn,
+            seed=seed,
+        )
+
+    @staticmethod
+    def get_input(state, action):
+        return torch.cat((state, action.float()), dim=1)
+
+    def q_values(self, state, action) -> torch.Tensor:
+        """ Q-values of all heads, with shape (num_heads, batch, 1), in fp32 even under autocast """
+        return self.q_networks(self.get_input(state, action)).float()
+
+    def forward(self, state, action):
+        return tuple(self.q_values(state, action).unbind(0))
+
+    def qa(self, state, action):
+        """ Forward pass through only one stream"""
+        return self.q_networks.forward_group(self.get_input(state, action), 0).float()
+
+
+class MAEnsembleCritic(EnsembleCritic):
+    """ Multi agent ensemble critic, conditioning on the other agents' states and actions
+
+    A 2 head ensemble is a drop-in replacement for MATD3Critic
+    """
+    @staticmethod
+    def get_input(agent_state, other_agent_states, other_agent_actions, action):
+        agent_state, other_agent_states, action, other_agent_actions = ensure_batch(
+            agent_state, other_agent_states, action, other_agent_actions
+        )
+        bsize = len(agent_state)
+        return torch.cat((
+            agent_state,
+            other_agent_states.reshape(bsize, -1),
+            other_agent_actions.reshape(bsize, -1).float(),
+            action.reshape(bsize, -1).float()
+        ), dim=1)
+
+    def q_values(self, state, other_agent_states, other_agent_actions, action) -> torch.Tensor:
+        """ Q-values of all heads, with shape (num_heads, batch, 1), in fp32 even under autocast """
+        return self.q_networks(self.get_input(state, other_agent_states, other_agent_actions, action)).float()
+
+    def forward(self, state, other_agent_states, other_agent_actions, action):
+        return tuple(self.q_values(state, other_agent_states, other_agent_actions, action).unbind(0))
+
+    def qa(self, state, other_agent_states, other_agent_actions, action):
+        """ Forward pass through only one stream"""
+        return self.q_networks.forward_group(self.get_input(state, other_agent_states, other_agent_actions, action), 0).float()
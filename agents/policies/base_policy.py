@@ -37,6 +37,14 @@ class Policy:
     def get_random_action(self, *args) -> Action:
         pass
 
+    @staticmethod
+    def get_deterministic_policy_table(state_action_values: np.ndarray) -> np.ndarray:
+        """ Greedy action of every state of a Q-table of shape (num_states, action_size)
+
+        Vectorized counterpart of get_deterministic_policy, for states indexed by integer ids
+        """
+        return np.asarray(state_action_values).argmax(axis=1)
+
     def compute_errors(self, online_model, target_model, experience_batch: ExperienceBatch, gamma: float = 0.99) -> tuple:
         q = online_model(experience_batch.states)
         q_next = online_model(experience_batch.next_states)
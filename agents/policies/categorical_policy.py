@@ -2,6 +2,7 @@ import numpy as np
 import torch
 from agents.policies.base_policy import Policy
 from tools.rl_constants import ExperienceBatch, Action
+from tools.mixed_precision import full_precision
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -19,6 +20,7 @@ class CategoricalDQNPolicy(Policy):
 
         self.support = torch.linspace(self.v_min, self.v_max, self.num_atoms).to(device)
         self.delta_z = float(self.v_max - self.v_min) / (self.num_atoms - 1)
+        self.projection_buffers = {}
 
         if seed:
             self.set_seed(seed)
@@ -27,7 +29,7 @@ class CategoricalDQNPolicy(Policy):
         """ Implement this function for speed"""
         model.eval()
         with torch.no_grad():
-            selected_action = model(state, act=True).argmax()
+            selected_action = model(state, act=True).argmax(1)
             action = selected_action.detach().cpu().numpy()
         model.train()
 
@@ -36,25 +38,55 @@ class CategoricalDQNPolicy(Policy):
 
     def projection_distribution(self, target_model: torch.nn.Module, next_state: torch.Tensor, rewards: torch.Tensor,
                                 dones: torch.Tensor, gamma: float):
+        """ Target distribution of the Bellman update, projected onto the support
+
+        The result is a view of a buffer reused by project across calls with the same batch size: callers must
+        consume it (as compute_errors does) before the next call, or clone it
+        """
         with torch.no_grad():
             batch_size = next_state.size(0)
             next_action = target_model(next_state).argmax(1)
             next_dist = target_model.dist(next_state)
-            next_dist = next_dist[range(batch_size), next_action]
+            next_dist = next_dist[range(batch_size), next_action].float()
+
+        # The projection is always computed in fp32, even when training under autocast
+        with torch.no_grad(), full_precision():
+            return self.project(next_dist, rewards, dones, gamma)
+
+    def _get_projection_buffers(self, batch_size: int, device_: torch.device) -> tuple:
+        """ Atom offsets of each batch row, and the flat output buffer, cached per batch size and device """
+        key = (batch_size, str(device_))
+        if key not in self.projection_buffers:
+            offset = (torch.arange(batch_size, device=device_) * self.num_atoms).unsqueeze(1)
+            proj_dist = torch.zeros(batch_size * self.num_atoms, device=device_)
+            self.projection_buffers[key] = (offset, proj_dist)
+        return self.projection_buffers[key]
+
+    def project(self, next_dist: torch.Tensor, rewards: torch.Tensor, dones: torch.Tensor, gamma: float) -> torch.Tensor:
+        """ Project the distribution of the Bellman target onto the support
+
+        The lower and upper neighbouring atoms receive their share of the mass in a single index_add_. The output
+        is a view of a buffer reused across calls with the same batch size, so it is only valid until the next call
 
-            Tz = rewards + (1 - dones) * gamma * self.support
-            Tz = Tz.clamp(min=self.v_min, max=self.v_max)
-            b = (Tz - self.v_min) / self.delta_z
-            l = b.floor().long()
-            u = b.ceil().long()
+        :param next_dist: Distribution of the next state-action values, shape (batch_size, num_atoms)
+        :param rewards: Shape (batch_size, 1)
+        :param dones: Shape (batch_size, 1)
+        :param gamma: Discount factor
+        :return: Projected distribution of shape (batch_size, num_atoms)
+        """
+        batch_size = next_dist.size(0)
+        offset, proj_dist = self._get_projection_buffers(batch_size, next_dist.device)
 
-            offset = torch.linspace(0, (batch_size - 1) * self.num_atoms, batch_size).long() \
-                .unsqueeze(1).expand(batch_size, self.num_atoms).to(device)
+        support = self.support.to(next_dist.device)
+        Tz = (rewards + (1 - dones) * gamma * support).clamp(min=self.v_min, max=self.v_max)
+        b = (Tz - self.v_min) / self.delta_z
+        l = b.floor()
+        u = b.ceil()
 
-            proj_dist = torch.zeros(next_dist.size()).to(device)
-            proj_dist.view(-1).index_add_(0, (l + offset).view(-1), (next_dist * (u.float() - b)).view(-1))
-            proj_dist.view(-1).index_add_(0, (u + offset).view(-1), (next_dist * (b - l.float())).view(-1))
-            return proj_dist
+        indices = (torch.cat((l, u), dim=1).long() + offset).view(-1)
+        mass = torch.cat((next_dist * (u - b), next_dist * (b - l)), dim=1).view(-1)
+        proj_dist.zero_().index_add_(0, indices, mass)
+        return proj_dist.view(batch_size, self.num_atoms)
 
     def compute_errors(self, online_model, target_model, experience_batch: ExperienceBatch, gamma: float = 0.99) -> tuple:
         batch_size = experience_batch.states.shape[0]
@@ -44,7 +44,8 @@ class EpsilonGreedySoftmaxPolicy(Policy):
             action_values_ = _get_action_values()
             action = action_values_.max(1)[1].data[0]
 
-        return Action(value=action)
+        # One row per state, like the other policies
+        return Action(value=np.array([int(action)], dtype=np.int64))
 
     def get_deterministic_policy(self, state_action_values_dict: dict):
         deterministic_policy = {}
@@ -4,6 +4,7 @@ from typing import Optional, Callable
 from tools.misc import set_seed
 from tools.rl_constants import ExperienceBatch, RandomBrainAction, Action
 from tools.parameter_scheduler import ParameterScheduler
+from tools.agent_layout import AgentLayout
 from agents.models.components.noise import GaussianNoise
 from agents.policies.base_policy import Policy
 
@@ -17,8 +18,7 @@ class IndependentMADDPGPolicy(Policy):
             agent_id: str,
             brain_set,
             action_dim: int,
-            map_agent_to_state_slice: dict,
-            map_agent_to_action_slice: dict,
+            agent_layout: AgentLayout,
             random_brain_action_factory: lambda: RandomBrainAction,
             epsilon_scheduler: ParameterScheduler=ParameterScheduler(initial=1, lambda_fn=lambda i: 0.95**i, final=0.01),
             gamma: float = 0.99,
@@ -45,9 +45,7 @@ class IndependentMADDPGPolicy(Policy):
         self.random_action_generator = random_brain_action_factory()
         self.gaussian_noise = gaussian_noise_factory()
 
-        self.map_agent_to_state_slice = map_agent_to_state_slice
-
-        self.map_agent_to_action_slice = map_agent_to_action_slice
+        self.agent_layout = agent_layout
 
         self.continuous_actions_clip_range = continuous_actions_clip_range
         self.continuous_actions = continuous_actions
@@ -120,26 +118,25 @@ class IndependentMADDPGPolicy(Policy):
         action = Action(value=action)
         return action
 
-    def get_other_agent_atributes(self, x: torch.Tensor, agent_slicing_dict: dict, apply_fn_map: dict = None):
-        output = []
-        for k, f in agent_slicing_dict.items():
-            if k != self.agent_id:
-                if apply_fn_map:
-                    output.append(apply_fn_map[k](f(x)))
-                else:
-                    output.append(f(x))
+    def get_other_agent_atributes(self, x: torch.Tensor, attribute: str = 'state', apply_fn_map: dict = None):
+        if not apply_fn_map:
+            return self.agent_layout.other_agent_attributes(x, self.agent_id, attribute)
 
-        output = torch.cat(output, dim=1)
-        return output
+        # Each other agent has its own model, so the blocks are extracted and processed per agent
+        output = [
+            apply_fn_map[k](self.agent_layout.agent_attributes(x, k, attribute))
+            for k in self.agent_layout.other_agent_ids(self.agent_id)
+        ]
+        return torch.cat(output, dim=1)
 
-    def get_agent_attributes(self, x: torch.Tensor, agent_slicing_dict: dict):
-        return agent_slicing_dict[self.agent_id](x)
+    def get_agent_attributes(self, x: torch.Tensor, attribute: str = 'state'):
+        return self.agent_layout.agent_attributes(x, self.agent_id, attribute)
 
     def compute_actor_errors(self, experience_batch: ExperienceBatch, online_actor, online_critic, target_actor, target_critic, *args, **kwargs) -> tuple:
         """ Compute the error and loss of the actor"""
         other_agent_actions = self.get_other_agent_atributes(
             experience_batch.joint_states,
-            self.map_agent_to_state_slice,
+            'state',
             apply_fn_map=self.online_actor_map
         ).detach()
 
@@ -148,7 +145,7 @@ class IndependentMADDPGPolicy(Policy):
         agent_action = online_actor(experience_batch.states)
 
         other_agent_states = self.get_other_agent_atributes(
-            experience_batch.joint_states, self.map_agent_to_state_slice
+            experience_batch.joint_states, 'state'
         )
 
         if self.matd3:
@@ -165,19 +162,18 @@ class IndependentMADDPGPolicy(Policy):
         if not self.matd3:
             other_agent_next_actions = self.get_other_agent_atributes(
                 experience_batch.joint_next_states,
-                self.map_agent_to_state_slice,
+                'state',
                 apply_fn_map=self.target_actor_map
             )
             agent_next_actions = target_actor(experience_batch.next_states).float()
-            other_agent_next_states_tensor = self.get_other_agent_atributes(experience_batch.joint_next_states,
-                                                                            self.map_agent_to_state_slice)
+            other_agent_next_states_tensor = self.get_other_agent_atributes(experience_batch.joint_next_states, 'state')
 
             other_agent_actions = self.get_other_agent_atributes(
-                experience_batch.joint_actions, self.map_agent_to_action_slice
+                experience_batch.joint_actions, 'action'
             ).float()
 
             other_agent_states = self.get_other_agent_atributes(
-                experience_batch.joint_states, self.map_agent_to_state_slice
+                experience_batch.joint_states, 'state'
             )
             with torch.no_grad():
                 q_target_next = target_critic(
@@ -201,25 +197,24 @@ class IndependentMADDPGPolicy(Policy):
         else:
             other_agent_next_actions = self.get_other_agent_atributes(
                 experience_batch.joint_next_states,
-                self.map_agent_to_state_slice,
+                'state',
                 apply_fn_map=self.target_actor_map
             )
-            other_agent_next_states_tensor = self.get_other_agent_atributes(experience_batch.joint_next_states,
-                                                                            self.map_agent_to_state_slice)
+            other_agent_next_states_tensor = self.get_other_agent_atributes(experience_batch.joint_next_states, 'state')
 
             other_agent_actions = self.get_other_agent_atributes(
-                experience_batch.joint_actions, self.map_agent_to_action_slice
+                experience_batch.joint_actions, 'action'
             ).float()
 
             other_agent_states = self.get_other_agent_atributes(
-                experience_batch.joint_states, self.map_agent_to_state_slice
+                experience_batch.joint_states, 'state'
             )
 
             agent_next_actions = target_actor(experience_batch.next_states).float()
 
             if self.continuous_actions:
-                agent_next_actions += self.gaussian_noise.sample(agent_next_actions).float().to(device)
-                other_agent_next_actions += self.gaussian_noise.sample(other_agent_next_actions).float().to(device)
+                agent_next_actions += self.gaussian_noise.sample(agent_next_actions)
+                other_agent_next_actions += self.gaussian_noise.sample(other_agent_next_actions)
 
             if self.continuous_actions_clip_range is not None:
                 agent_next_actions = agent_next_actions.clamp(
@@ -1,9 +1,10 @@
 import torch
 import numpy as np
-from typing import Optional, List, Callable
+from typing import Optional, Callable
 from tools.misc import set_seed
 from tools.rl_constants import ExperienceBatch, Action
 from tools.parameter_scheduler import ParameterScheduler
+from tools.agent_layout import AgentLayout
 from agents.policies.base_policy import Policy
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
@@ -17,8 +18,7 @@ class MADDPGPolicy(Policy):
             num_agents: int,
             critic_input_dim: int,
             action_dim: int,
-            map_agent_to_state_slice: list,
-            map_agent_to_action_slice: list,
+            agent_layout: AgentLayout,
             epsilon_scheduler: ParameterScheduler,
             random_brain_action_factory: Callable,
             gamma: float = 0.99,
@@ -38,11 +38,7 @@ class MADDPGPolicy(Policy):
         self.epsilon = self.epsilon_scheduler.initial
         self.random_action_generator = random_brain_action_factory()
 
-        self.slice_cache = {}
-
-        self.map_agent_to_state_slice = map_agent_to_state_slice
-
-        self.map_agent_to_action_slice = map_agent_to_action_slice
+        self.agent_layout = agent_layout
 
     @staticmethod
     def set_seed(seed: int):
@@ -90,16 +86,11 @@ class MADDPGPolicy(Policy):
         action = Action(value=action)
         return action
 
-    def get_other_agent_atributes(self, x: torch.Tensor, agent_number: int, slicing_list: List[Callable]):
-        output = []
-        for k, f in enumerate(slicing_list):
-            if k != agent_number:
-                output.append(f(x))
-        output = torch.cat(output, dim=1)
-        return output
+    def get_other_agent_atributes(self, x: torch.Tensor, agent_number: int, attribute: str = 'state'):
+        return self.agent_layout.other_agent_attributes(x, self.agent_layout.agent_ids[agent_number], attribute)
 
-    def get_agent_attributes(self, x: torch.Tensor, agent_number: int, slicing_list: List[Callable]):
-        return slicing_list[agent_number](x)
+    def get_agent_attributes(self, x: torch.Tensor, agent_number: int, attribute: str = 'state'):
+        return self.agent_layout.agent_attributes(x, self.agent_layout.agent_ids[agent_number], attribute)
 
     def compute_actor_errors(self, experience_batch: ExperienceBatch, online_actor, target_actor, target_critic, online_critic, agent_num, *args, **kwargs) -> tuple:
         """ Compute the error and loss of the actor"""
@@ -107,7 +98,7 @@ class MADDPGPolicy(Policy):
         other_agent_states = self.get_other_agent_atributes(
             experience_batch.joint_states,
             agent_num,
-            self.map_agent_to_state_slice
+            'state'
         )
 
         other_agent_actions = online_actor(other_agent_states).detach().float()
@@ -131,7 +122,7 @@ class MADDPGPolicy(Policy):
         other_agent_next_states = self.get_other_agent_atributes(
             experience_batch.joint_next_states,
             agent_num,
-            self.map_agent_to_state_slice
+            'state'
         )
 
         all_other_agent_next_actions = target_actor(other_agent_next_states)
@@ -148,13 +139,13 @@ class MADDPGPolicy(Policy):
         other_agent_actions = self.get_other_agent_atributes(
             experience_batch.joint_actions,
             agent_num,
-            self.map_agent_to_action_slice
+            'action'
         )
 
         other_agent_states = self.get_other_agent_atributes(
             experience_batch.joint_states,
             agent_num,
-            self.map_agent_to_state_slice
+            'state'
         )
 
         q_expected = online_critic(
@@ -45,7 +45,7 @@ class TD3Policy(DDPGPolicy):
             next_actions = target_actor(experience_batch.next_states)
             # Smooth the targets used for policy updates
             # Add noise to the actions used to calculate the target & clip
-            next_actions += self.gaussian_noise.sample(next_actions).float().to(device)
+            next_actions += self.gaussian_noise.sample(next_actions)
             next_actions = next_actions.clamp(self.action_range[0], self.action_range[1])
 
             # Compute the target Q value
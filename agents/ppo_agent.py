@@ -8,6 +8,7 @@ from tools.parameter_scheduler import ParameterScheduler
 from agents.base import Agent
 from torch.nn import functional as F
 from tools.misc import set_seed
+from tools.mixed_precision import MixedPrecision
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -42,6 +43,7 @@ class PPOAgent(Agent):
             continuous_action_range_clip: tuple = (-1, 1),
             min_batches_for_training: int = 32,
             num_learning_updates: int = 4,
+            mixed_precision: bool = False,
     ):
         """
         :param state_size: The state size of the agent
@@ -61,6 +63,7 @@ class PPOAgent(Agent):
         :param continuous_action_range_clip: The range to clip continuous actions above. Only used for continuous actions
         :param min_batches_for_training: Minimum number of batches to accumulate before performing training
         :param num_learning_updates: Number of epochs to train for over before discarding samples
+        :param mixed_precision: Train under autocast (fp16 on GPU, bf16 on CPU) with gradient scaling
         """
         super().__init__(state_size, action_size)
 
@@ -73,6 +76,7 @@ class PPOAgent(Agent):
         self.optimizer = optimizer_factory(self.online_actor_critic.parameters())
         self.current_trajectory_memory = Trajectories(seed)
         self.grad_clip = grad_clip
+        self.mixed_precision = MixedPrecision(enabled=mixed_precision)
         self.gamma = gamma
         self.batch_size = batch_size
         self.gae_factor = gae_factor
@@ -97,12 +101,14 @@ class PPOAgent(Agent):
 
     def set_mode(self, mode):
         if mode == 'train':
+            self.training = True
             self.online_actor_critic.train()
 
             # Check if we are switching to training from validation
             if self.std_scale == 0:
                 self.std_scale = self.previous_std_scale
         elif mode == 'eval':
+            self.training = False
             self.online_actor_critic.eval()
             self.previous_std_scale = self.std_scale
             self.std_scale = 0
@@ -170,8 +176,8 @@ class PPOAgent(Agent):
             action = concatenate_action_attributes(experience.action, attribute_name='value').to(device)
             critic_value = concatenate_action_attributes(experience.action, attribute_name='critic_values').to(device)
             log_prob = concatenate_action_attributes(experience.action, attribute_name='log_probs').to(device)
-            terminal = (1-experience.done).to(device).view(-1, 1)
-            reward = experience.reward.view(-1, 1)
+            terminal = (1 - torch.as_tensor(experience.done, dtype=torch.float32, device=device)).view(-1, 1)
+            reward = torch.as_tensor(experience.reward, dtype=torch.float32, device=device).view(-1, 1)
 
             states.append(experience.state)
             log_probs.append(log_prob)
@@ -211,9 +217,10 @@ class PPOAgent(Agent):
 
     def _learn(self, sampled_log_probs: torch.Tensor, sampled_states: torch.Tensor, sampled_actions: torch.Tensor, sampled_advantages: torch.Tensor, sampled_returns: torch.Tensor):
         """ Optimize the surrogate objective function over multiple epochs"""
-        _, log_probs, entropy_loss, values = self.online_actor_critic(
-            state=sampled_states, action=sampled_actions
-        )
+        with self.mixed_precision.autocast():
+            _, log_probs, entropy_loss, values = self.online_actor_critic(
+                state=sampled_states, action=sampled_actions
+            )
 
         sampled_log_probs = sampled_log_probs.view(-1, 1)
         log_probs = log_probs.view(-1, 1)
@@ -230,9 +237,11 @@ class PPOAgent(Agent):
         # Update actor critic
         # Combine loss functions from actor/critic
         self.optimizer.zero_grad()
-        (value_loss + policy_loss).backward()
+        self.mixed_precision.backward(value_loss + policy_loss)
+        self.mixed_precision.unscale_(self.optimizer)
         nn.utils.clip_grad_norm_(self.online_actor_critic.parameters(), self.grad_clip)
-        self.optimizer.step()
+        self.mixed_precision.step(self.optimizer)
+        self.mixed_precision.update()
 
     def step_episode(self, episode: int, *args, **kwargs):
         """ Perform end-of-episode updates """
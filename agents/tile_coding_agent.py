@@ -0,0 +1,103 @@
+import numpy as np
+import torch
+from typing import Tuple, Optional
+from agents.base import Agent
+from agents.models.sparse_linear import SparseLinearQFunction
+from tools.parameter_scheduler import ParameterScheduler
+from tools.rl_constants import Experience, ExperienceBatch, Action
+from tools.tile_coding import TileCoder
+
+
+def to_numpy(value) -> np.ndarray:
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+class TileCodingAgent(Agent):
+    """ Q-learning agent with a linear action-value function over tile-coded states
+
+    A cheap CPU baseline for low-dimensional continuous state spaces. States are encoded with a TileCoder, and the
+    SparseLinearQFunction is updated online after every step. Batches of states (eg. one row per agent of a brain,
+    or a sampled ExperienceBatch) are acted on and learned from in a single vectorized pass
+    """
+    def __init__(
+            self,
+            state_shape: Tuple[int, ...],
+            action_size: int,
+            tile_coder: TileCoder,
+            epsilon_scheduler: ParameterScheduler,
+            step_size: float = 0.1,
+            gamma: float = 0.99,
+            initial_value: float = 0.,
+            seed: Optional[int] = None,
+    ):
+        """
+        :param state_shape: Shape of the state
+        :param action_size: Number of possible integer actions
+        :param tile_coder: Encoder of the states into active features
+        :param epsilon_scheduler: Schedule of the probability of acting randomly, updated at each episode
+        :param step_size: Step size of the value updates
+        :param gamma: Discount factor
+        :param initial_value: Initial value of Q(s, a), optimistic values encouraging exploration
+        :param seed: Seed of the exploration
+        """
+        super().__init__(state_shape=state_shape, action_size=action_size)
+        self.tile_coder = tile_coder
+        self.q_function = SparseLinearQFunction(tile_coder.num_features, action_size, step_size, initial_value)
+        self.epsilon_scheduler = epsilon_scheduler
+        self.epsilon = epsilon_scheduler.initial
+        self.gamma = gamma
+        self.random_state = np.random.RandomState(seed)
+
+    def set_mode(self, mode: str):
+        if mode == 'train':
+            self.training = True
+        elif mode == 'eval':
+            self.training = False
+        else:
+            raise ValueError('Invalid mode: {}'.format(mode))
+
+    def encode(self, states) -> np.ndarray:
+        return self.tile_coder.encode(to_numpy(states).reshape(-1, self.tile_coder.tilings.shape[1]))
+
+    def get_action(self, state: torch.Tensor, *args, **kwargs) -> Action:
+        """ Epsilon-greedy actions for a batch of states, of shape (batch_size,) """
+        action_values = self.q_function.values(self.encode(state))
+        actions = action_values.argmax(axis=1)
+        if self.training:
+            explore = self.random_state.random_sample(len(actions)) < self.epsilon
+            actions[explore] = self.random_state.randint(0, self.action_size, int(explore.sum()))
+        return Action(value=actions)
+
+    def get_random_action(self, state: torch.Tensor, *args, **kwargs) -> Action:
+        num_states = len(to_numpy(state).reshape(-1, self.tile_coder.tilings.shape[1]))
+        return Action(value=self.random_state.randint(0, self.action_size, num_states))
+
+    def step(self, experience: Experience, **kwargs) -> None:
+        """ Learn from the transitions of the step, one per state """
+        if not self.training:
+            return
+        self.t_step += 1
+        self.update(experience.state, experience.action.value, experience.reward, experience.next_state, experience.done)
+
+    def step_episode(self, episode: int, *args) -> None:
+        self.episode_counter += 1
+        self.epsilon = self.epsilon_scheduler.get_param(episode)
+
+    def learn(self, experience_batch: ExperienceBatch) -> np.ndarray:
+        return self.update(
+            experience_batch.states, experience_batch.actions, experience_batch.rewards, experience_batch.next_states,
+            experience_batch.dones
+        )
+
+    def update(self, states, actions, rewards, next_states, dones) -> np.ndarray:
+        """ Q-learning update of a batch of transitions, returning the TD errors """
+        features = self.encode(states)
+        next_action_values = self.q_function.values(self.encode(next_states))
+        rewards = to_numpy(rewards).reshape(-1).astype(np.float64)
+        dones = to_numpy(dones).reshape(-1).astype(np.float64)
+        targets = rewards + self.gamma * (1 - dones) * next_action_values.max(axis=1)
+        td_errors = self.q_function.update(features, to_numpy(actions).reshape(-1).astype(np.int64), targets)
+        self.param_capture.add('loss', float(np.mean(td_errors ** 2)))
+        return td_errors
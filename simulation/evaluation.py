@@ -0,0 +1,281 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import torch
+from scipy import stats
+from tools.rl_constants import BrainSet, ActionBatch
+from simulation.unity_environment import UnityEnvironmentSimulator
+from simulation.utils import default_preprocess_brain_actions_for_env_fn
+
+
+class EvaluationStatistics:
+    """ Streaming statistics of evaluation episode scores, with Student-t confidence intervals
+
+    The mean and variance are updated with Welford's algorithm, so each episode is added in O(1)
+    """
+    def __init__(self, confidence: float = 0.95):
+        """
+        :param confidence: Confidence level of the interval around the mean score
+        """
+        if not 0 < confidence < 1:
+            raise ValueError("Confidence must be within (0, 1), found: {}".format(confidence))
+        self.confidence = confidence
+        self.scores = []
+        self.mean = 0.
+        self.sum_squared_deviations = 0.
+
+    def add(self, score: float):
+        self.scores.append(score)
+        delta = score - self.mean
+        self.mean += delta / len(self.scores)
+        self.sum_squared_deviations += delta * (score - self.mean)
+
+    @property
+    def n(self) -> int:
+        return len(self.scores)
+
+    @property
+    def std(self) -> float:
+        if self.n < 2:
+            return float('nan')
+        return math.sqrt(self.sum_squared_deviations / (self.n - 1))
+
+    @property
+    def standard_error(self) -> float:
+        return self.std / math.sqrt(self.n) if self.n > 1 else float('nan')
+
+    def confidence_interval(self) -> Tuple[float, float]:
+        """ Interval around the mean score at the confidence level """
+        if self.n < 2:
+            return float('-inf'), float('inf')
+        half_width = stats.t.ppf((1 + self.confidence) / 2, self.n - 1) * self.standard_error
+        return self.mean - half_width, self.mean + half_width
+
+    def clears_threshold(self, threshold: float) -> bool:
+        """ Whether the confidence interval lies entirely above or below the threshold """
+        low, high = self.confidence_interval()
+        return low > threshold or high < threshold
+
+    def summary(self) -> dict:
+        low, high = self.confidence_interval()
+        return {
+            'n_episodes': self.n,
+            'mean': self.mean,
+            'std': self.std,
+            'min': float(np.min(self.scores)) if self.scores else float('nan'),
+            'max': float(np.max(self.scores)) if self.scores else float('nan'),
+            'confidence': self.confidence,
+            'ci_low': low,
+            'ci_high': high,
+        }
+
+
+def get_batched_actions(brain_set: BrainSet, env_brain_states: List[Dict[str, torch.Tensor]]) -> List[Dict[str, ActionBatch]]:
+    """ Select the actions of several environments with one get_action call per agent
+
+    For each agent, the states of all environments are stacked and passed as a single batch, along with the joint
+    state of each environment of shape (num_envs, joint_state_size). Agents must therefore accept batched states.
+
+    :param brain_set: The agent brains
+    :param env_brain_states: The brain states of each environment
+    :return: The brain actions of each environment
+    """
+    joint_states = torch.cat([
+        torch.cat([brain_states[brain_name] for brain_name in brain_states]).view(1, -1)
+        for brain_states in env_brain_states
+    ])
+    env_brain_actions = [{} for _ in env_brain_states]
+    for brain_name, brain in brain_set:
+        states = [brain_states[brain_name] for brain_states in env_brain_states]
+        if len(brain.agents) == 1:
+            # The agent acts for all rows of the brain; rows are split back by environment
+            actions = ActionBatch.from_action(brain.agents[0].get_action(torch.cat(states), joint_state=joint_states))
+            offsets = np.cumsum([0] + [len(s) for s in states])
+            for i, brain_actions in enumerate(env_brain_actions):
+                brain_actions[brain_name] = actions.rows(int(offsets[i]), int(offsets[i + 1]))
+        else:
+            # Each agent acts for its own row of every environment
+            agent_actions = [
+                ActionBatch.from_action(agent.get_action(torch.stack([s[agent_number] for s in states]), joint_state=joint_states))
+                for agent_number, agent in enumerate(brain.agents)
+            ]
+            for i, brain_actions in enumerate(env_brain_actions):
+                brain_actions[brain_name] = ActionBatch.from_actions([a.rows(i, i + 1) for a in agent_actions])
+    return env_brain_actions
+
+
+class ParallelEvaluator:
+    """ Evaluate a BrainSet over many episodes, run concurrently over a pool of environments
+
+    The environments are stepped in lockstep: at every time step the actions of all running environments are
+    selected in a batch (see get_batched_actions), then the environments are stepped concurrently in threads, the
+    Unity environments running in their own processes. An environment finishing its episode immediately starts the
+    next one, until n_episodes have been started. Evaluation stops early once the confidence interval of the mean
+    score lies entirely above or below score_threshold
+
+    Agents keeping state between acting steps, such as the stacked frames of a VisualDQN, keep one row per
+    environment: the row of an environment is cleared with Agent.reset_envs when it starts an episode, and rows
+    are reindexed with Agent.select_envs when environments leave the batch. The agents' modes are restored after
+    evaluation
+    """
+    def __init__(self, simulators: List[UnityEnvironmentSimulator], batched_acting: bool = True, confidence: float = 0.95):
+        """
+        :param simulators: Simulators of the pool, each with its own environment (eg. created with distinct worker_ids)
+        :param batched_acting: Whether to select the actions of all environments in one batch per agent. Otherwise
+            the actions are selected environment by environment with BrainSet.get_actions, which agents keeping
+            state between acting steps (eg. VisualDQN) do not support
+        :param confidence: Confidence level of the score interval
+        """
+        if len(simulators) == 0:
+            raise ValueError("At least one simulator is required")
+        self.simulators = simulators
+        self.batched_acting = batched_acting
+        self.confidence = confidence
+        self.executor = ThreadPoolExecutor(max_workers=len(simulators))
+
+    def get_actions(self, brain_set: BrainSet, env_brain_states: List[Dict[str, torch.Tensor]]) -> List[Dict[str, ActionBatch]]:
+        if self.batched_acting:
+            return get_batched_actions(brain_set, env_brain_states)
+        return [brain_set.get_actions(brain_states) for brain_states in env_brain_states]
+
+    def evaluate(
+            self,
+            brain_set: BrainSet,
+            n_episodes: int = 100,
+            max_t: int = 1000,
+            score_threshold: Optional[float] = None,
+            min_episodes: int = 10,
+            brain_reward_accumulation_fn: Callable = lambda rewards: np.array(rewards),
+            episode_reward_accumulation_fn: Callable = lambda brain_episode_scores: float(
+                np.mean([np.mean(brain_episode_scores[brain_name]) for brain_name in brain_episode_scores])
+            ),
+            preprocess_brain_actions_for_env_fn: Callable = default_preprocess_brain_actions_for_env_fn,
+            end_episode_criteria: Callable = np.all,
+            verbose: bool = True,
+    ) -> EvaluationStatistics:
+        """
+        Evaluate the agents in the pool of environments
+        :param brain_set: The agent brains to evaluate
+        :param n_episodes: The maximum number of evaluation episodes
+        :param max_t: The maximum number of time steps allowed in each episode
+        :param score_threshold: Stop early once the confidence interval of the mean score clears this threshold
+        :param min_episodes: The minimum number of episodes before stopping early
+        :param brain_reward_accumulation_fn: Function used to accumulate rewards for each brain
+        :param episode_reward_accumulation_fn: Function used to aggregate rewards across brains
+        :param preprocess_brain_actions_for_env_fn: Function used to preprocess actions from the agents before
+         passing to the environment
+        :param end_episode_criteria: Function acting on a list of booleans
+            (identifying whether that agent's episode has terminated) to determine whether the episode is finished
+        :param verbose: Whether to print the statistics as episodes complete
+        :return: The statistics of the episode scores
+        """
+        agents = [agent for brain in brain_set.brains() for agent in brain.agents]
+        previous_modes = [(agent.training, agent.warmup) for agent in agents]
+        for agent in agents:
+            agent.set_mode('eval')
+            agent.set_warmup(False)
+            agent.reset_envs()
+        try:
+            return self._evaluate(
+                brain_set, agents, n_episodes, max_t, score_threshold, min_episodes, brain_reward_accumulation_fn,
+                episode_reward_accumulation_fn, preprocess_brain_actions_for_env_fn, end_episode_criteria, verbose
+            )
+        finally:
+            for agent, (training, warmup) in zip(agents, previous_modes):
+                agent.set_mode('train' if training else 'eval')
+                agent.set_warmup(warmup)
+                # Acting state such as stacked frames is indexed by evaluation environment
+                agent.reset_envs()
+
+    def _evaluate(self, brain_set: BrainSet, agents: list, n_episodes: int, max_t: int, score_threshold: Optional[float],
+                  min_episodes: int, brain_reward_accumulation_fn: Callable, episode_reward_accumulation_fn: Callable,
+                  preprocess_brain_actions_for_env_fn: Callable, end_episode_criteria: Callable, verbose: bool) -> EvaluationStatistics:
+        statistics = EvaluationStatistics(self.confidence)
+        # Per running environment: its index in the pool, brain states, time step and accumulated brain scores
+        running = []
+        num_started = 0
+
+        def start_episode(env_idx: int) -> dict:
+            simulator = self.simulators[env_idx]
+            simulator.reset_env(train_mode=False)
+            return {
+                'env_idx': env_idx,
+                'brain_states': simulator.get_next_states(brain_set),
+                't': 0,
+                'brain_episode_scores': {brain_name: None for brain_name, _ in brain_set},
+            }
+
+        for env_idx in range(min(n_episodes, len(self.simulators))):
+            running.append(start_episode(env_idx))
+            num_started += 1
+
+        t_start = time.time()
+        while running:
+            env_brain_actions = self.get_actions(brain_set, [episode['brain_states'] for episode in running])
+            next_brain_environments = list(self.executor.map(
+                lambda args: self.simulators[args[0]['env_idx']].step_actions(
+                    brain_set, args[0]['brain_states'], args[1], preprocess_brain_actions_for_env_fn
+                ),
+                zip(running, env_brain_actions)
+            ))
+
+            finished = []
+            for episode, next_brain_environment in zip(running, next_brain_environments):
+                episode['t'] += 1
+                episode['brain_states'] = {
+                    brain_name: next_brain_environment[brain_name]['next_states'] for brain_name in episode['brain_states']
+                }
+                brain_episode_scores = episode['brain_episode_scores']
+                for brain_name in brain_episode_scores:
+                    scores = brain_reward_accumulation_fn(next_brain_environment[brain_name]['rewards'])
+                    if brain_episode_scores[brain_name] is None:
+                        brain_episode_scores[brain_name] = scores
+                    else:
+                        brain_episode_scores[brain_name] += scores
+
+                all_dones = []
+                for brain_name in brain_set.names():
+                    all_dones.extend(next_brain_environment[brain_name]['dones'])
+                if end_episode_criteria(all_dones) or episode['t'] >= max_t:
+                    finished.append(episode)
+
+            for episode in finished:
+                statistics.add(episode_reward_accumulation_fn(episode['brain_episode_scores']))
+                if verbose:
+                    low, high = statistics.confidence_interval()
+                    print('\rEpisode {}\tAverage Score: {:.2f}\t{:.0%} CI: [{:.2f}, {:.2f}]'.format(
+                        statistics.n, statistics.mean, self.confidence, low, high), end='')
+
+            if score_threshold is not None and statistics.n >= min_episodes and statistics.clears_threshold(score_threshold):
+                break
+            # New episodes take the place of finished ones, so each environment keeps its row in the action batch.
+            # The acting state of the agents (eg. stacked frames) is cleared for these rows, and reindexed when
+            # environments leave the batch
+            finished_ids = {id(episode) for episode in finished}
+            restarted_rows, kept_rows = [], []
+            for i, episode in enumerate(running):
+                if id(episode) not in finished_ids:
+                    kept_rows.append(i)
+                elif num_started < n_episodes:
+                    running[i] = start_episode(episode['env_idx'])
+                    num_started += 1
+                    restarted_rows.append(i)
+                    kept_rows.append(i)
+            if restarted_rows:
+                for agent in agents:
+                    agent.reset_envs(restarted_rows)
+            if len(kept_rows) < len(running):
+                running = [running[i] for i in kept_rows]
+                for agent in agents:
+                    agent.select_envs(kept_rows)
+
+        if verbose:
+            print('\nEvaluated {} episodes in {:.1f}s'.format(statistics.n, time.time() - t_start))
+        return statistics
+
+    def close(self):
+        self.executor.shutdown()
+        for simulator in self.simulators:
+            simulator.close()
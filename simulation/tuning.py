@@ -0,0 +1,282 @@
+import sys
+import queue
+import traceback
+import math
+import multiprocessing
+from collections import defaultdict
+from multiprocessing.managers import BaseManager
+from multiprocessing.util import Finalize
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from ax.service.ax_client import AxClient
+from simulation.unity_environment import UnityEnvironmentSimulator
+from tools.scores import Scores
+from tools.tuning_results import TuningResultsStore
+
+# The simulator owned by the current worker process, created once by init_worker
+WORKER_SIMULATOR: Optional[UnityEnvironmentSimulator] = None
+
+
+def init_worker(simulator_factory: Callable[[int], UnityEnvironmentSimulator], worker_ids: multiprocessing.Queue):
+    """ Create the simulator of a worker process, on its own Unity worker_id so that the environments' ports differ """
+    global WORKER_SIMULATOR
+    WORKER_SIMULATOR = simulator_factory(worker_id=worker_ids.get())
+    # Close the Unity environment when the worker exits
+    Finalize(WORKER_SIMULATOR, WORKER_SIMULATOR.close, exitpriority=10)
+
+
+def run_trial(trial_fn: Callable, params: dict, stop_criteria: Optional[Callable]) -> Tuple[float, dict]:
+    return trial_fn(WORKER_SIMULATOR, params, stop_criteria)
+
+
+class TrialScheduler:
+    """ Decides whether to stop tuning trials early, from the sliding-window scores they report during training
+
+    Trials report every report_frequency episodes, so that all trials report at the same episodes
+    """
+    def __init__(self, report_frequency: int):
+        self.report_frequency = report_frequency
+        # {episode: {trial_index: score}}
+        self.episode_scores: Dict[int, Dict[int, float]] = defaultdict(dict)
+
+    def report(self, trial_index: int, episode: int, score: float) -> bool:
+        """
+        Record the score of a trial
+        :param trial_index: The index of the reporting trial
+        :param episode: The number of episodes the trial has trained for
+        :param score: The trial's mean score over its sliding window
+        :return: Whether the trial should stop
+        """
+        self.episode_scores[episode][trial_index] = score
+        return self.should_stop(trial_index, episode, score)
+
+    def should_stop(self, trial_index: int, episode: int, score: float) -> bool:
+        raise NotImplementedError
+
+
+class MedianStoppingScheduler(TrialScheduler):
+    """ Stop a trial whose score is below the median score of the other trials at the same episode """
+    def __init__(self, grace_episodes: int = 100, min_trials: int = 5, report_frequency: int = 50):
+        """
+        :param grace_episodes: The number of episodes before a trial can be stopped
+        :param min_trials: The minimum number of other trials reporting at an episode to compare against
+        :param report_frequency: The number of episodes between reports
+        """
+        super().__init__(report_frequency)
+        self.grace_episodes = grace_episodes
+        self.min_trials = min_trials
+
+    def should_stop(self, trial_index: int, episode: int, score: float) -> bool:
+        if episode < self.grace_episodes:
+            return False
+        other_scores = [s for i, s in self.episode_scores[episode].items() if i != trial_index]
+        if len(other_scores) < self.min_trials:
+            return False
+        return score < float(np.median(other_scores))
+
+
+class SuccessiveHalvingScheduler(TrialScheduler):
+    """ Asynchronous successive halving
+
+    Trials are evaluated at rungs of min_episodes * reduction_factor ** k episodes. A trial reaching a rung continues
+    only if its score is within the top 1 / reduction_factor of the scores reported at that rung so far. Since trials
+    are stopped as soon as they reach a rung, there is no waiting for a full bracket of trials
+    """
+    def __init__(self, min_episodes: int = 100, reduction_factor: int = 3):
+        """
+        :param min_episodes: The number of episodes of the first rung
+        :param reduction_factor: The inverse of the fraction of trials continuing past each rung
+        """
+        if reduction_factor < 2:
+            raise ValueError("The reduction factor must be at least 2, found: {}".format(reduction_factor))
+        super().__init__(report_frequency=min_episodes)
+        self.min_episodes = min_episodes
+        self.reduction_factor = reduction_factor
+
+    def is_rung(self, episode: int) -> bool:
+        rung = self.min_episodes
+        while rung < episode:
+            rung *= self.reduction_factor
+        return rung == episode
+
+    def should_stop(self, trial_index: int, episode: int, score: float) -> bool:
+        if not self.is_rung(episode):
+            return False
+        rung_scores = sorted(self.episode_scores[episode].values(), reverse=True)
+        if len(rung_scores) < self.reduction_factor:
+            # Too few trials have reached the rung to rank them
+            return False
+        num_continuing = int(math.ceil(len(rung_scores) / self.reduction_factor))
+        return score < rung_scores[num_continuing - 1]
+
+
+def serve(obj):
+    return obj
+
+
+class TrialSchedulerManager(BaseManager):
+    """ Serves the trial scheduler from a manager process, shared by the trials of all workers """
+
+
+TrialSchedulerManager.register('TrialScheduler', callable=serve)
+
+
+class TrialStopCriteria:
+    """ stop_criteria of UnityEnvironmentSimulator.train, reporting the sliding-window score of a trial to the
+    shared scheduler every report_frequency episodes """
+    def __init__(self, scheduler, trial_index: int, report_frequency: int):
+        """
+        :param scheduler: Proxy of the TrialScheduler
+        :param trial_index: The index of the trial
+        :param report_frequency: The number of episodes between reports
+        """
+        self.scheduler = scheduler
+        self.trial_index = trial_index
+        self.report_frequency = report_frequency
+
+    def __call__(self, i_episode: int, training_scores: Scores) -> bool:
+        if i_episode % self.report_frequency != 0:
+            return False
+        return self.scheduler.report(self.trial_index, i_episode, float(training_scores.get_mean_sliding_scores()))
+
+
+class ParallelTuningRunner:
+    """ Run Ax hyperparameter trials concurrently over a pool of worker processes
+
+    Each worker process owns a simulator, created once with a distinct worker_id, and trains one trial at a time.
+    Trials are requested from Ax in batches filling the idle workers; Ax is only queried from the main thread.
+
+    trial_fn(simulator, params, stop_criteria) must be picklable (ie. defined at module level), pass stop_criteria to
+    UnityEnvironmentSimulator.train (or get_agent_performance) and return a tuple of (performance, info), where
+    info['n_train_episodes'] is the number of episodes trained. Trials raising an exception are completed with
+    failed_performance.
+
+    With a scheduler, poorly performing trials are stopped early and report their score at the time they were
+    stopped. The episodes they free go to new trials: given an episode_budget, trials are requested until the
+    episodes trained by the completed trials exhaust the budget
+    """
+    def __init__(
+            self,
+            trial_fn: Callable[[UnityEnvironmentSimulator, dict], Tuple[float, dict]],
+            simulator_factory: Callable[[int], UnityEnvironmentSimulator],
+            results_store: TuningResultsStore,
+            scheduler: Optional[TrialScheduler] = None,
+            num_workers: int = 4,
+            base_worker_id: int = 0,
+            failed_performance: float = 0.,
+            seed: Optional[int] = None,
+    ):
+        """
+        :param trial_fn: Function training and evaluating the agents of a trial in the given simulator
+        :param simulator_factory: Function creating a simulator, called with a worker_id keyword argument
+        :param results_store: Store receiving the results of the completed trials
+        :param scheduler: Optional scheduler stopping poorly performing trials early
+        :param num_workers: The number of trials run concurrently
+        :param base_worker_id: worker_id of the first worker, the others taking the following ids
+        :param failed_performance: Performance reported to Ax for trials raising an exception
+        :param seed: Seed of the Ax client
+        """
+        self.trial_fn = trial_fn
+        self.simulator_factory = simulator_factory
+        self.results_store = results_store
+        self.scheduler = scheduler
+        self.num_workers = num_workers
+        self.base_worker_id = base_worker_id
+        self.failed_performance = failed_performance
+        self.seed = seed
+
+    def run(self, parameters: List[dict], total_trials: int, minimize: bool = False, episode_budget: Optional[int] = None) -> Tuple[Optional[dict], AxClient]:
+        """
+        Run the tuning trials
+        :param parameters: The Ax search space, see https://ax.dev/docs/core.html#search-space-and-parameters
+        :param total_trials: The maximum number of trials to run
+        :param minimize: Whether the performance is minimized
+        :param episode_budget: Optional total number of training episodes across trials. New trials are no longer
+            requested once the completed trials have used the budget; the running trials may exceed it
+        :return: Tuple of the best parameters found and the Ax client
+        """
+        if self.scheduler is not None and minimize:
+            raise ValueError("Trial schedulers stop the trials with the lowest scores, which requires minimize=False")
+        ax_client = AxClient(enforce_sequential_optimization=False, random_seed=self.seed, verbose_logging=False)
+        ax_client.create_experiment(parameters=parameters, objective_name='performance', minimize=minimize)
+
+        # Spawned workers do not inherit the CUDA state of the main process
+        context = multiprocessing.get_context('spawn')
+        worker_ids = context.Queue()
+        for i in range(self.num_workers):
+            worker_ids.put(self.base_worker_id + i)
+
+        completed = queue.Queue()
+
+        def on_success(trial_index: int, result: Tuple[float, dict]):
+            performance, info = result
+            try:
+                self.results_store.add(trial_index, performance, info)
+            except Exception as e:
+                # The main thread must still be notified of the trial's completion
+                on_failure(trial_index, e)
+                return
+            completed.put((trial_index, performance, info.get('n_train_episodes', 0)))
+
+        def on_failure(trial_index: int, e: BaseException):
+            print("FAILURE IN HYPERPARAMETER TUNING::: trial {}, {}".format(trial_index, e), file=sys.stderr)
+            traceback.print_exception(type(e), e, e.__traceback__)
+            completed.put((trial_index, self.failed_performance, 0))
+
+        def can_request() -> bool:
+            if num_requested >= total_trials:
+                return False
+            return episode_budget is None or num_episodes < episode_budget
+
+        manager = None
+        scheduler = None
+        if self.scheduler is not None:
+            manager = TrialSchedulerManager(ctx=context)
+            manager.start()
+            scheduler = manager.TrialScheduler(self.scheduler)
+
+        pending = {}
+        num_requested = 0
+        num_completed = 0
+        num_episodes = 0
+        pool = context.Pool(self.num_workers, initializer=init_worker, initargs=(self.simulator_factory, worker_ids))
+        try:
+            while pending or can_request():
+                # Fill the idle workers with a batch of new trials
+                while len(pending) < self.num_workers and can_request():
+                    try:
+                        params, trial_index = ax_client.get_next_trial()
+                    except Exception:
+                        # The generation strategy may need the pending trials' data before generating more
+                        if not pending:
+                            raise
+                        break
+                    pending[trial_index] = params
+                    num_requested += 1
+                    stop_criteria = None
+                    if scheduler is not None:
+                        stop_criteria = TrialStopCriteria(scheduler, trial_index, self.scheduler.report_frequency)
+                    pool.apply_async(
+                        run_trial, (self.trial_fn, params, stop_criteria),
+                        callback=lambda result, i=trial_index: on_success(i, result),
+                        error_callback=lambda e, i=trial_index: on_failure(i, e),
+                    )
+
+                trial_index, performance, trial_episodes = completed.get()
+                ax_client.complete_trial(trial_index=trial_index, raw_data=performance)
+                del pending[trial_index]
+                num_completed += 1
+                num_episodes += trial_episodes
+                print("Trial {} ({} completed, {} episodes) performance is: {}".format(trial_index, num_completed, num_episodes, performance))
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            if manager is not None:
+                manager.shutdown()
+
+        best = ax_client.get_best_parameters()
+        best_parameters = best[0] if best is not None else None
+        return best_parameters, ax_client
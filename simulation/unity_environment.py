@@ -1,7 +1,6 @@
 import time
 from collections import OrderedDict
-from typing import Tuple, Optional, List, Callable, Dict
-from copy import deepcopy
+from typing import Tuple, Optional, Callable, Dict
 import warnings
 
 import torch
@@ -9,10 +8,11 @@ import numpy as np
 import matplotlib.pyplot as plt
 from unityagents import UnityEnvironment
 
-from tools.rl_constants import BrainSet, Action
+from tools.rl_constants import BrainSet, ActionBatch
 from tools.scores import Scores
 from simulation.utils import default_preprocess_brain_actions_for_env_fn, default_step_agents_fn, default_step_episode_agents_fn
 from tools.misc import set_seed
+from tools.timer import PhaseTimer, DISABLED_TIMER
 
 plt.style.use('ggplot')
 np.set_printoptions(precision=3, linewidth=120)
@@ -30,6 +30,7 @@ class UnityEnvironmentSimulator:
         self.env_info = None
         self.training_scores = None
         self.evaluation_scores = None
+        self.timer: PhaseTimer = DISABLED_TIMER
 
     def reset_env(self, train_mode: bool) -> None:
         """ Reset the environment
@@ -44,6 +45,7 @@ class UnityEnvironmentSimulator:
         :param brain_set: The agent brains
         :return: Mapping from brain_name to a torch tensor of brain states
         """
+        self.timer.start('state_ingestion')
         brain_states = {}
         for brain_name, brain in brain_set:
             brain_info = self.env_info[brain_name]
@@ -57,6 +59,7 @@ class UnityEnvironmentSimulator:
             states = brain.preprocess_state_fn(states)
             states = torch.from_numpy(states).to(device).float()
             brain_states[brain_name] = states
+        self.timer.stop('state_ingestion')
         return brain_states
 
     def step(
@@ -71,7 +74,7 @@ class UnityEnvironmentSimulator:
         :param brain_states: Mapping from brain_name to a numpy ndarray of states
         :param random_actions: Whether to obtain random or learned actions
         :param preprocess_brain_actions_for_env_fn: Function for preprocessing brain actions prior to
-            passing to the environment
+            passing to the environment. The brain actions are not copied, so the function must not modify them in place
         :return: Mapping from brain_name to the the next environment frame, which includes:
             - states
             - actions
@@ -79,14 +82,36 @@ class UnityEnvironmentSimulator:
             - rewards
             - dones
         """
-        if random_actions:
-            brain_actions: Dict[str, List[Action]] = brain_set.get_random_actions(brain_states)
-        else:
-            brain_actions: Dict[str, List[Action]] = brain_set.get_actions(brain_states)
+        with self.timer.phase('action_selection'):
+            if random_actions:
+                brain_actions: Dict[str, ActionBatch] = brain_set.get_random_actions(brain_states)
+            else:
+                brain_actions: Dict[str, ActionBatch] = brain_set.get_actions(brain_states)
+        return self.step_actions(brain_set, brain_states, brain_actions, preprocess_brain_actions_for_env_fn)
 
-        actions: Dict[str, np.ndarray] = preprocess_brain_actions_for_env_fn(deepcopy(brain_actions))
+    def step_actions(
+            self,
+            brain_set: BrainSet,
+            brain_states: Dict[str, torch.Tensor],
+            brain_actions: Dict[str, ActionBatch],
+            preprocess_brain_actions_for_env_fn: Callable = default_preprocess_brain_actions_for_env_fn
+    ) -> Dict[str, dict]:
+        """ Step the simulation with actions already selected for every brain
+        :param brain_set: The agent brains
+        :param brain_states: Mapping from brain_name to the current states
+        :param brain_actions: Mapping from brain_name to the actions of its agents
+        :param preprocess_brain_actions_for_env_fn: Function for preprocessing brain actions prior to
+            passing to the environment
+        :return: Mapping from brain_name to the the next environment frame, as returned by step
+
+        The brain actions are no longer deep-copied: with the default preprocessing, the arrays passed to the
+        environment are the values of the ActionBatches, which are also returned in the frame and stored by the agents.
+        Neither the preprocessing function nor the environment may modify them in place
+        """
+        actions: Dict[str, np.ndarray] = preprocess_brain_actions_for_env_fn(brain_actions)
 
-        self.env_info = self.env.step(actions)
+        with self.timer.phase('env_step'):
+            self.env_info = self.env.step(actions)
 
         next_brain_states = self.get_next_states(brain_set)
 
@@ -113,7 +138,10 @@ class UnityEnvironmentSimulator:
             preprocess_brain_actions_for_env_fn: Callable = default_preprocess_brain_actions_for_env_fn,
             end_episode_criteria: Callable = np.all,
             end_of_episode_score_display_fn: Callable = lambda i_episode, episode_aggregated_score, training_scores: '\rEpisode {}\tScore: {:.2f}\tAverage Score: {:.2f}'.format(i_episode, episode_aggregated_score, training_scores.get_mean_sliding_scores()),
-            aggregate_end_of_episode_score_fn: Callable = lambda training_scores: training_scores.get_mean_sliding_scores()
+            aggregate_end_of_episode_score_fn: Callable = lambda training_scores: training_scores.get_mean_sliding_scores(),
+            stop_criteria: Optional[Callable[[int, Scores], bool]] = None,
+            timer: Optional[PhaseTimer] = None,
+            timing_report_frequency: int = 100,
             ) -> Tuple[BrainSet, Scores, int, float]:
         """
         Train a set of agents (brain-set) in an environment
@@ -133,6 +161,12 @@ class UnityEnvironmentSimulator:
             (identifying whether that agent's episode has terminated) to determine whether the episode is finished
         :param aggregate_end_of_episode_score_fn: Function used to aggregate the end-of-episode score function.
             Defaults to averaging over the past sliding_window_size episode scores
+        :param stop_criteria: Optional function of (i_episode, training_scores), called at the end of each episode,
+            returning whether to stop training early, eg. to prune a poorly performing tuning trial
+        :param timer: Optional timer recording the latency of each phase of the loop: env_step, state_ingestion,
+            action_selection and step_agents, and within the agents' steps sample, learn and target_update.
+            Its summary is printed every timing_report_frequency episodes, and can be exported with timer.to_json
+        :param timing_report_frequency: The number of episodes between printed timing summaries
         :return: Tuple of  (brain_set, Scores, i_episode, average_score)
             brain_set (BrainSet): The trained BrainSet
             Scores (Scores): Scores object containing all historic and sliding-window scores
@@ -144,6 +178,8 @@ class UnityEnvironmentSimulator:
             for agent in brain.agents:
                 agent.set_mode('train')
                 agent.set_warmup(False)
+                agent.set_timer(timer or DISABLED_TIMER)
+        self.timer = timer or DISABLED_TIMER
 
         self.training_scores = Scores(window_size=sliding_window_size)
 
@@ -156,7 +192,8 @@ class UnityEnvironmentSimulator:
 
             for t in range(max_t):
                 next_brain_environment = self.step(brain_set=brain_set, brain_states=brain_states, preprocess_brain_actions_for_env_fn=preprocess_brain_actions_for_env_fn)
-                step_agents_fn(brain_set, next_brain_environment, t)
+                with self.timer.phase('step_agents'):
+                    step_agents_fn(brain_set, next_brain_environment, t)
 
                 brain_states = {
                     brain_name: next_brain_environment[brain_name]['next_states']
@@ -192,11 +229,17 @@ class UnityEnvironmentSimulator:
                 end = ""
 
             print(end_of_episode_score_display_fn(i_episode, episode_aggregated_score, self.training_scores), end=end)
+            if timer is not None and i_episode % timing_report_frequency == 0:
+                print('\n' + timer.format_summary())
             if solved_score and aggregate_end_of_episode_score_fn(self.training_scores) >= solved_score:
                 print("\nTotal Training time = {:.1f} min".format((time.time() - t_start) / 60))
                 print('\nEnvironment solved in {:d} episodes!\tAverage Score: {:.2f}'.format(i_episode, self.training_scores.get_mean_sliding_scores()))
                 break
+            if stop_criteria is not None and stop_criteria(i_episode, self.training_scores):
+                print('\nStopped training after {:d} episodes\tAverage Score: {:.2f}'.format(i_episode, self.training_scores.get_mean_sliding_scores()))
+                break
         training_time = round(time.time() - t_start)
+        self.timer = DISABLED_TIMER
 
         return brain_set, self.training_scores, i_episode, training_time
 
@@ -263,7 +306,9 @@ class UnityEnvironmentSimulator:
                                                                 training_scores: '\rEpisode {}\tScore: {:.2f}\tAverage Score: {:.2f}'.format(
                  i_episode, episode_aggregated_score, training_scores.get_mean_sliding_scores()),
             sliding_window_size: int = 100,
-            end_episode_criteria: Callable = np.all
+            end_episode_criteria: Callable = np.all,
+            parallel_evaluator=None,
+            score_threshold: Optional[float] = None,
     ) -> Tuple[BrainSet, float]:
         """
         Evaluate the agent in the environment
@@ -276,8 +321,25 @@ class UnityEnvironmentSimulator:
         :param sliding_window_size: Size of the sliding window to average episode scores over
         :param end_episode_criteria: Function acting on a list of booleans
             (identifying whether that agent's episode has terminated) to determine whether the episode is finished
+        :param parallel_evaluator: Optional simulation.evaluation.ParallelEvaluator running the episodes over a pool
+            of environments, with batched acting, instead of this simulator's environment
+        :param score_threshold: With a parallel_evaluator, stop early once the confidence interval of the mean score
+            clears this threshold
         :return: Tuple of  (brain_set, average_score)
         """
+        if parallel_evaluator is not None:
+            statistics = parallel_evaluator.evaluate(
+                brain_set,
+                n_episodes=n_episodes,
+                max_t=max_t,
+                score_threshold=score_threshold,
+                brain_reward_accumulation_fn=brain_reward_accumulation_fn,
+                episode_reward_accumulation_fn=episode_reward_accumulation_fn,
+                end_episode_criteria=end_episode_criteria,
+            )
+            self.evaluation_scores = Scores(window_size=sliding_window_size, initialize_scores=statistics.scores)
+            return brain_set, statistics.mean
+
         for brain in brain_set.brains():
             for agent in brain.agents:
                 agent.set_mode('eval')
@@ -318,23 +380,26 @@ class UnityEnvironmentSimulator:
         average_score = self.evaluation_scores.get_mean_sliding_scores()
         return brain_set, average_score
 
-    def get_agent_performance(self, brain_set: BrainSet, n_train_episodes: int = 100, n_eval_episodes=10, sliding_window_size: int = 100, max_t: int = 1000) -> tuple:
+    def get_agent_performance(self, brain_set: BrainSet, n_train_episodes: int = 100, n_eval_episodes=10, sliding_window_size: int = 100, max_t: int = 1000,
+                              stop_criteria: Optional[Callable[[int, Scores], bool]] = None) -> tuple:
         """ Get the performance of the agents (brain-set) in the environment
         :param brain_set: BrainSet to get performance for
         :param n_train_episodes: Number of episodes to train agent over
         :param n_eval_episodes: Number of evaluation episodes to average over
         :param sliding_window_size: Size of the sliding window to average scores over
         :param max_t: Max number of time steps per episode
+        :param stop_criteria: Optional function of (i_episode, training_scores) returning whether to stop training
+            early, see simulation.tuning.TrialStopCriteria
         :return: Tuple of performance (Mean episode score) and training supplementary information
         """
         t1 = time.time()
-        # TODO: Allow for early stopping if performance is poor
         brain_set, training_scores, i_episode, training_time = self.train(
             brain_set=brain_set,
             solved_score=None,
             n_episodes=n_train_episodes,
             max_t=max_t,
             sliding_window_size=sliding_window_size,
+            stop_criteria=stop_criteria,
         )
 
         t2 = time.time()
@@ -342,7 +407,8 @@ class UnityEnvironmentSimulator:
         info = {
             "train_scores": training_scores,
             "train_time": round(t2-t1),
-            "n_train_episodes": n_train_episodes,
+            "n_train_episodes": i_episode,
+            "stopped_early": i_episode < n_train_episodes,
             "n_eval_episodes": n_eval_episodes,
             "sliding_window_size": sliding_window_size,
             "max_t": max_t,
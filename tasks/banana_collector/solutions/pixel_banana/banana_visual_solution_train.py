@@ -59,6 +59,7 @@ def get_solution_brain_set():
         nfilters=params["N_FILTERS"],
         kernel_sizes=params["KERNEL_SIZES"],
         stride_sizes=params["STRIDE_SIZES"],
+        channels_last=params["CHANNELS_LAST"] and not params["GRAYSCALE"],
     )
 
     model = VisualDQN(
@@ -73,6 +74,7 @@ def get_solution_brain_set():
         OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
         dueling_output=params["DUELING"],
         noisy_output=params['NOISY'],
+        noise_resample_frequency=params['NOISE_RESAMPLE_FREQUENCY'],
         categorical_output=params['CATEGORICAL'],
     )
 
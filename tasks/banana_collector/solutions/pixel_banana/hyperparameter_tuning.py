@@ -1,22 +1,23 @@
-import sys
 from agents.models.dqn import VisualDQN
 from agents.models.components.cnn import CNN
 import torch
 from copy import deepcopy
-from ax import optimize
+from functools import partial
 import os
-import pickle
 import ast
+from typing import Callable, Optional
 from tools.rl_constants import Experience, Brain, BrainSet
+from simulation.unity_environment import UnityEnvironmentSimulator
+from simulation.tuning import ParallelTuningRunner, SuccessiveHalvingScheduler
+from tools.tuning_results import TuningResultsStore
 
 from tasks.banana_collector.solutions.utils import default_cfg, get_policy, get_memory, get_agent, VISUAL_STATE_SHAPE,\
     ACTION_SIZE, get_simulator, IMAGE_SHAPE, BRAIN_NAME, get_preprocess_state_fn
 
 SEED = default_cfg['SEED']
 TUNINGS_DIR = os.path.abspath('visual_tunings')
-os.makedirs(TUNINGS_DIR, exist_ok=True)
-TRIAL_COUNTER = 0
 NUM_TRIALS = 500  # Some will error
+NUM_WORKERS = 4
 
 # Update default params for visual DQN
 default_cfg['N_EPISODES'] = 800
@@ -24,91 +25,88 @@ default_cfg['NUM_STACKED_FRAMES'] = 4
 default_cfg['WARMUP_STEPS'] = 5000
 
 
-def write_tuning_data(info: dict, performance: float):
-    with open(f'{TUNINGS_DIR}/trial_{TRIAL_COUNTER}_performance_{performance}', 'wb') as f:
-        pickle.dump(info, f)
-
-
-def visual_banana_tuning(update_params: dict):
+def visual_banana_tuning(simulator: UnityEnvironmentSimulator, update_params: dict, stop_criteria: Optional[Callable] = None):
+    # Failures can occur do to invalid CNN sizes, in which case the runner reports the trial as failed
     params = deepcopy(default_cfg)
     params.update(update_params)
-    try:
-        params['SUPPORT_RANGE'] = ast.literal_eval(params['SUPPORT_RANGE'])
-        params['OUTPUT_FC_HIDDEN_SIZES'] = ast.literal_eval(params['OUTPUT_FC_HIDDEN_SIZES'])
-        params['FILTERS'] = ast.literal_eval(params['FILTERS'])
-        params['KERNEL_SIZES'] = [ast.literal_eval(i) for i in ast.literal_eval(params["KERNEL_SIZES"])]
-        params['STRIDE_SIZES'] = [ast.literal_eval(i) for i in ast.literal_eval(params["STRIDE_SIZES"])]
-
-        policy = get_policy(ACTION_SIZE, params)
-        print(params)
-        featurizer = CNN(
-            image_shape=IMAGE_SHAPE,
-            num_stacked_frames=params["NUM_STACKED_FRAMES"],
-            grayscale=params["GRAYSCALE"],
-            filters=params["FILTERS"],
-            kernel_sizes=params["KERNEL_SIZES"],
-            stride_sizes=params["STRIDE_SIZES"],
-        )
-
-        model = VisualDQN(
-            VISUAL_STATE_SHAPE,
-            ACTION_SIZE,
-            featurizer,
-            featurizer.output_size,
-            seed=SEED,
-            grayscale=params["GRAYSCALE"],
-            num_stacked_frames=params["NUM_STACKED_FRAMES"],
-            output_hidden_layer_size=params["OUTPUT_FC_HIDDEN_SIZES"],
-            OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
-            dueling_output=params["DUELING"],
-            noisy_output=params['NOISY'],
-            categorical_output=params['CATEGORICAL'],
-        )
-
-        print(model)
-        optimizer = torch.optim.Adam(model.parameters(), lr=params['INITIAL_LR'])
-
-        memory = get_memory(VISUAL_STATE_SHAPE, params)
-
-        agent = get_agent(VISUAL_STATE_SHAPE, ACTION_SIZE, model, policy, memory, optimizer, params)
-
-        # Run performance evaluation
-        banana_brain = Brain(
-            brain_name=BRAIN_NAME,
-            action_size=ACTION_SIZE,
-            state_shape=VISUAL_STATE_SHAPE,
-            observation_type='visual',
-            agents=[agent],
-            preprocess_state_fn=get_preprocess_state_fn(params)
-        )
-
-        brain_set = BrainSet(brains=[banana_brain])
-
-        performance, info = simulator.get_agent_performance(
-            brain_set=brain_set,
-            n_train_episodes=params["N_EPISODES"],
-            n_eval_episodes=params["N_EVAL_EPISODES"],
-            max_t=params["MAX_T"],
-        )
-        info['input_params'] = params
-
-        global TRIAL_COUNTER
-        TRIAL_COUNTER += 1
-
-        write_tuning_data(info, performance)
-
-        print(f"Performance is : {performance}")
-        return performance
-    except Exception as e:
-        # Failures can occur do to invalid CNN sizes
-        print("FAILURE IN HYPERPARAMETER TUNING::: {}, {}".format(e, sys.exc_info()))
-        return 0
+    params['SUPPORT_RANGE'] = ast.literal_eval(params['SUPPORT_RANGE'])
+    params['OUTPUT_FC_HIDDEN_SIZES'] = ast.literal_eval(params['OUTPUT_FC_HIDDEN_SIZES'])
+    params['FILTERS'] = ast.literal_eval(params['FILTERS'])
+    params['KERNEL_SIZES'] = [ast.literal_eval(i) for i in ast.literal_eval(params["KERNEL_SIZES"])]
+    params['STRIDE_SIZES'] = [ast.literal_eval(i) for i in ast.literal_eval(params["STRIDE_SIZES"])]
+
+    policy = get_policy(ACTION_SIZE, params)
+    print(params)
+    featurizer = CNN(
+        image_shape=IMAGE_SHAPE,
+        num_stacked_frames=params["NUM_STACKED_FRAMES"],
+        grayscale=params["GRAYSCALE"],
+        filters=params["FILTERS"],
+        kernel_sizes=params["KERNEL_SIZES"],
+        stride_sizes=params["STRIDE_SIZES"],
+        channels_last=params["CHANNELS_LAST"] and not params["GRAYSCALE"],
+    )
+
+    model = VisualDQN(
+        VISUAL_STATE_SHAPE,
+        ACTION_SIZE,
+        featurizer,
+        featurizer.output_size,
+        seed=SEED,
+        grayscale=params["GRAYSCALE"],
+        num_stacked_frames=params["NUM_STACKED_FRAMES"],
+        output_hidden_layer_size=params["OUTPUT_FC_HIDDEN_SIZES"],
+        OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
+        dueling_output=params["DUELING"],
+        noisy_output=params['NOISY'],
+        noise_resample_frequency=params['NOISE_RESAMPLE_FREQUENCY'],
+        categorical_output=params['CATEGORICAL'],
+    )
 
+    print(model)
+    optimizer = torch.optim.Adam(model.parameters(), lr=params['INITIAL_LR'])
 
-if __name__ == '__main__':
-    simulator = get_simulator(visual=True)
+    memory = get_memory(VISUAL_STATE_SHAPE, params)
+
+    agent = get_agent(VISUAL_STATE_SHAPE, ACTION_SIZE, model, policy, memory, optimizer, params)
+
+    # Run performance evaluation
+    banana_brain = Brain(
+        brain_name=BRAIN_NAME,
+        action_size=ACTION_SIZE,
+        state_shape=VISUAL_STATE_SHAPE,
+        observation_type='visual',
+        agents=[agent],
+        preprocess_state_fn=get_preprocess_state_fn(params)
+    )
+
+    brain_set = BrainSet(brains=[banana_brain])
+
+    performance, info = simulator.get_agent_performance(
+        brain_set=brain_set,
+        n_train_episodes=params["N_EPISODES"],
+        n_eval_episodes=params["N_EVAL_EPISODES"],
+        max_t=params["MAX_T"],
+        stop_criteria=stop_criteria,
+    )
+    info['input_params'] = params
 
-    best_parameters, best_values, _, _ = optimize(
+    print(f"Performance is : {performance}")
+    return performance, info
+
+
+if __name__ == '__main__':
+    # Each worker initializes its own simulator
+    runner = ParallelTuningRunner(
+        trial_fn=visual_banana_tuning,
+        simulator_factory=partial(get_simulator, visual=True),
+        results_store=TuningResultsStore(TUNINGS_DIR),
+        # Trials in the bottom two thirds after 100 episodes are stopped, and their episodes go to new trials
+        scheduler=SuccessiveHalvingScheduler(min_episodes=100, reduction_factor=3),
+        num_workers=NUM_WORKERS,
+        seed=SEED,
+    )
+    best_parameters, _ = runner.run(
         # https://ax.dev/docs/core.html#search-space-and-parameters
         parameters=[
             {"name": "INITIAL_LR",
@@ -177,10 +175,9 @@ if __name__ == '__main__':
             #  "values": [True, False]
             #  },
         ],
-        evaluation_function=visual_banana_tuning,
         minimize=False,
-        arms_per_trial=1,
-        total_trials=NUM_TRIALS
+        total_trials=5 * NUM_TRIALS,
+        episode_budget=NUM_TRIALS * default_cfg['N_EPISODES'],
     )
 
     print("Best parameters::: {}".format(best_parameters))
@@ -60,6 +60,7 @@ def get_solution_brain_set():
         OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
         dueling_output=params["DUELING"],
         noisy_output=params['NOISY'],
+        noise_resample_frequency=params['NOISE_RESAMPLE_FREQUENCY'],
         categorical_output=params['CATEGORICAL'],
     )
 
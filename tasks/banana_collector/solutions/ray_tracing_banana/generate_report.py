@@ -6,6 +6,7 @@ if __name__ == '__main__':
     save_report(
         project_title="Ray-Tracing Banana Results",
         report_save_dir='RESULTS.pdf',
+        html_save_path='RESULTS.html',
         tunings_directory=os.path.abspath('ray_tunings'),
         performance_threshold=10.0  # minimum performance to save figure/parameters to the report
     )
@@ -3,102 +3,100 @@ from agents.models.dqn import DQN
 from agents.models.components.mlp import MLP
 from torch import nn
 from copy import deepcopy
-from ax import optimize
+from functools import partial
 import os
-import pickle
 import ast
+from typing import Callable, Optional
 from tasks.banana_collector.solutions.utils import default_cfg, get_policy, get_memory, get_agent, ACTION_SIZE, VECTOR_STATE_SHAPE, get_simulator, BRAIN_NAME
 from tools.rl_constants import BrainSet, Brain
+from simulation.unity_environment import UnityEnvironmentSimulator
+from simulation.tuning import ParallelTuningRunner, SuccessiveHalvingScheduler
+from tools.tuning_results import TuningResultsStore
 
-TRIAL_COUNTER = 0
 NUM_TRIALS = 500
+NUM_WORKERS = 4
 SEED = default_cfg['SEED']
 default_cfg['N_EPISODES'] = 500
 SOLVED_SCORE = 13.0
 TUNINGS_DIR = os.path.abspath('ray_tunings')
-os.makedirs(TUNINGS_DIR, exist_ok=True)
 
 
-def write_tuning_data(info: dict, performance: float):
-    with open(f'{TUNINGS_DIR}/trial_{TRIAL_COUNTER}_performance_{performance}', 'wb') as f:
-        pickle.dump(info, f)
-
-
-def banana_tuning(update_params: dict):
+def banana_tuning(simulator: UnityEnvironmentSimulator, update_params: dict, stop_criteria: Optional[Callable] = None):
     params = deepcopy(default_cfg)
     params.update(update_params)
-    try:
-        params['OUTPUT_FC_HIDDEN_SIZES'] = ast.literal_eval(params['OUTPUT_FC_HIDDEN_SIZES'])
-        params['SUPPORT_RANGE'] = ast.literal_eval(params['SUPPORT_RANGE'])
-        params['MLP_FEATURES_HIDDEN'] = ast.literal_eval(params['MLP_FEATURES_HIDDEN'])
-
-        policy = get_policy(ACTION_SIZE, params)
-
-        featurizer = MLP(
-            tuple([VECTOR_STATE_SHAPE[1]] + list(params['MLP_FEATURES_HIDDEN'])),
-            dropout=params['MLP_FEATURES_DROPOUT'],
-            activation_function=nn.ReLU(True),
-            output_function=nn.ReLU(True),
-            seed=SEED
-        )
-
-        model = DQN(
-            VECTOR_STATE_SHAPE,
-            ACTION_SIZE,
-            featurizer,
-            params['MLP_FEATURES_HIDDEN'][-1],
-            seed=SEED,
-            grayscale=params["GRAYSCALE"],
-            num_stacked_frames=params["NUM_STACKED_FRAMES"],
-            output_hidden_layer_size=params["OUTPUT_FC_HIDDEN_SIZES"],
-            OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
-            dueling_output=params["DUELING"],
-            noisy_output=params['NOISY'],
-            categorical_output=params['CATEGORICAL'],
-        )
-
-        print(model)
-        optimizer = torch.optim.Adam(model.parameters(), lr=params['INITIAL_LR'])
+    params['OUTPUT_FC_HIDDEN_SIZES'] = ast.literal_eval(params['OUTPUT_FC_HIDDEN_SIZES'])
+    params['SUPPORT_RANGE'] = ast.literal_eval(params['SUPPORT_RANGE'])
+    params['MLP_FEATURES_HIDDEN'] = ast.literal_eval(params['MLP_FEATURES_HIDDEN'])
+
+    policy = get_policy(ACTION_SIZE, params)
+
+    featurizer = MLP(
+        tuple([VECTOR_STATE_SHAPE[1]] + list(params['MLP_FEATURES_HIDDEN'])),
+        dropout=params['MLP_FEATURES_DROPOUT'],
+        activation_function=nn.ReLU(True),
+        output_function=nn.ReLU(True),
+        seed=SEED
+    )
 
-        memory = get_memory(VECTOR_STATE_SHAPE, params)
+    model = DQN(
+        VECTOR_STATE_SHAPE,
+        ACTION_SIZE,
+        featurizer,
+        params['MLP_FEATURES_HIDDEN'][-1],
+        seed=SEED,
+        grayscale=params["GRAYSCALE"],
+        num_stacked_frames=params["NUM_STACKED_FRAMES"],
+        output_hidden_layer_size=params["OUTPUT_FC_HIDDEN_SIZES"],
+        OUTPUT_HIDDEN_DROPOUT=params["OUTPUT_HIDDEN_DROPOUT"],
+        dueling_output=params["DUELING"],
+        noisy_output=params['NOISY'],
+        noise_resample_frequency=params['NOISE_RESAMPLE_FREQUENCY'],
+        categorical_output=params['CATEGORICAL'],
+    )
 
-        agent = get_agent(VECTOR_STATE_SHAPE, ACTION_SIZE, model, policy, memory, optimizer, params)
+    print(model)
+    optimizer = torch.optim.Adam(model.parameters(), lr=params['INITIAL_LR'])
 
-        banana_brain = Brain(
-            brain_name=BRAIN_NAME,
-            action_size=ACTION_SIZE,
-            state_shape=VECTOR_STATE_SHAPE,
-            observation_type='vector',
-            agents=[agent],
-        )
+    memory = get_memory(VECTOR_STATE_SHAPE, params)
 
-        brain_set = BrainSet(brains=[banana_brain])
+    agent = get_agent(VECTOR_STATE_SHAPE, ACTION_SIZE, model, policy, memory, optimizer, params)
 
-        # Run performance evaluation
-        performance, info = simulator.get_agent_performance(
-            brain_set=brain_set,
-            n_train_episodes=params["N_EPISODES"],
-            n_eval_episodes=params["N_EVAL_EPISODES"],
-            max_t=params["MAX_T"],
-        )
-        info['input_params'] = params
+    banana_brain = Brain(
+        brain_name=BRAIN_NAME,
+        action_size=ACTION_SIZE,
+        state_shape=VECTOR_STATE_SHAPE,
+        observation_type='vector',
+        agents=[agent],
+    )
 
-        write_tuning_data(info, performance)
+    brain_set = BrainSet(brains=[banana_brain])
 
-        global TRIAL_COUNTER
-        TRIAL_COUNTER += 1
+    # Run performance evaluation
+    performance, info = simulator.get_agent_performance(
+        brain_set=brain_set,
+        n_train_episodes=params["N_EPISODES"],
+        n_eval_episodes=params["N_EVAL_EPISODES"],
+        max_t=params["MAX_T"],
+        stop_criteria=stop_criteria,
+    )
+    info['input_params'] = params
 
-        print("Performance is : {}".format(performance))
-        return performance
-    except Exception as e:
-        print(e)
-        return 0
+    print("Performance is : {}".format(performance))
+    return performance, info
 
 
 if __name__ == "__main__":
-    # Initialize the simulator
-    simulator = get_simulator(visual=False)
-    best_parameters, best_values, _, _ = optimize(
+    # Each worker initializes its own simulator
+    runner = ParallelTuningRunner(
+        trial_fn=banana_tuning,
+        simulator_factory=partial(get_simulator, visual=False),
+        results_store=TuningResultsStore(TUNINGS_DIR),
+        # Trials in the bottom two thirds after 100 episodes are stopped, and their episodes go to new trials
+        scheduler=SuccessiveHalvingScheduler(min_episodes=100, reduction_factor=3),
+        num_workers=NUM_WORKERS,
+        seed=SEED,
+    )
+    best_parameters, _ = runner.run(
         # https://ax.dev/docs/core.html#search-space-and-parameters
         parameters=[
             {"name": "INITIAL_LR",
@@ -147,9 +145,8 @@ if __name__ == "__main__":
              "values": [True, False]
              },
         ],
-        evaluation_function=banana_tuning,
         minimize=False,
-        arms_per_trial=1,
-        total_trials=NUM_TRIALS
+        total_trials=5 * NUM_TRIALS,
+        episode_budget=NUM_TRIALS * default_cfg['N_EPISODES'],
     )
     print("Best parameters::: {}".format(best_parameters))
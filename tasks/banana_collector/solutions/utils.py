@@ -49,6 +49,7 @@ default_cfg = {
     "SUPPORT_RANGE": (-10, 10),
     # Noisy DQN
     "NOISY": False,
+    "NOISE_RESAMPLE_FREQUENCY": 1,
     # Dueling DQN
     "DUELING": False,
     ##############
@@ -65,6 +66,9 @@ default_cfg = {
     ###############
     # CNN Featurizer
     "FILTERS": (32, 64, 64),
+    # Run the RGB Conv3d featurizer in the channels_last_3d format; the acting frames are converted once, when they
+    # are appended to the frame buffer. Grayscale frames keep the default format
+    "CHANNELS_LAST": True,
     "KERNEL_SIZES": [(1, 3, 3), (1, 3, 3), (4, 3, 3)],
     "STRIDE_SIZES": [(1, 3, 3), (1, 3, 3), (1, 3, 3)],
     # MLP Featurizer params
@@ -78,7 +82,7 @@ default_cfg = {
 }
 
 
-def get_simulator(visual: bool = False):
+def get_simulator(visual: bool = False, worker_id: int = 0):
     if visual:
         observation_type = 'visual'
         environment_name = "VisualBanana_Linux/Banana.x86_64"
@@ -86,7 +90,8 @@ def get_simulator(visual: bool = False):
         observation_type = 'vector'
         environment_name = "Banana_Linux/Banana.x86_64"
     # Initialize the simulator
-    env = UnityEnvironment(file_name=join(ENVIRONMENTS_DIR, environment_name))
+    # Environments running concurrently need distinct worker_ids, which offset their communication ports
+    env = UnityEnvironment(file_name=join(ENVIRONMENTS_DIR, environment_name), worker_id=worker_id)
     simulator = UnityEnvironmentSimulator(
         task_name='{}_banana_collector'.format(observation_type),
         env=env, seed=default_cfg["SEED"],
@@ -5,10 +5,9 @@ from agents.policies.td3_policy import TD3Policy
 from agents.models.components.noise import GaussianProcess
 from agents.memory.prioritized_memory import PrioritizedMemory
 from agents.models.components.mlp import MLP
-from agents.models.td3 import TD3Critic
+from agents.models.td3 import EnsembleCritic
 from tasks.reacher.solutions.utils import get_simulator, STATE_SIZE, ACTION_SIZE, BRAIN_NAME
 from tasks.reacher.solutions.ddpg import SOLUTIONS_CHECKPOINT_DIR
-from agents.models.components.critics import Critic
 from tools.lr_schedulers import DummyLRScheduler
 from tools.parameter_scheduler import ParameterScheduler
 import pickle
@@ -62,24 +61,15 @@ def get_agent(memory_):
             output_layer_initialization_fn=init_layer_within_range,
             activation_function=torch.nn.LeakyReLU()
         ),
-        critic_model_factory=lambda: TD3Critic(
-            critic_model_factory=lambda: Critic(
-                state_featurizer=MLP(
-                    layer_sizes=(STATE_SIZE, 256),
-                    dropout=DROPOUT,
-                    with_batchnorm=BATCHNORM,
-                    output_function=torch.nn.LeakyReLU(),
-                ),
-                output_module=MLP(
-                    layer_sizes=(256 + ACTION_SIZE, 128, 1),
-                    dropout=DROPOUT,
-                    with_batchnorm=BATCHNORM,
-                    activation_function=torch.nn.LeakyReLU(),
-                    output_layer_initialization_fn=init_layer_within_range,
-                ),
-                seed=SEED,
-            ),
-            seed=SEED
+        # Both TD3 critics are held as one ensemble, evaluated with a single batched matmul per layer
+        critic_model_factory=lambda: EnsembleCritic(
+            state_size=STATE_SIZE,
+            action_size=ACTION_SIZE,
+            hidden_layer_sizes=(256, 128),
+            num_heads=2,
+            activation_function=torch.nn.LeakyReLU(),
+            output_layer_initialization_fn=init_layer_within_range,
+            seed=SEED,
         ),
         actor_optimizer_factory=lambda params: torch.optim.Adam(params, lr=LR_ACTOR, weight_decay=ACTOR_WEIGHT_DECAY),
         critic_optimizer_factory=lambda params: torch.optim.Adam(params, lr=LR_CRITIC, weight_decay=CRITIC_WEIGHT_DECAY),
@@ -136,7 +126,7 @@ def step_agents_fn(brain_set: BrainSet, next_brain_environment: dict, t: int):
     for brain_name, brain_environment in next_brain_environment.items():
         agent = brain_set[brain_name].agents[0]
         for i in range(NUM_AGENTS):
-            action = brain_environment['actions'][0].value[i]
+            action = brain_environment['actions'].value[i]
             action = action[np.newaxis, ...]
 
             brain_agent_experience = Experience(
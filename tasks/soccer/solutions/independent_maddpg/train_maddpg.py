@@ -6,10 +6,10 @@ import torch.optim as optim
 from tools.rl_constants import Brain, BrainSet
 from tasks.soccer.solutions.utils import STRIKER_STATE_SIZE, GOALIE_STATE_SIZE, NUM_STRIKER_AGENTS, \
     get_simulator, NUM_GOALIE_AGENTS, GOALIE_ACTION_SIZE, STRIKER_ACTION_SIZE, GOALIE_ACTION_DISCRETE_RANGE,\
-    STRIKER_ACTION_DISCRETE_RANGE, STRIKER_BRAIN_NAME, GOALIE_BRAIN_NAME
+    STRIKER_ACTION_DISCRETE_RANGE, STRIKER_BRAIN_NAME, GOALIE_BRAIN_NAME, AGENT_LAYOUT
 from tasks.tennis.solutions.maddpg import SOLUTIONS_CHECKPOINT_DIR
 from tools.parameter_scheduler import ParameterScheduler
-from agents.memory.prioritized_memory import PrioritizedMemory
+from agents.memory.joint_memory import JointMemory
 
 from tools.rl_constants import RandomBrainAction
 from agents.maddpg_agent import MADDPGAgent, DummyMADDPGAgent
@@ -50,14 +50,13 @@ Blue: Agent 1
 
 if __name__ == '__main__':
 
-    memory_fn = lambda: PrioritizedMemory(
-        capacity=BUFFER_SIZE,
-        seed=SEED,
-        state_shape=(1,),
+    # Each time step is stored once for all agents, who sample it with their own priorities
+    joint_memory = JointMemory(capacity=BUFFER_SIZE, agent_layout=AGENT_LAYOUT, continuous_actions=False, seed=SEED)
+    memory_fn = lambda agent_id: lambda: joint_memory.prioritized_agent_memory(
+        agent_id,
         alpha_scheduler=ParameterScheduler(initial=0.6, lambda_fn=lambda i: 0.6 - 0.6 * i / NUM_EPISODES, final=0.),
         beta_scheduler=ParameterScheduler(initial=0.4, final=1,
                                           lambda_fn=lambda i: 0.4 + 0.6 * i / NUM_EPISODES),  # Anneal beta linearly
-        continuous_actions=False,
         min_priority=1e-9
     )
 
@@ -92,18 +91,7 @@ if __name__ == '__main__':
                 GOALIE_STATE_SIZE,
                 len(range(*GOALIE_ACTION_DISCRETE_RANGE)),
                 SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
             )
         else:
             goalie_agent = MADDPGAgent(
@@ -112,7 +100,7 @@ if __name__ == '__main__':
                 actor_factory=lambda: MLP(layer_sizes=(GOALIE_STATE_SIZE, 256, 128, len(range(*GOALIE_ACTION_DISCRETE_RANGE))), seed=SEED, output_function=SoftmaxSelection()),
                 critic_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=CRITIC_LR, weight_decay=1.e-5),
                 actor_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=ACTOR_LR),
-                memory_factory=memory_fn,
+                memory_factory=memory_fn(key),
                 seed=SEED,
                 batch_size=BATCH_SIZE,
                 tau=TAU,
@@ -132,18 +120,7 @@ if __name__ == '__main__':
                 STRIKER_STATE_SIZE,
                 len(range(*STRIKER_ACTION_DISCRETE_RANGE)),
                 SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
             )
         else:
             striker_agent = MADDPGAgent(
@@ -152,7 +129,7 @@ if __name__ == '__main__':
                 actor_factory=lambda: MLP(layer_sizes=(GOALIE_STATE_SIZE, 256, 128, len(range(*STRIKER_ACTION_DISCRETE_RANGE))), seed=SEED, output_function=SoftmaxSelection()),
                 critic_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=CRITIC_LR, weight_decay=1.e-5),
                 actor_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=ACTOR_LR),
-                memory_factory=memory_fn,
+                memory_factory=memory_fn(key),
                 seed=SEED,
                 batch_size=BATCH_SIZE,
                 tau=TAU,
@@ -206,18 +183,7 @@ if __name__ == '__main__':
                     continuous_action_range=None,
                     discrete_action_range=action_range
                 ),
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
                 matd3=TD3,
                 continuous_actions=False,
                 continuous_actions_clip_range=None
@@ -3,7 +3,7 @@ from os.path import join
 from tools.rl_constants import Brain, BrainSet
 from tasks.soccer.solutions.utils import STRIKER_STATE_SIZE, GOALIE_STATE_SIZE, NUM_STRIKER_AGENTS, \
     get_simulator, NUM_GOALIE_AGENTS, GOALIE_ACTION_SIZE, STRIKER_ACTION_SIZE, GOALIE_ACTION_DISCRETE_RANGE,\
-    STRIKER_ACTION_DISCRETE_RANGE, STRIKER_BRAIN_NAME, GOALIE_BRAIN_NAME
+    STRIKER_ACTION_DISCRETE_RANGE, STRIKER_BRAIN_NAME, GOALIE_BRAIN_NAME, AGENT_LAYOUT
 from tasks.soccer.solutions.mappo import SOLUTIONS_CHECKPOINT_DIR
 from agents.maddpg_agent import DummyMADDPGAgent
 from agents.mappo_agent import MAPPOAgent
@@ -63,18 +63,7 @@ def get_solution_brain_set():
                 GOALIE_STATE_SIZE,
                 len(range(*GOALIE_ACTION_DISCRETE_RANGE)),
                 seed=SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
             )
         else:
             goalie_agent = MAPPOAgent(
@@ -82,18 +71,7 @@ def get_solution_brain_set():
                 state_size=GOALIE_STATE_SIZE,
                 action_size=len(range(*GOALIE_ACTION_DISCRETE_RANGE)),
                 seed=SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
                 actor_critic_factory=lambda: MAPPO_Actor_Critic(
                     actor_model=MLP(
                         layer_sizes=params['goalie_actor_layer_size'],
@@ -144,18 +122,7 @@ def get_solution_brain_set():
                 STRIKER_STATE_SIZE,
                 len(range(*STRIKER_ACTION_DISCRETE_RANGE)),
                 SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
             )
         else:
             striker_agent = MAPPOAgent(
@@ -163,18 +130,7 @@ def get_solution_brain_set():
                 state_size=STRIKER_STATE_SIZE,
                 action_size=len(range(*STRIKER_ACTION_DISCRETE_RANGE)),
                 seed=SEED,
-                map_agent_to_state_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:336],
-                    "GoalieBrain_1": lambda t: t[:, 336:672],
-                    "StrikerBrain_0": lambda t: t[:, 672:1008],
-                    "StrikerBrain_1": lambda t: t[:, 1008:]
-                },
-                map_agent_to_action_slice={
-                    "GoalieBrain_0": lambda t: t[:, 0:1],
-                    "GoalieBrain_1": lambda t: t[:, 1:2],
-                    "StrikerBrain_0": lambda t: t[:, 2:3],
-                    "StrikerBrain_1": lambda t: t[:, 3:4]
-                },
+                agent_layout=AGENT_LAYOUT,
                 actor_critic_factory=lambda: MAPPO_Actor_Critic(
                     actor_model=MLP(
                         layer_sizes=params['striker_actor_layer_size'],
@@ -251,7 +207,7 @@ def episode_reward_fn(brain_episode_scores):
 def end_of_episode_score_display_fn(i_episode, episode_aggregated_score, scores):
     return '\rEpisode {}\t AI Team wins {}/{} previous games'.format(
         i_episode,
-        sum(scores.sliding_scores),
+        int(round(scores.get_sum_sliding_scores())),
         len(scores.sliding_scores)
     )
 
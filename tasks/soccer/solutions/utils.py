@@ -1,6 +1,7 @@
 from unityagents import UnityEnvironment
 from simulation.unity_environment import UnityEnvironmentSimulator
 from os.path import join, dirname
+from tools.agent_layout import AgentLayout
 
 
 ENVIRONMENTS_DIR = join(dirname(dirname(__file__)), 'environments')
@@ -16,6 +17,12 @@ GOALIE_BRAIN_NAME = 'GoalieBrain'
 STRIKER_BRAIN_NAME = 'StrikerBrain'
 SEED = 0
 
+# Order of the agents' blocks in the joint states and actions
+AGENT_LAYOUT = AgentLayout.from_brains([
+    (GOALIE_BRAIN_NAME, NUM_GOALIE_AGENTS, GOALIE_STATE_SIZE, GOALIE_ACTION_SIZE),
+    (STRIKER_BRAIN_NAME, NUM_STRIKER_AGENTS, STRIKER_STATE_SIZE, STRIKER_ACTION_SIZE),
+])
+
 
 def get_simulator():
     observation_type = 'vector'
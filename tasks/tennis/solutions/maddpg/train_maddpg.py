@@ -4,24 +4,31 @@ import numpy as np
 import torch
 import torch.optim as optim
 from tools.rl_constants import Brain, BrainSet
-from tasks.tennis.solutions.utils import STATE_SIZE, ACTION_SIZE, BRAIN_NAME, get_simulator
+from tasks.tennis.solutions.utils import STATE_SIZE, ACTION_SIZE, NUM_AGENTS, BRAIN_NAME, AGENT_LAYOUT, get_simulator
 from tasks.tennis.solutions.maddpg import SOLUTIONS_CHECKPOINT_DIR
 from agents.maddpg_agent import MADDPGAgent
-from agents.memory.memory import MemoryStreams
+from agents.maddpg_learner import MADDPGLearner
+from agents.memory.memory import Memory, MemoryStreams
 
 from agents.models.components.mlp import MLP
+from agents.models.components.grouped import GroupedMLP
 from agents.models.components.critics import MACritic
 from tools.layer_initializations import init_layer_inverse_root_fan_in, init_layer_within_range, get_init_layer_within_rage
 from simulation.utils import multi_agent_step_agents_fn, multi_agent_step_episode_agents_fn
 from agents.policies.independent_maddpg_policy import IndependentMADDPGPolicy
-from agents.memory.prioritized_memory import PrioritizedMemory
+from agents.memory.joint_memory import JointMemory
 from tools.parameter_scheduler import ParameterScheduler
 from tools.rl_constants import RandomBrainAction
 from agents.models.components.noise import GaussianNoise
 from agents.models.components.misc import BoundVectorNorm
-from agents.models.td3 import MATD3Critic
-
-SAVE_TAG = 'independent_madtd3'
+from agents.models.td3 import MAEnsembleCritic
+
+# Each agent is an independent MATD3 MADDPGAgent, the recipe that solved the task. Optionally, the agents are trained
+# with a single MADDPGLearner instead, updating both agents' grouped actors and critics in one batched pass. This is
+# a different recipe (Tanh actors without batchnorm or dropout, single critics, uniform replay), saved under its own
+# tag, which has not been tuned to solve the task
+CENTRALIZED_LEARNER: bool = False
+SAVE_TAG = 'centralized_maddpg' if CENTRALIZED_LEARNER else 'independent_madtd3'
 ACTOR_CHECKPOINT_FN = lambda brain_name, agent_num: join(SOLUTIONS_CHECKPOINT_DIR, f'{brain_name}_agent_{agent_num}_{SAVE_TAG}_actor_checkpoint.pth')
 CRITIC_CHECKPOINT_FN = lambda brain_name, agent_num: join(SOLUTIONS_CHECKPOINT_DIR, f'{brain_name}_agent_{agent_num}_{SAVE_TAG}_critic_checkpoint.pth')
 TRAINING_SCORES_FIGURE_SAVE_PATH_FN = lambda: join(SOLUTIONS_CHECKPOINT_DIR, f'{SAVE_TAG}_training_scores.png')
@@ -44,7 +51,51 @@ shared_memory = MemoryStreams(stream_ids=["TennisBrain_0", "TennisBrain_1"], cap
                               seed=SEED)
 
 
+def get_centralized_solution_brain_set():
+    """ Both agents are views of one MADDPGLearner, whose grouped models hold one MLP per agent
+
+    Grouped models do not support batchnorm or dropout, and the critics are single (not twin MATD3) critics
+    """
+    learner = MADDPGLearner(
+        agent_layout=AGENT_LAYOUT,
+        actor_factory=lambda: GroupedMLP(
+            num_groups=NUM_AGENTS,
+            layer_sizes=(STATE_SIZE, 400, 300, ACTION_SIZE),
+            output_function=torch.nn.Tanh(),
+            output_layer_initialization_fn=init_layer_within_range,
+            seed=SEED
+        ),
+        critic_factory=lambda: GroupedMLP(
+            num_groups=NUM_AGENTS,
+            layer_sizes=(NUM_AGENTS * (STATE_SIZE + ACTION_SIZE), 400, 300, 1),
+            output_layer_initialization_fn=get_init_layer_within_rage(limit_range=(-3e-4, 3e-4)),
+            seed=SEED
+        ),
+        actor_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=ACTOR_LR),
+        critic_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=CRITIC_LR, weight_decay=1.e-5),
+        memory_factory=lambda: Memory(BUFFER_SIZE, SEED),
+        noise_factory=lambda: GaussianNoise(),
+        batch_size=BATCH_SIZE,
+        seed=SEED,
+    )
+
+    tennis_brain = Brain(
+        brain_name=BRAIN_NAME,
+        action_size=ACTION_SIZE,
+        state_shape=STATE_SIZE,
+        observation_type='vector',
+        agents=learner.agents,
+    )
+    return BrainSet(brains=[tennis_brain])
+
+
 def get_solution_brain_set():
+    if CENTRALIZED_LEARNER:
+        return get_centralized_solution_brain_set()
+    return get_independent_solution_brain_set()
+
+
+def get_independent_solution_brain_set():
     tennis_agents = []
 
     state_featurizer = MLP(
@@ -59,24 +110,25 @@ def get_solution_brain_set():
         output_layer_initialization_fn=get_init_layer_within_rage(limit_range=(-3e-4, 3e-4))
     )
 
-    memory_factory = lambda: PrioritizedMemory(
-        capacity=BUFFER_SIZE,
-        state_shape=(1, STATE_SIZE),
+    # Each time step is stored once for both agents, who sample it with their own priorities
+    joint_memory = JointMemory(capacity=BUFFER_SIZE, agent_layout=AGENT_LAYOUT, continuous_actions=True, seed=SEED)
+    memory_factory = lambda agent_id: lambda: joint_memory.prioritized_agent_memory(
+        agent_id,
         alpha_scheduler=ParameterScheduler(initial=0.6, lambda_fn=lambda i: 0.6 - 0.6 * i / NUM_EPISODES, final=0.),
         beta_scheduler=ParameterScheduler(initial=0.4, final=1,
                                           lambda_fn=lambda i: 0.4 + 0.6 * i / NUM_EPISODES),  # Anneal beta linearly
-        seed=SEED,
-        continuous_actions=True,
         min_priority=1e-4
     )
 
     if MATD3:
-        critic_factory = lambda: MATD3Critic(
-            critic_model_factory=lambda: MACritic(
-                state_featurizer=state_featurizer,
-                output_module=output_module,
-                seed=SEED,
-            ),
+        # Both TD3 critics are held as one ensemble, evaluated with a single batched matmul per layer. The
+        # ensemble's input is the joint state and action, and it does not support batchnorm
+        critic_factory = lambda: MAEnsembleCritic(
+            state_size=NUM_AGENTS * STATE_SIZE,
+            action_size=NUM_AGENTS * ACTION_SIZE,
+            hidden_layer_sizes=(400, 300),
+            num_heads=2,
+            output_layer_initialization_fn=get_init_layer_within_rage(limit_range=(-3e-4, 3e-4)),
             seed=SEED
         )
     else:
@@ -104,7 +156,7 @@ def get_solution_brain_set():
             ),
             critic_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=CRITIC_LR, weight_decay=1.e-5),
             actor_optimizer_factory=lambda parameters: optim.Adam(parameters, lr=ACTOR_LR),
-            memory_factory=memory_factory,
+            memory_factory=memory_factory(key),
             seed=0,
             batch_size=BATCH_SIZE,
             homogeneous_agents=False,
@@ -138,14 +190,7 @@ def get_solution_brain_set():
                 continuous_actions=True,
                 continuous_action_range=(-1, 1),
             ),
-            map_agent_to_state_slice={
-                "TennisBrain_0": lambda t: t[:, 0:24],
-                "TennisBrain_1": lambda t: t[:, 24:48]
-            },
-            map_agent_to_action_slice={
-                "TennisBrain_0": lambda t: t[:, 0:2],
-                "TennisBrain_1": lambda t: t[:, 2:4]
-            },
+            agent_layout=AGENT_LAYOUT,
             matd3=MATD3,
             gaussian_noise_factory=lambda: GaussianNoise(),
             continuous_actions=True,
@@ -180,6 +225,12 @@ if __name__ == '__main__':
 
     if training_scores.get_mean_sliding_scores() > SOLVE_SCORE:
         for brain_name, brain in brain_set:
+            if CENTRALIZED_LEARNER:
+                # The grouped models hold the weights of all agents
+                learner = brain.agents[0].learner
+                torch.save(learner.online_actor.state_dict(), ACTOR_CHECKPOINT_FN(brain_name, 'all'))
+                torch.save(learner.online_critic.state_dict(), CRITIC_CHECKPOINT_FN(brain_name, 'all'))
+                continue
             for agent_num, agent in enumerate(brain.agents):
                 torch.save(agent.online_actor.state_dict(), ACTOR_CHECKPOINT_FN(brain_name, agent_num))
                 torch.save(agent.online_critic.state_dict(), CRITIC_CHECKPOINT_FN(brain_name, agent_num))
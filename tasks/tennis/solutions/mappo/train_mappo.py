@@ -2,7 +2,7 @@ import pickle
 import numpy as np
 from os.path import join
 from tools.rl_constants import Brain, BrainSet
-from tasks.tennis.solutions.utils import get_simulator, STATE_SIZE, ACTION_SIZE
+from tasks.tennis.solutions.utils import get_simulator, STATE_SIZE, ACTION_SIZE, AGENT_LAYOUT
 from tasks.tennis.solutions.mappo import SOLUTIONS_CHECKPOINT_DIR
 from agents.mappo_agent import MAPPOAgent
 from agents.models.ppo import MAPPO_Actor_Critic
@@ -40,14 +40,7 @@ def get_solution_brain_set():
             agent_id=key,
             state_size=STATE_SIZE,
             action_size=ACTION_SIZE,
-            map_agent_to_state_slice={
-                "TennisBrain_0": lambda t: t[:, 0:24],
-                "TennisBrain_1": lambda t: t[:, 24:48]
-            },
-            map_agent_to_action_slice={
-                "TennisBrain_0": lambda t: t[:, 0:2],
-                "TennisBrain_1": lambda t: t[:, 2:4]
-            },
+            agent_layout=AGENT_LAYOUT,
             actor_critic_factory=lambda: MAPPO_Actor_Critic(
                 actor_model=MLP(
                     layer_sizes=(STATE_SIZE, 256, 128, ACTION_SIZE),
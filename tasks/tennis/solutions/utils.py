@@ -2,6 +2,7 @@ import os
 from unityagents import UnityEnvironment
 from simulation.unity_environment import UnityEnvironmentSimulator
 from os.path import join, dirname
+from tools.agent_layout import AgentLayout
 
 
 ENVIRONMENTS_DIR = join(dirname(dirname(__file__)), 'environments')
@@ -12,6 +13,9 @@ NUM_AGENTS = 2
 SEED = 0
 BRAIN_NAME = 'TennisBrain'
 
+# Order of the agents' blocks in the joint states and actions
+AGENT_LAYOUT = AgentLayout.from_brains([(BRAIN_NAME, NUM_AGENTS, STATE_SIZE, ACTION_SIZE)])
+
 
 def get_simulator():
     observation_type = 'vector'
@@ -0,0 +1,48 @@
+import torch
+from agents.policies.categorical_policy import CategoricalDQNPolicy, device
+from tools.benchmarks import reference_projection
+
+NUM_ATOMS = 11
+GAMMA = 0.9
+
+
+def make_batch(batch_size: int, seed: int = 0) -> tuple:
+    generator = torch.Generator().manual_seed(seed)
+    next_dist = torch.softmax(torch.randn(batch_size, NUM_ATOMS, generator=generator), dim=1).to(device)
+    # Rewards beyond the support are clamped onto its edges
+    rewards = (torch.randn(batch_size, 1, generator=generator) * 8).to(device)
+    dones = (torch.rand(batch_size, 1, generator=generator) < 0.3).float().to(device)
+    return next_dist, rewards, dones
+
+
+def test_project_matches_two_pass_index_add():
+    policy = CategoricalDQNPolicy(action_size=2, num_atoms=NUM_ATOMS, v_min=-5, v_max=5)
+    for batch_size in (1, 7, 32):
+        next_dist, rewards, dones = make_batch(batch_size, seed=batch_size)
+        expected = reference_projection(policy, next_dist, rewards, dones, GAMMA)
+        projected = policy.project(next_dist, rewards, dones, GAMMA)
+        assert projected.shape == (batch_size, NUM_ATOMS)
+        assert torch.allclose(projected, expected, atol=1e-6)
+
+
+def test_project_matches_two_pass_index_add_on_atoms():
+    # Targets landing exactly on an atom, where the lower and upper atoms coincide
+    policy = CategoricalDQNPolicy(action_size=2, num_atoms=NUM_ATOMS, v_min=-5, v_max=5)
+    next_dist, _, _ = make_batch(4)
+    rewards = torch.tensor([[-5.], [0.], [2.], [5.]], device=device)
+    dones = torch.ones(4, 1, device=device)
+    expected = reference_projection(policy, next_dist, rewards, dones, GAMMA)
+    assert torch.allclose(policy.project(next_dist, rewards, dones, GAMMA), expected, atol=1e-6)
+
+
+def test_project_reuses_its_output_buffer():
+    policy = CategoricalDQNPolicy(action_size=2, num_atoms=NUM_ATOMS, v_min=-5, v_max=5)
+    first_batch = make_batch(8, seed=1)
+    second_batch = make_batch(8, seed=2)
+    first = policy.project(*first_batch, GAMMA)
+    first_copy = first.clone()
+    second = policy.project(*second_batch, GAMMA)
+    # The first result is overwritten by the second call, which is why callers must consume it first
+    assert first.data_ptr() == second.data_ptr()
+    assert torch.allclose(first_copy, reference_projection(policy, *first_batch, GAMMA), atol=1e-6)
+    assert torch.allclose(second, reference_projection(policy, *second_batch, GAMMA), atol=1e-6)
@@ -0,0 +1,151 @@
+import copy
+import torch
+import torch.optim as optim
+from agents.maddpg_agent import MADDPGAgent
+from agents.maddpg_learner import MADDPGLearner
+from agents.memory.memory import Memory
+from agents.models.components.grouped import GroupedMLP
+from agents.policies.independent_maddpg_policy import IndependentMADDPGPolicy
+from tools.agent_layout import AgentLayout
+from tools.rl_constants import BrainSet, ExperienceBatch, RandomBrainAction
+
+NUM_AGENTS = 2
+STATE_SIZE = 3
+ACTION_SIZE = 2
+BATCH_SIZE = 16
+LR = 0.1
+
+
+class GroupActor(torch.nn.Module):
+    """ A single agent's actor, as a view of one group of a grouped actor """
+    def __init__(self, grouped: GroupedMLP, group: int):
+        super().__init__()
+        self.grouped = grouped
+        self.group = group
+
+    def forward(self, state):
+        return self.grouped.forward_group(state, self.group)
+
+
+class GroupCritic(torch.nn.Module):
+    """ A single agent's MACritic, as a view of one group of a grouped critic """
+    def __init__(self, grouped: GroupedMLP, group: int):
+        super().__init__()
+        self.grouped = grouped
+        self.group = group
+
+    def forward(self, agent_state, other_agent_states, other_agent_actions, action):
+        # The learner's critics see the agent's blocks first: own state, other states, own action, other actions
+        x = torch.cat((agent_state, other_agent_states, action.float(), other_agent_actions.float()), dim=1)
+        return self.grouped.forward_group(x, self.group)
+
+
+def get_models(layout: AgentLayout):
+    torch.manual_seed(0)
+    actor = GroupedMLP(NUM_AGENTS, (STATE_SIZE, 8, ACTION_SIZE), output_function=torch.nn.Tanh())
+    critic = GroupedMLP(NUM_AGENTS, (NUM_AGENTS * (STATE_SIZE + ACTION_SIZE), 8, 1))
+    return actor, critic
+
+
+def get_learner(layout: AgentLayout, actor: GroupedMLP, critic: GroupedMLP) -> MADDPGLearner:
+    return MADDPGLearner(
+        agent_layout=layout,
+        actor_factory=lambda: copy.deepcopy(actor),
+        critic_factory=lambda: copy.deepcopy(critic),
+        actor_optimizer_factory=lambda parameters: optim.SGD(parameters, lr=LR),
+        critic_optimizer_factory=lambda parameters: optim.SGD(parameters, lr=LR),
+        memory_factory=lambda: Memory(10, 0),
+        policy_update_frequency=1,
+        critic_grad_norm_clip=0.5,
+    )
+
+
+def get_agents(layout: AgentLayout, actor: GroupedMLP, critic: GroupedMLP) -> list:
+    """ One MADDPGAgent per group, whose policy uses the other agents' initial actors as the learner does """
+    # The learner computes the other agents' actions before any actor update, so these reference actors are frozen
+    reference_actor = copy.deepcopy(actor)
+    agents = []
+    for i, agent_id in enumerate(layout.agent_ids):
+        policy = IndependentMADDPGPolicy(
+            agent_id=agent_id,
+            brain_set=BrainSet(brains=[]),
+            action_dim=ACTION_SIZE,
+            agent_layout=layout,
+            random_brain_action_factory=lambda: RandomBrainAction(ACTION_SIZE, 1),
+        )
+        policy.online_actor_map = {k: GroupActor(reference_actor, j) for j, k in enumerate(layout.agent_ids)}
+        policy.target_actor_map = policy.online_actor_map
+        agents.append(MADDPGAgent(
+            agent_id,
+            policy,
+            STATE_SIZE,
+            ACTION_SIZE,
+            seed=None,
+            critic_factory=lambda i=i: GroupCritic(copy.deepcopy(critic), i),
+            actor_factory=lambda i=i: GroupActor(copy.deepcopy(actor), i),
+            critic_optimizer_factory=lambda parameters: optim.SGD(parameters, lr=LR),
+            actor_optimizer_factory=lambda parameters: optim.SGD(parameters, lr=LR),
+            memory_factory=lambda: Memory(10, 0),
+            policy_update_frequency=1,
+            critic_grad_norm_clip=0.5,
+        ))
+    return agents
+
+
+def get_joint_batch(layout: AgentLayout) -> ExperienceBatch:
+    torch.manual_seed(1)
+    return ExperienceBatch(
+        states=torch.randn(BATCH_SIZE, NUM_AGENTS * STATE_SIZE),
+        actions=torch.rand(BATCH_SIZE, NUM_AGENTS * ACTION_SIZE) * 2 - 1,
+        rewards=torch.randn(BATCH_SIZE, NUM_AGENTS),
+        dones=(torch.rand(BATCH_SIZE, NUM_AGENTS) < 0.2).float(),
+        next_states=torch.randn(BATCH_SIZE, NUM_AGENTS * STATE_SIZE),
+    )
+
+
+def get_agent_batch(layout: AgentLayout, joint_batch: ExperienceBatch, i: int) -> ExperienceBatch:
+    agent_id = layout.agent_ids[i]
+    return ExperienceBatch(
+        states=layout.agent_attributes(joint_batch.states, agent_id, 'state'),
+        actions=layout.agent_attributes(joint_batch.actions, agent_id, 'action'),
+        rewards=joint_batch.rewards[:, i:i + 1],
+        dones=joint_batch.dones[:, i:i + 1],
+        next_states=layout.agent_attributes(joint_batch.next_states, agent_id, 'state'),
+        joint_states=joint_batch.states,
+        joint_actions=joint_batch.actions,
+        joint_next_states=joint_batch.next_states,
+    )
+
+
+def test_learner_matches_per_agent_updates():
+    layout = AgentLayout(["agent_{}".format(i) for i in range(NUM_AGENTS)], STATE_SIZE, ACTION_SIZE)
+    actor, critic = get_models(layout)
+    learner = get_learner(layout, actor, critic)
+    agents = get_agents(layout, actor, critic)
+    joint_batch = get_joint_batch(layout)
+
+    critic_loss, critic_errors, actor_loss, actor_errors = learner.learn(joint_batch)
+
+    agent_critic_losses, agent_actor_losses = [], []
+    for i, agent in enumerate(agents):
+        agent_critic_loss, agent_critic_errors, agent_actor_loss, agent_actor_errors = agent.learn(get_agent_batch(layout, joint_batch, i))
+        agent_critic_losses.append(agent_critic_loss)
+        agent_actor_losses.append(agent_actor_loss)
+
+        assert torch.allclose(critic_errors[i], agent_critic_errors, atol=1e-6)
+        assert torch.allclose(actor_errors[i], agent_actor_errors, atol=1e-6)
+
+        # Gradients and updated weights of the agent's group
+        for learner_models, agent_model in [
+            ((learner.online_critic, learner.target_critic), (agent.online_critic.grouped, agent.target_critic.grouped)),
+            ((learner.online_actor, learner.target_actor), (agent.online_actor.grouped, agent.target_actor.grouped)),
+        ]:
+            for (name, learner_param), agent_param in zip(learner_models[0].named_parameters(), agent_model[0].parameters()):
+                assert torch.allclose(learner_param.grad[i], agent_param.grad[i], atol=1e-6), name
+                assert torch.allclose(learner_param[i], agent_param[i], atol=1e-6), name
+            for learner_param, agent_param in zip(learner_models[1].parameters(), agent_model[1].parameters()):
+                assert torch.allclose(learner_param[i], agent_param[i], atol=1e-6)
+
+    # The learner optimizes the sum of the agents' losses
+    assert torch.allclose(critic_loss, torch.stack(agent_critic_losses).sum(), atol=1e-6)
+    assert torch.allclose(actor_loss, torch.stack(agent_actor_losses).sum(), atol=1e-6)
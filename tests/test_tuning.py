@@ -0,0 +1,182 @@
+import pytest
+
+# The tuning module requires Ax, and Unity through the simulator it runs trials in
+pytest.importorskip('ax')
+pytest.importorskip('unityagents')
+
+from simulation import tuning
+from simulation.tuning import MedianStoppingScheduler, ParallelTuningRunner, SuccessiveHalvingScheduler, TrialStopCriteria
+from tools.scores import Scores
+from tools.tuning_results import TuningResultsStore
+
+TRIAL_EPISODES = 100
+
+
+def test_successive_halving_rungs():
+    scheduler = SuccessiveHalvingScheduler(min_episodes=10, reduction_factor=3)
+    assert [e for e in range(1, 300) if scheduler.is_rung(e)] == [10, 30, 90, 270]
+    assert scheduler.report_frequency == 10
+
+
+def test_successive_halving_keeps_the_top_fraction_of_each_rung():
+    scheduler = SuccessiveHalvingScheduler(min_episodes=10, reduction_factor=3)
+    # Fewer trials than the reduction factor have reached the rung: none are ranked
+    assert not scheduler.report(0, 10, 1.)
+    assert not scheduler.report(1, 10, 2.)
+    # 3 scores at the rung, ceil(3 / 3) = 1 continues: only the best
+    assert scheduler.report(2, 10, 1.5)
+    assert not scheduler.report(3, 10, 3.)
+    # 5 scores, ceil(5 / 3) = 2 continue: the cutoff is the second best score, 2.
+    assert not scheduler.report(4, 10, 2.)
+    # 6 scores, ceil(6 / 3) = 2 continue
+    assert scheduler.report(5, 10, 1.9)
+
+
+def test_successive_halving_only_stops_at_rungs():
+    scheduler = SuccessiveHalvingScheduler(min_episodes=10, reduction_factor=2)
+    for trial_index, score in enumerate((5., 4., 3.)):
+        scheduler.report(trial_index, 20, score)
+    assert scheduler.report(3, 20, 0.)
+    for trial_index, score in enumerate((5., 4., 3.)):
+        scheduler.report(trial_index, 30, score)
+    assert not scheduler.report(3, 30, 0.)
+
+
+def test_successive_halving_validates_reduction_factor():
+    with pytest.raises(ValueError):
+        SuccessiveHalvingScheduler(reduction_factor=1)
+
+
+def test_median_stopping_grace_period():
+    scheduler = MedianStoppingScheduler(grace_episodes=100, min_trials=1, report_frequency=50)
+    scheduler.report(0, 50, 10.)
+    assert not scheduler.report(1, 50, 0.)
+    scheduler.report(0, 100, 10.)
+    assert scheduler.report(1, 100, 0.)
+
+
+def test_median_stopping_min_trials():
+    scheduler = MedianStoppingScheduler(grace_episodes=0, min_trials=3, report_frequency=50)
+    scheduler.report(0, 50, 10.)
+    scheduler.report(1, 50, 20.)
+    # Only 2 other trials to compare against
+    assert not scheduler.report(2, 50, 0.)
+    # 3 other trials, of median 10.
+    assert scheduler.report(3, 50, 5.)
+    assert not scheduler.report(4, 50, 10.)
+
+
+def test_median_stopping_ignores_own_score():
+    scheduler = MedianStoppingScheduler(grace_episodes=0, min_trials=2, report_frequency=50)
+    scheduler.report(0, 50, 1.)
+    scheduler.report(1, 50, 3.)
+    # Below the median of the others, 2., although it is the median of all 3 scores
+    assert scheduler.report(2, 50, 1.8)
+
+
+class RecordingScheduler:
+    def __init__(self, stop: bool):
+        self.stop = stop
+        self.reports = []
+
+    def report(self, trial_index: int, episode: int, score: float) -> bool:
+        self.reports.append((trial_index, episode, score))
+        return self.stop
+
+
+def test_trial_stop_criteria_reports_every_report_frequency_episodes():
+    scheduler = RecordingScheduler(stop=True)
+    stop_criteria = TrialStopCriteria(scheduler, trial_index=7, report_frequency=10)
+    scores = Scores(window_size=2)
+    stops = []
+    for i_episode in range(1, 21):
+        scores.add(float(i_episode))
+        stops.append(stop_criteria(i_episode, scores))
+    assert stops == [i_episode % 10 == 0 for i_episode in range(1, 21)]
+    # The mean over the sliding window of the last 2 episodes
+    assert scheduler.reports == [(7, 10, 9.5), (7, 20, 19.5)]
+
+
+def test_trial_stop_criteria_follows_scheduler():
+    scores = Scores(window_size=2)
+    scores.add(1.)
+    assert not TrialStopCriteria(RecordingScheduler(stop=False), trial_index=0, report_frequency=1)(1, scores)
+
+
+class SequentialAxClient:
+    """ Generates trials with consecutive indexes, recording the completed trials """
+    def __init__(self, *args, **kwargs):
+        self.num_generated = 0
+        self.completed = {}
+
+    def create_experiment(self, *args, **kwargs):
+        pass
+
+    def get_next_trial(self):
+        trial_index = self.num_generated
+        self.num_generated += 1
+        return {'trial': trial_index}, trial_index
+
+    def complete_trial(self, trial_index: int, raw_data: float):
+        self.completed[trial_index] = raw_data
+
+    def get_best_parameters(self):
+        best_trial = max(self.completed, key=self.completed.get)
+        return {'trial': best_trial}, None
+
+
+class TrialSimulator:
+    def close(self):
+        pass
+
+
+def make_simulator(worker_id: int) -> TrialSimulator:
+    return TrialSimulator()
+
+
+def train_trial(simulator, params: dict, stop_criteria) -> tuple:
+    return float(params['trial']), {'n_train_episodes': TRIAL_EPISODES, 'input_params': params}
+
+
+def train_failing_trial(simulator, params: dict, stop_criteria) -> tuple:
+    if params['trial'] == 1:
+        raise RuntimeError("Trial diverged")
+    return train_trial(simulator, params, stop_criteria)
+
+
+@pytest.fixture
+def ax_clients(monkeypatch) -> list:
+    clients = []
+
+    def make_ax_client(*args, **kwargs):
+        clients.append(SequentialAxClient())
+        return clients[-1]
+
+    monkeypatch.setattr(tuning, 'AxClient', make_ax_client)
+    return clients
+
+
+def test_runner_stops_requesting_trials_once_the_episode_budget_is_used(tmp_path, ax_clients):
+    store = TuningResultsStore(str(tmp_path))
+    runner = ParallelTuningRunner(train_trial, make_simulator, store, num_workers=1)
+    # With a single worker, each trial completes before the next is requested: trials are requested while
+    # fewer than 250 episodes have been trained, ie. after 0, 100 and 200 episodes
+    best_parameters, ax_client = runner.run([], total_trials=10, episode_budget=250)
+    assert sorted(ax_client.completed) == [0, 1, 2]
+    assert best_parameters == {'trial': 2}
+    assert len(store.query()) == 3
+
+
+def test_runner_stops_at_total_trials_within_the_budget(tmp_path, ax_clients):
+    runner = ParallelTuningRunner(train_trial, make_simulator, TuningResultsStore(str(tmp_path)), num_workers=2)
+    _, ax_client = runner.run([], total_trials=3, episode_budget=10 * TRIAL_EPISODES)
+    assert sorted(ax_client.completed) == [0, 1, 2]
+
+
+def test_runner_failed_trials_use_no_budget(tmp_path, ax_clients):
+    store = TuningResultsStore(str(tmp_path))
+    runner = ParallelTuningRunner(train_failing_trial, make_simulator, store, num_workers=1, failed_performance=-1.)
+    _, ax_client = runner.run([], total_trials=10, episode_budget=250)
+    # The failed trial 1 trains no episodes, so a fourth trial is requested
+    assert ax_client.completed == {0: 0., 1: -1., 2: 2., 3: 3.}
+    assert sorted(trial['trial_index'] for trial in store.query()) == [0, 2, 3]
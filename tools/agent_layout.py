@@ -0,0 +1,130 @@
+import numpy as np
+import torch
+from typing import List, Dict, Hashable, Sequence, Tuple, Union, Optional
+
+
+class AgentLayout:
+    """ Layout of the per-agent blocks within the joint state and joint action tensors
+
+    The layout is declared once, and the column indices selecting an agent's block, or the blocks of all other agents,
+    are precomputed so that each extraction is a single index_select instead of a loop over slicing functions
+    followed by a concatenation. Index tensors are cached per device
+    """
+    ATTRIBUTES = ('state', 'action')
+
+    def __init__(self, agent_ids: Sequence[Hashable], state_sizes: Union[int, Sequence[int]], action_sizes: Union[int, Sequence[int]]):
+        """
+        :param agent_ids: Identifiers of the agents, in the order their blocks appear in the joint tensors
+        :param state_sizes: The state size of each agent, or a single size shared by all agents
+        :param action_sizes: The action size of each agent, or a single size shared by all agents
+        """
+        self.agent_ids = list(agent_ids)
+        if len(set(self.agent_ids)) != len(self.agent_ids):
+            raise ValueError("Agent ids must be unique, found: {}".format(self.agent_ids))
+
+        self.sizes = {
+            'state': self._expand_sizes(state_sizes),
+            'action': self._expand_sizes(action_sizes),
+        }
+        self.indices = {attribute: self._build_indices(self.sizes[attribute]) for attribute in self.ATTRIBUTES}
+        self.device_indices = {}
+
+    @classmethod
+    def from_brains(cls, brains: List[Tuple[str, int, int, int]]):
+        """ Build the layout from (brain_name, num_agents, state_size, action_size) tuples in joint order
+
+        Agent ids are of the form "<brain_name>_<agent_number>"
+        """
+        agent_ids, state_sizes, action_sizes = [], [], []
+        for brain_name, num_agents, state_size, action_size in brains:
+            for agent_number in range(num_agents):
+                agent_ids.append("{}_{}".format(brain_name, agent_number))
+                state_sizes.append(state_size)
+                action_sizes.append(action_size)
+        return cls(agent_ids, state_sizes, action_sizes)
+
+    def _expand_sizes(self, sizes: Union[int, Sequence[int]]) -> Dict[Hashable, int]:
+        if isinstance(sizes, int):
+            sizes = [sizes] * len(self.agent_ids)
+        if len(sizes) != len(self.agent_ids):
+            raise ValueError("Expected {} sizes, found {}".format(len(self.agent_ids), len(sizes)))
+        return dict(zip(self.agent_ids, sizes))
+
+    def _build_indices(self, sizes: Dict[Hashable, int]) -> Dict[str, Dict[Hashable, torch.LongTensor]]:
+        offsets = np.cumsum([0] + [sizes[agent_id] for agent_id in self.agent_ids])
+        agent = {
+            agent_id: torch.arange(int(offsets[i]), int(offsets[i + 1]), dtype=torch.long)
+            for i, agent_id in enumerate(self.agent_ids)
+        }
+        others = {}
+        for agent_id in self.agent_ids:
+            other_indices = [agent[other_id] for other_id in self.other_agent_ids(agent_id)]
+            others[agent_id] = torch.cat(other_indices) if other_indices else torch.zeros(0, dtype=torch.long)
+        # For every agent: its own block followed by the other agents' blocks, flattened over all agents
+        agent_centric = torch.cat([torch.cat((agent[agent_id], others[agent_id])) for agent_id in self.agent_ids])
+        return {'agent': agent, 'others': others, 'agent_centric': {None: agent_centric}}
+
+    def _get_index(self, attribute: str, which: str, agent_id: Optional[Hashable], device_: torch.device) -> torch.LongTensor:
+        key = (attribute, which, agent_id, str(device_))
+        if key not in self.device_indices:
+            if attribute not in self.indices:
+                raise ValueError("Invalid attribute: {}, expected one of {}".format(attribute, self.ATTRIBUTES))
+            self.device_indices[key] = self.indices[attribute][which][agent_id].to(device_)
+        return self.device_indices[key]
+
+    @property
+    def num_agents(self) -> int:
+        return len(self.agent_ids)
+
+    def other_agent_ids(self, agent_id: Hashable) -> List[Hashable]:
+        if agent_id not in self.sizes['state']:
+            raise KeyError("Unknown agent id: {}".format(agent_id))
+        return [other_id for other_id in self.agent_ids if other_id != agent_id]
+
+    def agent_attributes(self, x: torch.Tensor, agent_id: Hashable, attribute: str = 'state') -> torch.Tensor:
+        """ Extract the agent's block from a joint tensor of shape (batch, joint_size)
+
+        :param x: Joint states or joint actions
+        :param agent_id: The agent to extract
+        :param attribute: Either 'state' or 'action'
+        :return: Tensor of shape (batch, agent_size)
+        """
+        return x.index_select(1, self._get_index(attribute, 'agent', agent_id, x.device))
+
+    def other_agent_attributes(self, x: torch.Tensor, agent_id: Hashable, attribute: str = 'state', flatten: bool = True) -> torch.Tensor:
+        """ Extract the blocks of all other agents from a joint tensor of shape (batch, joint_size)
+
+        :param x: Joint states or joint actions
+        :param agent_id: The agent whose blocks are excluded
+        :param attribute: Either 'state' or 'action'
+        :param flatten: If True return shape (batch, sum of other agent sizes), otherwise
+            (batch, num_other_agents, size), which requires all other agents to share the same size
+        :return: Tensor of other agent attributes
+        """
+        output = x.index_select(1, self._get_index(attribute, 'others', agent_id, x.device))
+        if flatten:
+            return output
+        sizes = {self.sizes[attribute][other_id] for other_id in self.other_agent_ids(agent_id)}
+        if len(sizes) > 1:
+            raise ValueError("Other agents must share the same {} size to stack them, found {}".format(attribute, sizes))
+        return output.view(x.shape[0], self.num_agents - 1, -1)
+
+    def agent_centric_attributes(self, x: torch.Tensor, attribute: str = 'state') -> torch.Tensor:
+        """ Reorder a joint tensor from the point of view of every agent at once
+
+        :param x: Joint states or joint actions of shape (batch, joint_size)
+        :param attribute: Either 'state' or 'action'
+        :return: Tensor of shape (num_agents, batch, joint_size) where row i holds agent i's block followed by the
+            other agents' blocks
+        """
+        output = x.index_select(1, self._get_index(attribute, 'agent_centric', None, x.device))
+        return output.view(x.shape[0], self.num_agents, -1).transpose(0, 1)
+
+    def stack_agent_attributes(self, x: torch.Tensor, attribute: str = 'state') -> torch.Tensor:
+        """ Split a joint tensor of shape (batch, joint_size) into (num_agents, batch, size)
+
+        Requires all agents to share the same size
+        """
+        if len(set(self.sizes[attribute].values())) > 1:
+            raise ValueError("All agents must share the same {} size to stack them".format(attribute))
+        return x.view(x.shape[0], self.num_agents, -1).transpose(0, 1)
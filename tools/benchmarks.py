@@ -0,0 +1,121 @@
+""" Micro-benchmarks of the hot paths of the agents
+
+Each benchmark checks the optimized implementation against a reference implementation for correctness before
+timing both. Run with:
+    python -m tools.benchmarks
+"""
+import time
+import torch
+from typing import Callable, Tuple
+from agents.policies.categorical_policy import CategoricalDQNPolicy
+from agents.models.components.cnn import CNN
+from agents.models.components.frame_buffer import RollingFrameBuffer
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def time_fn(fn: Callable, num_iterations: int = 1000, num_warmup_iterations: int = 10) -> float:
+    """ Average duration of fn in seconds, synchronizing with the GPU when available """
+    for _ in range(num_warmup_iterations):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start_time = time.perf_counter()
+    for _ in range(num_iterations):
+        fn()
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start_time) / num_iterations
+
+
+def reference_projection(policy: CategoricalDQNPolicy, next_dist: torch.Tensor, rewards: torch.Tensor, dones: torch.Tensor, gamma: float) -> torch.Tensor:
+    """ The categorical projection as originally implemented, rebuilding the offsets and output on every call """
+    batch_size = next_dist.size(0)
+    Tz = rewards + (1 - dones) * gamma * policy.support
+    Tz = Tz.clamp(min=policy.v_min, max=policy.v_max)
+    b = (Tz - policy.v_min) / policy.delta_z
+    l = b.floor().long()
+    u = b.ceil().long()
+
+    offset = torch.linspace(0, (batch_size - 1) * policy.num_atoms, batch_size).long() \
+        .unsqueeze(1).expand(batch_size, policy.num_atoms).to(device)
+
+    proj_dist = torch.zeros(next_dist.size()).to(device)
+    proj_dist.view(-1).index_add_(0, (l + offset).view(-1), (next_dist * (u.float() - b)).view(-1))
+    proj_dist.view(-1).index_add_(0, (u + offset).view(-1), (next_dist * (b - l.float())).view(-1))
+    return proj_dist
+
+
+def benchmark_categorical_projection(batch_sizes: Tuple[int, ...] = (32, 64, 256, 1024), num_atoms: int = 51,
+                                     gamma: float = 0.99, num_iterations: int = 1000):
+    """ Compare CategoricalDQNPolicy.project against the reference projection """
+    policy = CategoricalDQNPolicy(action_size=4, num_atoms=num_atoms, seed=0)
+    print("Categorical projection ({} atoms, device={})".format(num_atoms, device))
+    print("{:>10} {:>15} {:>15} {:>10}".format('batch', 'reference (us)', 'project (us)', 'speedup'))
+    for batch_size in batch_sizes:
+        next_dist = torch.softmax(torch.randn(batch_size, num_atoms, device=device), dim=1)
+        rewards = torch.randn(batch_size, 1, device=device)
+        dones = (torch.rand(batch_size, 1, device=device) < 0.1).long()
+
+        with torch.no_grad():
+            expected = reference_projection(policy, next_dist, rewards, dones, gamma)
+            actual = policy.project(next_dist, rewards, dones, gamma)
+            if not torch.allclose(expected, actual, atol=1e-6):
+                raise AssertionError("Projections differ by up to {}".format((expected - actual).abs().max().item()))
+
+            reference_duration = time_fn(lambda: reference_projection(policy, next_dist, rewards, dones, gamma), num_iterations)
+            duration = time_fn(lambda: policy.project(next_dist, rewards, dones, gamma), num_iterations)
+        print("{:>10} {:>15.1f} {:>15.1f} {:>9.2f}x".format(
+            batch_size, reference_duration * 1e6, duration * 1e6, reference_duration / duration
+        ))
+
+
+def benchmark_visual_acting(image_shape: Tuple[int, int] = (84, 84), num_stacked_frames: int = 4, num_iterations: int = 200):
+    """ Per-frame acting latency of the CNN featurizer, from a new frame to the features
+
+    The baseline runs the eager featurizer with its batchnorms on a stack concatenated and permuted at every step,
+    as done before frames were stacked in a RollingFrameBuffer. The optimized path appends the frame to the buffer
+    and runs the fused featurizer, in the channels-last format for RGB frames
+    """
+    print("Visual acting ({} stacked {}x{} frames, device={})".format(num_stacked_frames, image_shape[0], image_shape[1], device))
+    print("{:>10} {:>15} {:>15} {:>10}".format('frames', 'baseline (us)', 'optimized (us)', 'speedup'))
+    for grayscale in (True, False):
+        kernel_sizes = ((8, 8), (4, 4), (3, 3)) if grayscale else ((1, 8, 8), (1, 4, 4), (4, 3, 3))
+        stride_sizes = ((4, 4), (2, 2), (1, 1)) if grayscale else ((1, 4, 4), (1, 2, 2), (1, 1, 1))
+        frame_shape = (1,) + tuple(image_shape) + (() if grayscale else (3,))
+
+        baseline = CNN(image_shape, num_stacked_frames, grayscale, kernel_sizes=kernel_sizes,
+                       stride_sizes=stride_sizes, fuse_batchnorm_in_eval=False).to(device).eval()
+        optimized = CNN(image_shape, num_stacked_frames, grayscale, kernel_sizes=kernel_sizes,
+                        stride_sizes=stride_sizes, channels_last=not grayscale).to(device).eval()
+        optimized.load_state_dict(baseline.state_dict())
+        frame_buffer = RollingFrameBuffer(num_stacked_frames, grayscale=grayscale, memory_format=optimized.memory_format)
+        frames = [torch.rand(frame_shape, device=device) for _ in range(num_stacked_frames)]
+
+        def baseline_step():
+            state = torch.cat(frames, dim=0).unsqueeze(0)
+            if not grayscale:
+                state = state.permute(0, 4, 1, 2, 3)
+            return baseline(state)
+
+        def optimized_step():
+            frame_buffer.append(frames[-1])
+            return optimized(frame_buffer.get())
+
+        with torch.no_grad():
+            for frame in frames[:-1]:
+                frame_buffer.append(frame)
+            expected, actual = baseline_step(), optimized_step()
+            if not torch.allclose(expected, actual, atol=1e-4):
+                raise AssertionError("Features differ by up to {}".format((expected - actual).abs().max().item()))
+
+            baseline_duration = time_fn(baseline_step, num_iterations)
+            duration = time_fn(optimized_step, num_iterations)
+        print("{:>10} {:>15.1f} {:>15.1f} {:>9.2f}x".format(
+            'grayscale' if grayscale else 'rgb', baseline_duration * 1e6, duration * 1e6, baseline_duration / duration
+        ))
+
+
+if __name__ == '__main__':
+    benchmark_categorical_projection()
+    benchmark_visual_acting()
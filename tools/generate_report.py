@@ -1,44 +1,133 @@
 import os
-import pickle
-from tools import scores
+import html
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import matplotlib
+# Figures are only rendered to files, including in the worker processes
+matplotlib.use('Agg')
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
+import numpy as np
 from tasks.banana_collector.solutions.utils import default_cfg
 from tools.scores import Scores
+from tools.tuning_results import TuningResultsStore
 
+FIGURES_DIRECTORY = 'figures'
+FIGURE_DPI = 150
+# Bump to invalidate the cached figures when the way they are rendered changes
+FIGURE_VERSION = 1
+
+BODY = 'In this report we summarize the performance of various flavours \n' \
+       'of the DQN algorithm. ALl experiments use the following default \n' \
+       'hyperparameter configurations. The parameters provided with each \n' \
+       'figure overwrite the default parameters, differentiating each trial \n'
+
+
+def get_params_txt(trial_params: dict) -> str:
+    # Filter out the default parameters
+    trial_params = {k: v for k, v in trial_params.items() if v != default_cfg.get(k)}
+    txt = ''
+    for i, (k, v) in enumerate(trial_params.items(), start=1):
+        txt += '{}={}; '.format(k, v)
+        if i % 5 == 0:
+            txt += '\n'
+    return txt
+
+
+def get_figure_key(scores_path: str, window_size: int, n_train_episodes: int, train_time: float, txt: str) -> str:
+    """ Hash of the content of a trial figure: its scores and every value displayed """
+    key = hashlib.sha1()
+    with open(scores_path, 'rb') as f:
+        key.update(f.read())
+    key.update(repr((window_size, n_train_episodes, train_time, txt, FIGURE_DPI, FIGURE_VERSION)).encode())
+    return key.hexdigest()
+
+
+def render_trial_figure(args: Tuple[str, str, int, int, float, str]) -> str:
+    """ Render the scores plot of a trial to a png, in a worker process """
+    figure_path, scores_path, window_size, n_train_episodes, train_time, txt = args
+    trial_scores = Scores(tag="Training", window_size=window_size, initialize_scores=np.load(scores_path).tolist())
+    plt_ = trial_scores.get_plot(
+        title_text=f"Agent episode scores achieving {trial_scores.get_mean_sliding_scores()} "
+                   f"mean score in {n_train_episodes} episodes after {train_time}s",
+        xlabel_text="# Episodes",
+        ylabel_txt="Episode scores",
+        body_txt=txt
+    )
+    # Written under a temporary name, so that an interrupted render is not mistaken for a cached figure
+    tmp_path = figure_path + '.tmp.png'
+    plt_.savefig(tmp_path, format='png', dpi=FIGURE_DPI)
+    plt.close(plt_)
+    os.replace(tmp_path, figure_path)
+    return figure_path
+
+
+def save_html_report(html_save_path: str, project_title: str, figures: List[Tuple[str, str]]):
+    """ Lightweight report of the cached figures, referenced by relative paths """
+    html_directory = os.path.dirname(os.path.abspath(html_save_path))
+    default_params_as_txt = ''.join('{}={}\n'.format(k, v) for k, v in default_cfg.items())
+    sections = ''.join(
+        '<figure><img src="{}" loading="lazy"><figcaption>{}</figcaption></figure>\n'.format(
+            html.escape(os.path.relpath(figure_path, html_directory)), html.escape(txt)
+        )
+        for figure_path, txt in figures
+    )
+    with open(html_save_path, 'w') as f:
+        f.write(
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title>'
+            '<style>img {{max-width: 100%;}} figcaption {{font-family: monospace; white-space: pre-wrap;}}</style>'
+            '</head><body>\n<h1>{title}</h1>\n<p>{body}</p>\n<pre>{defaults}</pre>\n{sections}</body></html>\n'.format(
+                title=html.escape(project_title), body=html.escape(BODY), defaults=html.escape(default_params_as_txt),
+                sections=sections,
+            )
+        )
+
+
+def save_report(project_title: str, report_save_dir: str = 'REPORT.pdf', tunings_directory: str = 'tunings', performance_threshold: float = 10.0,
+                html_save_path: Optional[str] = None, num_workers: Optional[int] = None):
+    """ Generate a report based on hyperparameter tunings
+
+    The trials of the TuningResultsStore in tunings_directory scoring above performance_threshold are fetched in a
+    single query, sorted by their final sliding-window score. The figure of each trial is cached in the store's
+    figures directory, keyed by a hash of its content, so that only the figures of new trials are rendered, in a
+    process pool. The report is then assembled from the cached figures.
+
+    :param html_save_path: Optional path of an HTML report, referencing the cached figures
+    :param num_workers: The number of processes rendering the figures, defaults to the number of CPUs
+    """
+    store = TuningResultsStore(tunings_directory)
+    trials = store.query(min_mean_sliding_score=performance_threshold, order_by='mean_sliding_score')
+    figures_directory = os.path.join(store.directory, FIGURES_DIRECTORY)
+    os.makedirs(figures_directory, exist_ok=True)
+
+    figures = []
+    render_args = []
+    for trial in trials:
+        scores_path = os.path.join(store.directory, trial['scores_path'])
+        txt = get_params_txt(trial['params'])
+        args = (scores_path, trial['sliding_window_size'], trial['n_train_episodes'], trial['train_time'], txt)
+        figure_path = os.path.join(figures_directory, '{}.png'.format(get_figure_key(*args)))
+        figures.append((figure_path, txt))
+        if not os.path.exists(figure_path):
+            render_args.append((figure_path,) + args)
+
+    if render_args:
+        print("Rendering {} new figures, {} cached".format(len(render_args), len(figures) - len(render_args)))
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(render_trial_figure, args) for args in render_args]
+        for future in futures:
+            if future.exception() is not None:
+                # Nothing saved
+                print(future.exception())
+    figures = [(figure_path, txt) for figure_path, txt in figures if os.path.exists(figure_path)]
 
-def get_performance(file_path: str, performance_threshold: float = 10):
-    try:
-        with open(file_path, 'rb') as f:
-            info = pickle.load(f)
-        scores_ = Scores(initialize_scores=info['train_scores'])
-        mean_score = scores_.get_mean_sliding_scores()
-        if mean_score > performance_threshold:
-            return scores_.get_mean_sliding_scores()
-    except Exception as e:
-        # Corrupted binary
-        pass
-
-
-def save_report(project_title: str, report_save_dir: str = 'REPORT.pdf', tunings_directory: str = 'tunings', performance_threshold: float = 10.0):
-    """ Generate a report based on hyperparameter tunings """
-    sorted_paths = []
-    for fp in [os.path.join(tunings_directory, i) for i in os.listdir(tunings_directory)]:
-        performance = get_performance(fp, performance_threshold)
-        if performance:
-            sorted_paths.append((fp, performance))
-    sorted_paths = [i[0] for i in sorted(sorted_paths, key=lambda x: x[1], reverse=True)]
     with PdfPages(report_save_dir) as pdf:
         # Create title page
         cover_page = plt.figure(figsize=(8, 8))
         cover_page.clf()
         cover_page.text(0.5, 0.9, project_title, transform=cover_page.transFigure, size=24, ha="center")
-
-        body = 'In this report we summarize the performance of various flavours \n' \
-               'of the DQN algorithm. ALl experiments use the following default \n' \
-               'hyperparameter configurations. The parameters provided with each \n' \
-               'figure overwrite the default parameters, differentiating each trial \n'
-        cover_page.text(0.5, 0.75, body, transform=cover_page.transFigure, size=12, ha="center")
+        cover_page.text(0.5, 0.75, BODY, transform=cover_page.transFigure, size=12, ha="center")
 
         default_params_as_txt = ''
         for i, (k, v) in enumerate(default_cfg.items(), start=1):
@@ -46,32 +135,16 @@ def save_report(project_title: str, report_save_dir: str = 'REPORT.pdf', tunings
 
         cover_page.text(0.5, 0.1, default_params_as_txt, transform=cover_page.transFigure, size=10, ha="center", wrap=True)
 
-        pdf.savefig()
-
-        for fp in sorted_paths:
-            try:
-                with open(fp, 'rb') as f:
-                    trial_info = pickle.load(f)
-                trial_scores = scores.Scores(tag="Training", initialize_scores=trial_info['train_scores'])
-                trial_params = trial_info['input_params']
-                n_train_episodes = trial_info['n_train_episodes']
-                train_time = trial_info['train_time']
-                # Filter out the default parameters
-                trial_params = {k: v for k, v in trial_params.items() if v != default_cfg[k]}
-                txt = ''
-                for i, (k, v) in enumerate(trial_params.items(), start=1):
-                    txt += '{}={}; '.format(k, v)
-                    if i % 5 == 0:
-                        txt += '\n'
-                plt_ = trial_scores.get_plot(
-                    title_text=f"Agent episode scores achieving {trial_scores.get_mean_sliding_scores()} "
-                               f"mean score in {n_train_episodes} episodes after {train_time}s",
-                    xlabel_text="# Episodes",
-                    ylabel_txt="Episode scores",
-                    body_txt=txt
-                )
-                plt_.savefig(pdf,  format="pdf")
-            except Exception as e:
-                # Nothing saved
-                print(e)
-                pass
+        pdf.savefig(cover_page)
+        plt.close(cover_page)
+
+        # Each page embeds a cached figure, rather than re-drawing its plot
+        for figure_path, _ in figures:
+            image = plt.imread(figure_path)
+            page = plt.figure(figsize=(image.shape[1] / FIGURE_DPI, image.shape[0] / FIGURE_DPI), dpi=FIGURE_DPI)
+            page.figimage(image)
+            pdf.savefig(page, dpi=FIGURE_DPI)
+            plt.close(page)
+
+    if html_save_path is not None:
+        save_html_report(html_save_path, project_title, figures)
@@ -6,7 +6,11 @@ device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
 def init_layer_inverse_root_fan_in(layer):
     """ Initialize hidden layers """
-    fan_in = layer.weight.data.size()[0]
+    if layer.weight.dim() == 3:
+        # Stacked weights of a GroupedLinear, of shape (num_groups, in_features, out_features)
+        fan_in = layer.weight.data.size()[1]
+    else:
+        fan_in = layer.weight.data.size()[0]
     lim = 1. / np.sqrt(fan_in)
     return -lim, lim
 
@@ -0,0 +1,194 @@
+import os
+import csv
+import numpy as np
+import torch
+from typing import Dict, List, Optional, Union
+
+Value = Union[torch.Tensor, float, np.ndarray]
+
+
+class MetricSeries:
+    """ Values of a single metric, held in a fixed-size ring buffer on the device of the first value
+
+    Adding a value is an on-device copy, without synchronizing with the device. The values are transferred in a
+    single copy when the series is flushed, which updates the streaming statistics: count, mean, variance, min, max,
+    and quantiles estimated from a fixed-size reservoir sample of all values
+    """
+    def __init__(self, capacity: int = 1024, reservoir_size: int = 1024, seed: Optional[int] = None):
+        """
+        :param capacity: The number of most recent values retained, and the number of values added between flushes
+        :param reservoir_size: The number of values sampled uniformly from all values, to estimate quantiles
+        :param seed: Seed of the reservoir sampling
+        """
+        self.capacity = capacity
+        self.buffer: Optional[torch.Tensor] = None
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.flushed_count = 0
+
+        self.mean = 0.
+        self.sum_squared_deviations = 0.
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.reservoir = np.empty(reservoir_size)
+        self.random_state = np.random.RandomState(seed)
+
+    @property
+    def num_pending(self) -> int:
+        return self.count - self.flushed_count
+
+    def add(self, value: Value, step: Optional[int] = None):
+        if isinstance(value, torch.Tensor):
+            value = value.detach()
+            if self.buffer is None:
+                self.buffer = torch.zeros(self.capacity, dtype=torch.float32, device=value.device)
+            self.buffer[self.count % self.capacity].copy_(value.reshape(()))
+        else:
+            if self.buffer is None:
+                self.buffer = torch.zeros(self.capacity, dtype=torch.float32)
+            self.buffer[self.count % self.capacity] = float(value)
+        self.steps[self.count % self.capacity] = self.count if step is None else step
+        self.count += 1
+
+    def ring_indices(self, start: int, stop: int) -> np.ndarray:
+        return np.arange(start, stop) % self.capacity
+
+    def flush(self) -> tuple:
+        """ Transfer the values added since the last flush and update the statistics
+
+        :return: Tuple of the (steps, values) flushed
+        """
+        if self.num_pending == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        idxs = self.ring_indices(self.flushed_count, self.count)
+        values = self.buffer.cpu().numpy().astype(np.float64)[idxs]
+        steps = self.steps[idxs]
+
+        # Chan's parallel update of the mean and sum of squared deviations
+        n, n_new = self.flushed_count, len(values)
+        new_mean = values.mean()
+        delta = new_mean - self.mean
+        self.mean += delta * n_new / (n + n_new)
+        self.sum_squared_deviations += ((values - new_mean) ** 2).sum() + delta ** 2 * n * n_new / (n + n_new)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        # Reservoir sampling (algorithm R); later values overwrite earlier ones, as if added one by one
+        reservoir_size = len(self.reservoir)
+        positions = np.arange(n, n + n_new)
+        num_fill = max(0, min(reservoir_size - n, n_new))
+        self.reservoir[n:n + num_fill] = values[:num_fill]
+        replacements = (self.random_state.random_sample(n_new - num_fill) * (positions[num_fill:] + 1)).astype(np.int64)
+        replaced = replacements < reservoir_size
+        self.reservoir[replacements[replaced]] = values[num_fill:][replaced]
+
+        self.flushed_count = self.count
+        return steps, values
+
+    def values(self) -> np.ndarray:
+        """ The retained values, from oldest to newest """
+        if self.buffer is None:
+            return np.zeros(0)
+        return self.buffer.cpu().numpy()[self.ring_indices(max(0, self.count - self.capacity), self.count)]
+
+    def summary(self, quantiles: tuple = (0.05, 0.5, 0.95)) -> dict:
+        """ Statistics of all the values flushed so far """
+        n = self.flushed_count
+        summary = {
+            'count': n,
+            'mean': self.mean if n else float('nan'),
+            'std': float(np.sqrt(self.sum_squared_deviations / (n - 1))) if n > 1 else float('nan'),
+            'min': float(self.min) if n else float('nan'),
+            'max': float(self.max) if n else float('nan'),
+        }
+        sample = self.reservoir[:min(n, len(self.reservoir))]
+        for q in quantiles:
+            summary['q{:g}'.format(q * 100)] = float(np.quantile(sample, q)) if n else float('nan')
+        return summary
+
+
+class CSVSink:
+    """ Appends flushed values as rows of (key, step, value) """
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, 'w', newline='') as f:
+                csv.writer(f).writerow(('key', 'step', 'value'))
+
+    def write(self, key: str, steps: np.ndarray, values: np.ndarray):
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerows(zip([key] * len(values), steps.tolist(), values.tolist()))
+
+    def close(self):
+        pass
+
+
+class TensorBoardSink:
+    """ Writes flushed values as TensorBoard scalars """
+    def __init__(self, log_dir: str):
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+        except ImportError:
+            from tensorboardX import SummaryWriter
+        self.writer = SummaryWriter(log_dir=log_dir)
+
+    def write(self, key: str, steps: np.ndarray, values: np.ndarray):
+        for step, value in zip(steps.tolist(), values.tolist()):
+            self.writer.add_scalar(key, value, step)
+
+    def close(self):
+        self.writer.close()
+
+
+class MetricsRecorder:
+    """ Records metrics such as losses at every update, without synchronizing with the device
+
+    Values are kept on their device in a ring buffer per key, and only transferred when flushed: explicitly, or
+    automatically once a key has accumulated `capacity` values, so no value is lost. Flushed values update the
+    streaming statistics of each key and are written to the sinks
+    """
+    def __init__(self, capacity: int = 1024, reservoir_size: int = 1024, sinks: Optional[List] = None):
+        """
+        :param capacity: The number of values of each key retained, and between automatic flushes
+        :param reservoir_size: The number of values of each key sampled to estimate quantiles
+        :param sinks: Optional sinks (eg. CSVSink, TensorBoardSink) receiving the flushed values
+        """
+        self.capacity = capacity
+        self.reservoir_size = reservoir_size
+        self.sinks = sinks or []
+        self.series: Dict[str, MetricSeries] = {}
+
+    def add(self, k: str, value: Optional[Value], step: Optional[int] = None):
+        if value is None:
+            return
+        series = self.series.get(k)
+        if series is None:
+            series = self.series[k] = MetricSeries(self.capacity, self.reservoir_size)
+        if series.num_pending >= self.capacity:
+            self.flush_series(k, series)
+        series.add(value, step)
+
+    def flush_series(self, k: str, series: MetricSeries):
+        steps, values = series.flush()
+        if len(values):
+            for sink in self.sinks:
+                sink.write(k, steps, values)
+
+    def flush(self):
+        for k, series in self.series.items():
+            self.flush_series(k, series)
+
+    def get(self, k: str) -> np.ndarray:
+        """ The most recent values of a key, from oldest to newest """
+        series = self.series.get(k)
+        return series.values() if series is not None else np.zeros(0)
+
+    def summary(self, quantiles: tuple = (0.05, 0.5, 0.95)) -> Dict[str, dict]:
+        """ Statistics of every key, flushing the pending values first """
+        self.flush()
+        return {k: series.summary(quantiles) for k, series in self.series.items()}
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
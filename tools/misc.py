@@ -56,6 +56,10 @@ def soft_update(online_model, target_model, tau) -> None:
     """
     for target_param, local_param in zip(target_model.parameters(), online_model.parameters()):
         target_param.data.copy_(tau * local_param.data + (1.0 - tau) * target_param.data)
+    # Modules caching weights derived from their parameters, eg. CNNs with batchnorms folded into convolutions
+    for module in target_model.modules():
+        if hasattr(module, 'mark_fused_features_stale'):
+            module.mark_fused_features_stale()
 
 
 def ensure_batch(*tensor_args):
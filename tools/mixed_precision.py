@@ -0,0 +1,103 @@
+import torch
+from typing import Optional
+from contextlib import contextmanager
+from torch.optim.optimizer import Optimizer
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def cpu_autocast_available() -> bool:
+    """ Whether CPU autocast is supported, ie. torch >= 1.10. torch.cuda.amp.autocast exists from torch 1.6 """
+    return hasattr(torch, 'cpu') and hasattr(getattr(torch, 'cpu'), 'amp')
+
+
+def autocast_enabled() -> bool:
+    """ Whether an autocast region is currently active on either the GPU or the CPU """
+    if torch.is_autocast_enabled():
+        return True
+    is_autocast_cpu_enabled = getattr(torch, 'is_autocast_cpu_enabled', None)
+    return bool(is_autocast_cpu_enabled and is_autocast_cpu_enabled())
+
+
+@contextmanager
+def full_precision():
+    """ Disable autocast within a region, for numerically sensitive computations """
+    if not autocast_enabled():
+        yield
+        return
+    if torch.is_autocast_enabled():
+        with torch.cuda.amp.autocast(enabled=False):
+            yield
+    else:
+        with torch.cpu.amp.autocast(enabled=False):
+            yield
+
+
+class MixedPrecision:
+    """ Helper for opt-in mixed precision training
+
+    When enabled, forward passes run under autocast (fp16 on the GPU, bf16 on the CPU). A gradient scaler is
+    used for fp16 on the GPU, where small gradients would otherwise underflow; bf16 has the range of fp32
+    and does not need one. When disabled, every method falls back to plain fp32 training.
+
+    Each learning iteration calls backward, unscale_ (before clipping) and step for each of its optimizers, then
+    update once.
+
+    fp16 on the GPU uses torch.cuda.amp, available from torch 1.6 as pinned in environment.yml. bf16 on the CPU, and
+    any dtype other than fp16 on the GPU, require torch >= 1.10
+    """
+    def __init__(self, enabled: bool = False, dtype: Optional[torch.dtype] = None):
+        """
+        :param enabled: Whether to train with mixed precision
+        :param dtype: The reduced precision dtype. Defaults to fp16 on the GPU and bf16 on the CPU
+        """
+        self.enabled = enabled
+        self.device_type = device.type
+        if dtype is None:
+            dtype = torch.float16 if self.device_type == 'cuda' else torch.bfloat16
+        self.dtype = dtype
+        if self.enabled and not cpu_autocast_available():
+            if self.device_type != 'cuda':
+                raise ValueError(
+                    "Mixed precision on the CPU requires torch >= 1.10, found torch {}".format(torch.__version__)
+                )
+            if self.dtype != torch.float16:
+                raise ValueError(
+                    "Mixed precision with {} on the GPU requires torch >= 1.10, found torch {}".format(self.dtype, torch.__version__)
+                )
+        self.scaler = torch.cuda.amp.GradScaler(
+            enabled=self.enabled and self.device_type == 'cuda' and self.dtype == torch.float16
+        )
+
+    @contextmanager
+    def autocast(self):
+        """ Run the forward pass and loss computation under autocast """
+        if not self.enabled:
+            yield
+            return
+        if self.device_type == 'cuda' and self.dtype == torch.float16:
+            with torch.cuda.amp.autocast():
+                yield
+        else:
+            with torch.autocast(device_type=self.device_type, dtype=self.dtype):
+                yield
+
+    def backward(self, loss: torch.Tensor):
+        """ Back-propagate the (scaled) loss """
+        self.scaler.scale(loss).backward()
+
+    def unscale_(self, optimizer: Optimizer):
+        """ Unscale the gradients in place, required before gradient clipping """
+        self.scaler.unscale_(optimizer)
+
+    def step(self, optimizer: Optimizer):
+        """ Perform the optimizer step, skipping it if the scaled gradients overflowed """
+        self.scaler.step(optimizer)
+
+    def update(self):
+        """ Update the loss scale, once per learning iteration after the steps of all of its optimizers
+
+        Updating between the steps of several optimizers (eg. critic then actor) would scale the later losses with
+        a factor already adjusted by the earlier overflow checks
+        """
+        self.scaler.update()
@@ -34,13 +34,120 @@ class Action:
         self.value = value
 
 
-def concatenate_action_attributes(actions_list: Union[List[Action], Action], attribute_name: str, cat_dim=0):
+class ActionBatch:
+    """ Actions of all agents of a brain, held as contiguous arrays with one row per agent
+
+    The value, log_probs and critic_values of the agents are stored once per brain rather than in one Action object
+    per agent, so passing the actions to the environment is a view of value. Scalar action values are held with one
+    row. When the batch is built from the actions of several agents, each agent's own Action is kept and returned by
+    indexing, with all of its attributes, even those the other agents of the brain do not have. Otherwise indexing
+    or iterating over the batch yields Action views of single rows, for code consuming actions agent by agent.
+    Attributes other than value, log_probs and critic_values are kept in extras, and readable as attributes
+    """
+    __slots__ = ('value', 'log_probs', 'critic_values', 'extras', 'agent_actions')
+    ATTRIBUTES = ('value', 'log_probs', 'critic_values')
+
+    def __init__(self, value: np.ndarray, log_probs: Optional[torch.Tensor] = None, critic_values: Optional[torch.Tensor] = None,
+                 agent_actions: Optional[List[Action]] = None, **extras):
+        """
+        :param value: Actions of shape (num_agents, action_size)
+        :param log_probs: Optional log-probabilities of the actions, one row per agent
+        :param critic_values: Optional critic values of the states, one row per agent
+        :param agent_actions: Optional Action of each agent, returned when indexing the batch
+        :param extras: Any other attribute of the actions
+        """
+        if not isinstance(value, torch.Tensor):
+            value = np.atleast_1d(value)
+        self.value = value
+        self.log_probs = log_probs
+        self.critic_values = critic_values
+        self.agent_actions = agent_actions
+        self.extras = extras
+
+    def __getattr__(self, name: str):
+        # Only called for attributes that are not slots, ie. the extras
+        if name in ActionBatch.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.extras[name]
+        except KeyError:
+            raise AttributeError("'ActionBatch' object has no attribute '{}'".format(name))
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        for k, v in state.items():
+            setattr(self, k, v)
+
+    @classmethod
+    def from_action(cls, action: Action):
+        """ Wrap an Action already covering all agents of the brain, without copying """
+        return cls(**vars(action))
+
+    @classmethod
+    def from_actions(cls, actions: List[Action]):
+        """ Concatenate the actions of the agents of a brain, one array per attribute
+
+        An attribute missing from the action of any agent is None in the batch, but remains available on the Action of
+        the agents having it
+        """
+        def concatenate(values: list):
+            if any(v is None for v in values):
+                return None
+            if isinstance(values[0], torch.Tensor):
+                return torch.cat([v.view(1) if v.dim() == 0 else v for v in values])
+            return np.concatenate([np.atleast_1d(v) for v in values])
+
+        if len(actions) == 1:
+            return cls.from_action(actions[0])
+        attributes = {k: concatenate([getattr(a, k, None) for a in actions]) for k in cls.ATTRIBUTES}
+        batch = cls(**attributes)
+        if len(batch) == len(actions):
+            batch.agent_actions = list(actions)
+        return batch
+
+    def __len__(self):
+        return len(self.value)
+
+    def slice_rows(self, x, start: int, stop: int):
+        """ Rows start to stop of a per-agent attribute; attributes not having one row per agent are kept whole """
+        if isinstance(x, (np.ndarray, torch.Tensor)) and x.ndim > 0 and len(x) == len(self):
+            return x[start:stop]
+        return x
+
+    def rows(self, start: int, stop: int) -> 'ActionBatch':
+        """ View of the actions of agents start to stop """
+        return ActionBatch(
+            **{k: self.slice_rows(getattr(self, k), start, stop) for k in self.ATTRIBUTES},
+            agent_actions=None if self.agent_actions is None else self.agent_actions[start:stop],
+            **{k: self.slice_rows(v, start, stop) for k, v in self.extras.items()}
+        )
+
+    def __getitem__(self, i: int) -> Action:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Action index {} out of range for {} agents".format(i, len(self)))
+        if self.agent_actions is not None:
+            # The agent's own Action, with every attribute it was returned with
+            return self.agent_actions[i]
+        kwargs = {k: self.slice_rows(getattr(self, k), i, i + 1) for k in ('log_probs', 'critic_values') if getattr(self, k) is not None}
+        kwargs.update({k: self.slice_rows(v, i, i + 1) for k, v in self.extras.items()})
+        return Action(value=self.value[i:i + 1], **kwargs)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def concatenate_action_attributes(actions_list: Union[List[Action], Action, ActionBatch], attribute_name: str, cat_dim=0):
     def to_tensor(x):
         if isinstance(x, np.ndarray):
             return torch.from_numpy(x)
         return x
 
-    if isinstance(actions_list, Action):
+    if isinstance(actions_list, (Action, ActionBatch)):
         return to_tensor(getattr(actions_list, attribute_name))
     else:
         tensor_list = [to_tensor(getattr(a, attribute_name)) for a in actions_list]
@@ -136,6 +243,218 @@ class ExperienceBatch:
         return len(self.states)
 
 
+def to_primitive(x) -> Union[float, Tuple[float, ...], None]:
+    """ Convert a scalar, or a sequence of scalars, into a float or a tuple of floats """
+    if x is None or isinstance(x, float):
+        return x
+    if isinstance(x, (bool, int, np.number, np.bool_)):
+        return float(x)
+    values = np.asarray(x, dtype=np.float32).reshape(-1)
+    return float(values[0]) if len(values) == 1 else tuple(float(v) for v in values)
+
+
+class Transition:
+    """ Compact record of a single transition
+
+    Unlike Experience, a Transition does not convert its fields into tensors: rewards and dones are kept as floats
+    (or tuples of floats when they cover several agents) and tensors are only created when a batch of transitions is
+    collated by TransitionBatch. Fields are fixed __slots__, so moving the record between devices does not
+    introspect an instance dictionary. Transitions emitted from a StepRecord keep a reference to it, allowing
+    multi-agent memories to store the step once for all agents
+    """
+    __slots__ = ('state', 'action', 'reward', 'done', 't_step', 'next_state', 'joint_state', 'joint_action',
+                 'joint_next_state', 'brain_name', 'agent_number', 'step_record')
+    TENSOR_FIELDS = ('state', 'next_state', 'joint_state', 'joint_action', 'joint_next_state')
+
+    def __init__(self, state: torch.Tensor, action: Action, reward: Union[float, Tuple[float, ...]] = None,
+                 done: Union[bool, float, Tuple[float, ...]] = None, t_step: Optional[int] = None,
+                 next_state: Optional[torch.Tensor] = None, joint_state: Optional[torch.Tensor] = None,
+                 joint_action: Optional[torch.Tensor] = None, joint_next_state: Optional[torch.Tensor] = None,
+                 brain_name: Optional[str] = None, agent_number: Optional[int] = None, step_record=None):
+        self.state = state
+        self.action = action
+        self.reward = to_primitive(reward)
+        self.done = to_primitive(done)
+        self.t_step = t_step
+        self.next_state = next_state
+        self.joint_state = joint_state
+        self.joint_action = joint_action
+        self.joint_next_state = joint_next_state
+        self.brain_name = brain_name
+        self.agent_number = agent_number
+        self.step_record = step_record
+
+    def to(self, device: Union[str, torch.device]):
+        for name in self.TENSOR_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, value.to(device))
+        return self
+
+    def cpu(self):
+        return self.to('cpu')
+
+
+class TransitionBatch:
+    """ Builder collating transitions into an ExperienceBatch, creating each batch tensor in a single call
+
+    Accepts Transition as well as Experience records
+    """
+    def __init__(self):
+        self.transitions: List[Union[Transition, Experience]] = []
+
+    @classmethod
+    def from_transitions(cls, transitions: List[Union[Transition, Experience]]):
+        batch = cls()
+        batch.transitions = list(transitions)
+        return batch
+
+    def append(self, transition: Union[Transition, Experience]):
+        self.transitions.append(transition)
+
+    def __len__(self):
+        return len(self.transitions)
+
+    @staticmethod
+    def _cat(values: list) -> Optional[torch.Tensor]:
+        values = [v for v in values if v is not None]
+        if len(values) == 0:
+            return None
+        return torch.cat([torch.as_tensor(v) for v in values]).float()
+
+    @staticmethod
+    def _stack_scalars(values: list, batch_size: int) -> torch.Tensor:
+        """ Stack float (or tuple of float) fields into a tensor of shape (batch_size, -1) """
+        values = [to_primitive(v) for v in values]
+        return torch.from_numpy(np.array(values, dtype=np.float32)).view(batch_size, -1)
+
+    def build(self, device_: Optional[torch.device] = None) -> ExperienceBatch:
+        transitions = self.transitions
+        batch_size = len(transitions)
+        actions = [t.action.value for t in transitions if t.action is not None]
+
+        experience_batch = ExperienceBatch(
+            states=self._cat([t.state for t in transitions]),
+            actions=None if len(actions) == 0 else torch.from_numpy(np.concatenate(actions)).float(),
+            rewards=self._stack_scalars([t.reward for t in transitions], batch_size),
+            dones=self._stack_scalars([t.done for t in transitions], batch_size),
+            next_states=self._cat([t.next_state for t in transitions]),
+            joint_states=self._cat([t.joint_state for t in transitions]),
+            joint_actions=self._cat([t.joint_action for t in transitions]),
+            joint_next_states=self._cat([t.joint_next_state for t in transitions]),
+        )
+        if device_ is not None:
+            experience_batch.to(device_)
+        return experience_batch
+
+
+class StepRecord:
+    """ Structure-of-arrays record of a single environment step, covering every agent of every brain
+
+    States, actions and next states are held once as joint tensors of shape (1, joint_size), with each agent's
+    row being a slice of the joint tensor. Rewards and dones are arrays with one entry per agent. Agents are indexed
+    by their id, of the form "<brain_name>_<agent_number>" as in AgentLayout.from_brains
+    """
+    __slots__ = ('agent_ids', 'agent_index', 'brain_agents', 'joint_state', 'joint_action', 'joint_next_state',
+                 'actions', 'rewards', 'dones', 't_step', 'state_offsets', 'action_offsets')
+
+    def __init__(self, agent_ids: List[str], brain_agents: List[Tuple[str, int]], joint_state: torch.Tensor,
+                 joint_action: torch.Tensor, joint_next_state: torch.Tensor, actions: List[Action],
+                 rewards: np.ndarray, dones: np.ndarray, t_step: int, state_offsets: np.ndarray, action_offsets: np.ndarray):
+        """
+        :param agent_ids: Agent ids in joint order
+        :param brain_agents: (brain_name, agent_number) of each agent
+        :param joint_state: Tensor of shape (1, joint_state_size)
+        :param joint_action: Tensor of shape (1, joint_action_size)
+        :param joint_next_state: Tensor of shape (1, joint_state_size)
+        :param actions: The Action of each agent
+        :param rewards: Array of shape (num_agents,)
+        :param dones: Array of shape (num_agents,)
+        :param t_step: The time step
+        :param state_offsets: Start of each agent's block in the joint states, followed by the joint state size
+        :param action_offsets: Start of each agent's block in the joint actions, followed by the joint action size
+        """
+        self.agent_ids = agent_ids
+        self.agent_index = {agent_id: i for i, agent_id in enumerate(agent_ids)}
+        self.brain_agents = brain_agents
+        self.joint_state = joint_state
+        self.joint_action = joint_action
+        self.joint_next_state = joint_next_state
+        self.actions = actions
+        self.rewards = rewards
+        self.dones = dones
+        self.t_step = t_step
+        self.state_offsets = state_offsets
+        self.action_offsets = action_offsets
+
+    @classmethod
+    def from_brain_environment(cls, next_brain_environment: dict, t: int):
+        """ Build the record from the per-brain states, actions, rewards, dones and next states of a step """
+        agent_ids, brain_agents, actions, state_sizes, action_sizes = [], [], [], [], []
+        states, next_states, rewards, dones = [], [], [], []
+        for brain_name, brain_environment in next_brain_environment.items():
+            brain_states = brain_environment['states']
+            for agent_number, action in enumerate(brain_environment['actions']):
+                agent_ids.append("{}_{}".format(brain_name, agent_number))
+                brain_agents.append((brain_name, agent_number))
+                actions.append(action)
+                state_sizes.append(brain_states[agent_number].numel())
+                action_sizes.append(action.value.size)
+            states.append(brain_states.reshape(-1))
+            next_states.append(brain_environment['next_states'].reshape(-1))
+            rewards.extend(brain_environment['rewards'])
+            dones.extend(brain_environment['dones'])
+
+        return cls(
+            agent_ids=agent_ids,
+            brain_agents=brain_agents,
+            joint_state=torch.cat(states).view(1, -1),
+            joint_action=torch.from_numpy(np.concatenate([a.value.reshape(-1) for a in actions])).view(1, -1),
+            joint_next_state=torch.cat(next_states).view(1, -1),
+            actions=actions,
+            rewards=np.asarray(rewards, dtype=np.float32),
+            dones=np.asarray(dones, dtype=np.float32),
+            t_step=t,
+            state_offsets=np.cumsum([0] + state_sizes),
+            action_offsets=np.cumsum([0] + action_sizes),
+        )
+
+    @property
+    def num_agents(self) -> int:
+        return len(self.agent_ids)
+
+    def agent_state(self, agent_id: str, next_state: bool = False) -> torch.Tensor:
+        """ View of the agent's row of the joint (next) state, of shape (1, state_size) """
+        i = self.agent_index[agent_id]
+        joint = self.joint_next_state if next_state else self.joint_state
+        return joint[:, int(self.state_offsets[i]):int(self.state_offsets[i + 1])]
+
+    def transition(self, agent_id: str) -> Transition:
+        """ The agent's transition, whose tensors are views of the joint tensors of the record """
+        i = self.agent_index[agent_id]
+        brain_name, agent_number = self.brain_agents[i]
+        return Transition(
+            state=self.agent_state(agent_id),
+            action=self.actions[i],
+            reward=float(self.rewards[i]),
+            done=float(self.dones[i]),
+            t_step=self.t_step,
+            next_state=self.agent_state(agent_id, next_state=True),
+            joint_state=self.joint_state,
+            joint_action=self.joint_action,
+            joint_next_state=self.joint_next_state,
+            brain_name=brain_name,
+            agent_number=agent_number,
+            step_record=self,
+        )
+
+    def cpu(self):
+        self.joint_state = self.joint_state.cpu()
+        self.joint_action = self.joint_action.cpu()
+        self.joint_next_state = self.joint_next_state.cpu()
+        return self
+
+
 Environment = namedtuple("Environment", field_names=["next_state", "reward", "done"])
 
 
@@ -153,7 +472,13 @@ class Brain:
         self.preprocess_state_fn = preprocess_state_fn
         self.preprocess_actions_fn = preprocess_actions_fn
 
-    def get_action(self, state: np.ndarray, joint_state: np.ndarray) -> Dict[str, List[Action]]:
+    @staticmethod
+    def to_action_batch(actions: List[Union[Action, ActionBatch]]) -> ActionBatch:
+        if len(actions) == 1 and isinstance(actions[0], ActionBatch):
+            return actions[0]
+        return ActionBatch.from_actions(actions)
+
+    def get_action(self, state: np.ndarray, joint_state: np.ndarray) -> Dict[str, ActionBatch]:
         # select actions and send to environment
         r = []
         if len(self.agents) == 1:
@@ -166,9 +491,9 @@ class Brain:
                 s = s.unsqueeze(0)
                 action = a.get_action(s, joint_state=joint_state)
                 r.append(action)
-        return {self.brain_name: r}
+        return {self.brain_name: self.to_action_batch(r)}
 
-    def get_random_action(self, state: np.ndarray, joint_state: np.ndarray) -> Dict[str, List[Action]]:
+    def get_random_action(self, state: np.ndarray, joint_state: np.ndarray) -> Dict[str, ActionBatch]:
         # select actions and send to environment
         r = []
         if len(self.agents) == 1:
@@ -179,14 +504,14 @@ class Brain:
                 " state; found {} and {} respectively".format(len(self.agents), len(state))
             for a, s in zip(self.agents, state):
                 r.append(a.get_random_action(s, joint_state=joint_state))
-        return {self.brain_name: r}
+        return {self.brain_name: self.to_action_batch(r)}
 
 
 class BrainSet:
     def __init__(self, brains: List[Brain]):
         self.brain_map = OrderedDict([(brain.brain_name, brain) for brain in brains])
 
-    def get_actions(self, brain_states) -> Dict[str, List[Action]]:
+    def get_actions(self, brain_states) -> Dict[str, ActionBatch]:
         # Get the joint states/actions
         joint_brain_states = torch.cat([brain_states[brain_name] for brain_name in brain_states]).view(1, -1)
 
@@ -196,7 +521,7 @@ class BrainSet:
             new_brain_actions.update(brain_action_map)
         return new_brain_actions
 
-    def get_random_actions(self, brain_states) -> Dict[str, List[Action]]:
+    def get_random_actions(self, brain_states) -> Dict[str, ActionBatch]:
         brain_actions = {}
         joint_brain_states = torch.cat([brain_states[brain_name] for brain_name in brain_states]).view(1, -1)
         for brain_name, state in brain_states.items():
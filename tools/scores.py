@@ -1,41 +1,259 @@
+import os
+import math
 import time
-from typing import Optional, List
+from typing import Optional, List, Iterable
 from collections import deque
 import numpy as np
-import pandas as pd
 from pylab import *
 
 
-class Scores:
-    """ Helper class for maintaining the scores (rewards) accumulated by an agent """
-    def __init__(self, tag: str = 'Training', window_size: int = 100, initialize_scores: Optional[List[float]] = None):
-        if initialize_scores:
-            self.scores = initialize_scores
-            self.sliding_scores = deque(maxlen=window_size)
-            self.sliding_scores.extend(initialize_scores)
+class P2Quantile:
+    """ Streaming estimate of a quantile with the P-square algorithm (Jain & Chlamtac, 1985)
+
+    Five markers are kept and adjusted by piecewise-parabolic interpolation, so each update is O(1) in time and memory
+    """
+    def __init__(self, q: float):
+        if not 0 < q < 1:
+            raise ValueError("The quantile must be within (0, 1), found: {}".format(q))
+        self.q = q
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired_positions = [0, 2 * q, 4 * q, 2 + 2 * q, 4]
+        self.increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def add(self, x: float):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
         else:
-            self.scores = []
-            self.sliding_scores = deque(maxlen=window_size)
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired_positions[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = heights[i] + d / (positions[i + 1] - positions[i - 1]) * (
+                    (positions[i] - positions[i - 1] + d) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+                    + (positions[i + 1] - positions[i] - d) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+                )
+                if not heights[i - 1] < height < heights[i + 1]:
+                    # Linear interpolation when the parabolic prediction leaves the neighbouring markers
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def get(self) -> float:
+        if not self.heights:
+            return float('nan')
+        if len(self.heights) < 5:
+            return float(np.quantile(self.heights, self.q))
+        return self.heights[2]
+
+
+class ScoreHistory:
+    """ Append-only sequence of all episode scores, stored in fixed-size float64 chunks
+
+    Full chunks are written to history_path as .npy files when it is given, so that memory stays bounded; the most
+    recently read chunk is cached. Otherwise they are kept in memory, as compact arrays rather than lists of floats.
+    Supports len, indexing, slicing and iteration like a list
+    """
+    def __init__(self, chunk_size: int = 10000, history_path: Optional[str] = None):
+        self.chunk_size = chunk_size
+        self.history_path = history_path
+        if history_path is not None:
+            os.makedirs(history_path, exist_ok=True)
+        self.chunks = []
+        self.tail = []
+        self.cached_chunk = (None, None)
+
+    def __len__(self):
+        return len(self.chunks) * self.chunk_size + len(self.tail)
+
+    def chunk_path(self, chunk_idx: int) -> str:
+        return os.path.join(self.history_path, 'chunk_{:06d}.npy'.format(chunk_idx))
+
+    def append(self, score: float):
+        self.tail.append(score)
+        if len(self.tail) == self.chunk_size:
+            chunk = np.array(self.tail, dtype=np.float64)
+            if self.history_path is None:
+                self.chunks.append(chunk)
+            else:
+                np.save(self.chunk_path(len(self.chunks)), chunk)
+                self.chunks.append(None)
+                self.cached_chunk = (len(self.chunks) - 1, chunk)
+            self.tail = []
+
+    def extend(self, scores: Iterable[float]):
+        for score in scores:
+            self.append(score)
+
+    def get_chunk(self, chunk_idx: int) -> np.ndarray:
+        chunk = self.chunks[chunk_idx]
+        if chunk is not None:
+            return chunk
+        cached_idx, cached_chunk = self.cached_chunk
+        if cached_idx != chunk_idx:
+            cached_chunk = np.load(self.chunk_path(chunk_idx))
+            self.cached_chunk = (chunk_idx, cached_chunk)
+        return cached_chunk
 
+    def to_array(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """ Scores[start:stop] as an array, only reading the chunks overlapping the range """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return np.zeros(0)
+        parts = []
+        num_chunked = len(self.chunks) * self.chunk_size
+        for chunk_idx in range(start // self.chunk_size, min(math.ceil(stop / self.chunk_size), len(self.chunks))):
+            chunk_start = chunk_idx * self.chunk_size
+            parts.append(self.get_chunk(chunk_idx)[max(start - chunk_start, 0):stop - chunk_start])
+        if stop > num_chunked:
+            parts.append(np.array(self.tail[max(start - num_chunked, 0):stop - num_chunked], dtype=np.float64))
+        return np.concatenate(parts)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                return self.to_array()[item].tolist()
+            return self.to_array(item.start, item.stop).tolist()
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("Score index out of range")
+        chunk_idx, offset = divmod(item, self.chunk_size)
+        if chunk_idx == len(self.chunks):
+            return self.tail[offset]
+        return float(self.get_chunk(chunk_idx)[offset])
+
+    def __iter__(self):
+        for chunk_idx in range(len(self.chunks)):
+            yield from self.get_chunk(chunk_idx).tolist()
+        yield from list(self.tail)
+
+    def __array__(self, dtype=None):
+        array = self.to_array()
+        return array.astype(dtype) if dtype is not None else array
+
+
+class Scores:
+    """ Helper class for maintaining the scores (rewards) accumulated by an agent
+
+    The sum and sum of squares of the sliding window are maintained as scores are added, so the window mean and
+    standard deviation are O(1). The full history is kept in a chunked ScoreHistory, optionally persisted on disk
+    """
+    # Window sums are recomputed exactly every RESYNC_FREQUENCY * window_size additions, to bound rounding drift
+    RESYNC_FREQUENCY = 100
+
+    def __init__(self, tag: str = 'Training', window_size: int = 100, initialize_scores: Optional[List[float]] = None,
+                 quantiles: Optional[tuple] = None, history_path: Optional[str] = None, chunk_size: int = 10000):
+        """
+        :param tag: Name of the scores
+        :param window_size: Size of the sliding window
+        :param initialize_scores: Optional scores to start from
+        :param quantiles: Optional quantiles of all scores to estimate in streaming, eg. (0.1, 0.5, 0.9)
+        :param history_path: Optional directory in which full chunks of the score history are saved
+        :param chunk_size: The number of scores per chunk of the history
+        """
         self.tag = tag
         self.window_size = window_size
+        self.scores = ScoreHistory(chunk_size=chunk_size, history_path=history_path)
+        self.sliding_scores = deque(maxlen=window_size)
+        self.window_sum = 0.
+        self.window_sum_squares = 0.
+        self.num_added = 0
+        self.quantile_estimators = {q: P2Quantile(q) for q in (quantiles or ())}
+
+        if initialize_scores is not None:
+            for score in initialize_scores:
+                self.add(score)
         self.t_init = time.time()
 
+    def __setstate__(self, state):
+        # Scores pickled before the streaming statistics kept a plain list of scores and no window sums
+        self.__dict__.update(state)
+        if 'window_sum' not in state:
+            scores = ScoreHistory()
+            scores.extend(state['scores'])
+            self.scores = scores
+            self.window_sum = math.fsum(self.sliding_scores)
+            self.window_sum_squares = math.fsum(s * s for s in self.sliding_scores)
+            self.num_added = len(scores)
+            self.quantile_estimators = {}
+
     def add(self, score: float):
+        score = float(score)
         self.scores.append(score)
+        if len(self.sliding_scores) == self.window_size:
+            oldest_score = self.sliding_scores[0]
+            self.window_sum -= oldest_score
+            self.window_sum_squares -= oldest_score * oldest_score
         self.sliding_scores.append(score)
+        self.window_sum += score
+        self.window_sum_squares += score * score
+        for estimator in self.quantile_estimators.values():
+            estimator.add(score)
+
+        self.num_added += 1
+        if self.num_added % (self.RESYNC_FREQUENCY * self.window_size) == 0:
+            self.window_sum = math.fsum(self.sliding_scores)
+            self.window_sum_squares = math.fsum(s * s for s in self.sliding_scores)
+
+    def get_mean_sliding_scores(self) -> float:
+        if not self.sliding_scores:
+            return float('nan')
+        return self.window_sum / len(self.sliding_scores)
+
+    def get_sum_sliding_scores(self) -> float:
+        return self.window_sum
+
+    def get_std_sliding_scores(self) -> float:
+        n = len(self.sliding_scores)
+        if n == 0:
+            return float('nan')
+        mean = self.window_sum / n
+        return math.sqrt(max(self.window_sum_squares / n - mean * mean, 0.))
 
-    def get_mean_sliding_scores(self):
-        return np.mean(self.sliding_scores)
+    def get_quantiles(self) -> dict:
+        """ Streaming estimates of the quantiles of all scores """
+        return {q: estimator.get() for q, estimator in self.quantile_estimators.items()}
 
-    def get_plot(self, title_text: str = 'Scores (Rewards)', xlabel_text: str = 'Episode #', ylabel_txt: str = 'Score', body_txt: str = None, txt_size: str = 'x-small'):
-        data = pd.DataFrame(self.scores)
-        rolling_data = data.rolling(window=self.window_size).mean()
+    def get_plot(self, title_text: str = 'Scores (Rewards)', xlabel_text: str = 'Episode #', ylabel_txt: str = 'Score', body_txt: str = None, txt_size: str = 'x-small',
+                 max_points: int = 5000):
+        """
+        Scatter plot the scores and overlay the rolling mean. Histories longer than max_points are downsampled to
+        max_points evenly spaced episodes, the rolling mean being computed over the full history
+        """
+        data = self.scores.to_array()
+        # Rolling mean over complete windows, as a difference of cumulative sums
+        rolling_data = np.full(len(data), np.nan)
+        if len(data) >= self.window_size:
+            cumulative_sums = np.concatenate(([0.], np.cumsum(data)))
+            rolling_data[self.window_size - 1:] = (cumulative_sums[self.window_size:] - cumulative_sums[:-self.window_size]) / self.window_size
+        index = np.arange(len(data))
+        if len(data) > max_points:
+            index = np.unique(np.linspace(0, len(data) - 1, max_points).astype(np.int64))
 
         fig = figure()
         gca().set_position((.1, .3, .8, .6))  # to make a bit of room for extra text
-        scatter(data.index, data, color='blue', marker='+', label='Episode scores')
-        plot(rolling_data.index, rolling_data, color='red', label="{} episode average score".format(self.window_size))
+        scatter(index, data[index], color='blue', marker='+', label='Episode scores')
+        plot(index, rolling_data[index], color='red', label="{} episode average score".format(self.window_size))
         title(title_text, wrap=True)
         ylabel(ylabel_txt)
         xlabel(xlabel_text)
@@ -5,8 +5,14 @@ class SpaceDiscretizer:
     def __init__(self, dimension_lower_bounds, dimension_upper_bounds, dimension_intervals=(10, 10), ):
         self.dimension_lower_bounds = dimension_lower_bounds
         self.dimension_upper_bounds = dimension_upper_bounds
-        self.dimension_intervals = dimension_intervals
+        self.dimension_intervals = tuple(dimension_intervals)
         self.resolved_space = self.create_uniform_grid()
+        # Split points of all dimensions stacked as (num_dimensions, max_num_split_points), padded with +inf which no
+        # sample reaches, for batched discretization
+        self.stacked_grid = np.full((len(self.resolved_space), max(len(g) for g in self.resolved_space)), np.inf)
+        for dim_idx, dim_grid in enumerate(self.resolved_space):
+            self.stacked_grid[dim_idx, :len(dim_grid)] = dim_grid
+        self.num_states = int(np.prod(self.dimension_intervals))
 
     def create_uniform_grid(self):
         """Define a uniformly-spaced grid that can be used to discretize a space.
@@ -56,3 +62,34 @@ class SpaceDiscretizer:
             # Convert to discrete state
             discretized_sample.append(int(np.digitize(dim_sample_value, dim_grid)))
         return discretized_sample
+
+    def discretize_batch(self, samples) -> np.ndarray:
+        """Discretize a batch of samples as per the grid, in a single vectorized pass.
+
+        Parameters
+        ----------
+        samples : array_like
+            Array of shape (num_samples, num_dimensions) from the (original) continuous space.
+
+        Returns
+        -------
+        discretized_samples : array_like
+            Integer bins of shape (num_samples, num_dimensions), identical to discretize().
+        """
+        samples = np.asarray(samples, dtype=self.stacked_grid.dtype).reshape(-1, self.stacked_grid.shape[0])
+        return (samples[:, :, np.newaxis] >= self.stacked_grid).sum(axis=2)
+
+    def get_state_ids(self, samples) -> np.ndarray:
+        """Flat integer ids in [0, num_states) of a batch of samples, eg. to index a Q-table.
+
+        Parameters
+        ----------
+        samples : array_like
+            Array of shape (num_samples, num_dimensions) from the (original) continuous space.
+
+        Returns
+        -------
+        state_ids : array_like
+            Row-major indices of the discretized samples, of shape (num_samples,).
+        """
+        return np.ravel_multi_index(self.discretize_batch(samples).T, self.dimension_intervals)
@@ -7,6 +7,95 @@ plt.style.use('ggplot')
 np.set_printoptions(precision=3, linewidth=120)
 
 
+class IHT:
+    """Index hash table, mapping (tiling, tile coordinates) keys to feature indices in [0, size).
+
+    As in Sutton's tiles3, keys get consecutive indices as they are first seen, so that no two
+    tiles share a feature while the table has room. Once the table is full, new keys are hashed
+    into the existing indices, and collide.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.dictionary = {}
+        self.overfull_count = 0
+
+    def __len__(self):
+        return len(self.dictionary)
+
+    def is_full(self) -> bool:
+        return len(self.dictionary) >= self.size
+
+    def get_index(self, key: tuple, read_only: bool = False):
+        """Feature index of a key, or None for an unseen key in read_only mode."""
+        index = self.dictionary.get(key)
+        if index is not None:
+            return index
+        if read_only:
+            return None
+        if self.is_full():
+            self.overfull_count += 1
+            return hash(key) % self.size
+        index = len(self.dictionary)
+        self.dictionary[key] = index
+        return index
+
+    def get_indices(self, encoded_samples: np.ndarray) -> np.ndarray:
+        """Feature indices of a batch of tile coordinates.
+
+        Parameters
+        ----------
+        encoded_samples : array_like
+            Tile coordinates of shape (num_samples, num_tilings, num_dimensions), as returned
+            by TileCoding.tile_encode_batch().
+
+        Returns
+        -------
+        features : array_like
+            Feature indices of shape (num_samples, num_tilings). Only the distinct tiles of the
+            batch are looked up in the table.
+        """
+        num_samples, num_tilings, _ = encoded_samples.shape
+        keys = np.concatenate([
+            np.broadcast_to(np.arange(num_tilings)[:, np.newaxis], (num_samples, num_tilings, 1)),
+            encoded_samples
+        ], axis=2).reshape(num_samples * num_tilings, -1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        unique_indices = np.fromiter((self.get_index(tuple(key)) for key in unique_keys.tolist()), dtype=np.int64, count=len(unique_keys))
+        return unique_indices[inverse].reshape(num_samples, num_tilings)
+
+
+def hash_tile_features(encoded_samples: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Hash tile coordinates to feature indices in [0, size), without a table.
+
+    Fully vectorized alternative to IHT.get_indices(), for when the number of tiles is too large
+    for a table; distinct tiles collide with probability of about 1 / size.
+
+    Parameters
+    ----------
+    encoded_samples : array_like
+        Tile coordinates of shape (num_samples, num_tilings, num_dimensions).
+    size : int
+        Number of features.
+    seed : int
+        Seed of the random multipliers of the hash.
+
+    Returns
+    -------
+    features : array_like
+        Feature indices of shape (num_samples, num_tilings).
+    """
+    num_tilings, num_dimensions = encoded_samples.shape[1:]
+    multipliers = np.random.RandomState(seed).randint(1, 2 ** 31 - 1, size=num_dimensions + 1).astype(np.uint64) | np.uint64(1)
+    # Wrapping uint64 arithmetic, mixing the tiling and each coordinate
+    with np.errstate(over='ignore'):
+        hashes = np.arange(num_tilings, dtype=np.uint64) * multipliers[0]
+        hashes = hashes + encoded_samples.astype(np.uint64) @ multipliers[1:]
+        hashes ^= hashes >> np.uint64(29)
+        hashes *= np.uint64(0xbf58476d1ce4e5b9)
+        hashes ^= hashes >> np.uint64(32)
+    return (hashes % np.uint64(size)).astype(np.int64)
+
+
 class TileCoding:
     def __init__(self):
         pass
@@ -130,6 +219,78 @@ class TileCoding:
         else:
             return encoded_sample
 
+    @staticmethod
+    def stack_tilings(tilings) -> np.ndarray:
+        """Stack tilings into a single array, for batched encoding.
+
+        Dimensions with fewer split points are padded with +inf, which no sample reaches,
+        so that the padding never changes the bin of a sample.
+
+        Parameters
+        ----------
+        tilings : list
+            A list of tilings (grids), each produced by create_tiling_grid().
+
+        Returns
+        -------
+        stacked_tilings : array_like
+            Array of shape (num_tilings, num_dimensions, max_num_split_points).
+        """
+        if isinstance(tilings, np.ndarray):
+            return tilings
+        num_split_points = max(len(grid_1d) for grid in tilings for grid_1d in grid)
+        stacked_tilings = np.full((len(tilings), len(tilings[0]), num_split_points), np.inf)
+        for t, grid in enumerate(tilings):
+            for d, grid_1d in enumerate(grid):
+                stacked_tilings[t, d, :len(grid_1d)] = grid_1d
+        return stacked_tilings
+
+    @staticmethod
+    def get_num_tiles(stacked_tilings: np.ndarray) -> np.ndarray:
+        """Number of tiles along each dimension, shared by all tilings."""
+        return np.isfinite(stacked_tilings).sum(axis=2).max(axis=0) + 1
+
+    def tile_encode_batch(self, samples, tilings, feature_indices: bool = False, chunk_size: int = 4096) -> np.ndarray:
+        """Encode a batch of samples over all tilings in a single vectorized pass.
+
+        The bin of a sample along a dimension is the number of split points it reaches, as
+        computed by np.digitize, so the encoding is identical to tile_encode.
+
+        Parameters
+        ----------
+        samples : array_like
+            Array of shape (num_samples, num_dimensions) from the (original) continuous space.
+        tilings : list or array_like
+            A list of tilings produced by create_tilings(), or already stacked by stack_tilings().
+        feature_indices : bool
+            If true, return the index of the active tile of each tiling among all the tiles of
+            all tilings, in [0, num_tilings * num_tiles_per_tiling).
+        chunk_size : int
+            Number of samples compared against the split points at once, bounding the memory used.
+
+        Returns
+        -------
+        encoded_samples : array_like
+            Tile coordinates of shape (num_samples, num_tilings, num_dimensions), or feature
+            indices of shape (num_samples, num_tilings).
+        """
+        stacked_tilings = self.stack_tilings(tilings)
+        samples = np.asarray(samples, dtype=stacked_tilings.dtype).reshape(-1, stacked_tilings.shape[1])
+        num_tilings, num_dimensions, _ = stacked_tilings.shape
+
+        encoded_samples = np.empty((len(samples), num_tilings, num_dimensions), dtype=np.int64)
+        for start in range(0, len(samples), chunk_size):
+            chunk = samples[start:start + chunk_size, np.newaxis, :, np.newaxis]
+            np.sum(chunk >= stacked_tilings, axis=3, out=encoded_samples[start:start + chunk_size])
+
+        if not feature_indices:
+            return encoded_samples
+        num_tiles = self.get_num_tiles(stacked_tilings)
+        # Row-major strides of the tiles within a tiling, and the offset of each tiling
+        strides = np.append(np.cumprod(num_tiles[::-1])[-2::-1], 1)
+        tiling_offsets = np.arange(num_tilings) * np.prod(num_tiles)
+        return encoded_samples @ strides + tiling_offsets
+
     def visualize_encoded_samples(self, samples, encoded_samples, tilings, low=None, high=None):
         """Visualize samples by activating the respective tiles."""
         samples = np.array(samples)  # for ease of indexing
@@ -179,6 +340,41 @@ class TileCoding:
         ax.set_title("Tile-encoded samples")
         return ax
 
+
+class TileCoder:
+    """Maps batches of continuous states to the active features of a tile coding.
+
+    Each state activates one tile per tiling. Features are exact tile indices when the tilings
+    have at most max_features tiles in total, and are otherwise hashed into max_features
+    indices with an IHT.
+    """
+    def __init__(self, low, high, tiling_specs, max_features: int = 2 ** 16):
+        """
+        Parameters
+        ----------
+        low : array_like
+            Lower bounds for each dimension of the continuous space.
+        high : array_like
+            Upper bounds for each dimension of the continuous space.
+        tiling_specs : list of tuples
+            A sequence of (bins, offsets) to be passed to create_tiling_grid().
+        max_features : int
+            Maximum number of features.
+        """
+        self.tile_coding = TileCoding()
+        self.tilings = self.tile_coding.stack_tilings(self.tile_coding.create_tilings(low, high, tiling_specs))
+        self.num_tilings = self.tilings.shape[0]
+        num_tiles = self.num_tilings * int(np.prod(self.tile_coding.get_num_tiles(self.tilings)))
+        self.iht = IHT(max_features) if num_tiles > max_features else None
+        self.num_features = max_features if self.iht is not None else num_tiles
+
+    def encode(self, states) -> np.ndarray:
+        """Active features of shape (num_states, num_tilings)."""
+        if self.iht is None:
+            return self.tile_coding.tile_encode_batch(states, self.tilings, feature_indices=True)
+        return self.iht.get_indices(self.tile_coding.tile_encode_batch(states, self.tilings))
+
+
 # low = [-1.0, -5.0]
 # high = [1.0, 5.0]
 # create_tiling_grid(low, high, bins=(10, 10), offsets=(-0.1, 0.5))  # [test]
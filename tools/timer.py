@@ -15,3 +15,162 @@ class Timer:
 
     def log_duration(self):
         print('Duration is: {}'.format(self.end_time - self.start_time))
+
+
+# time.perf_counter_ns requires python 3.7
+clock_ns = getattr(time, 'perf_counter_ns', None) or (lambda: int(time.perf_counter() * 1e9))
+
+
+class LatencyHistogram:
+    """ Histogram of durations in nanoseconds, with log-spaced buckets
+
+    Each power of two is split into SUB_BUCKETS buckets, so quantiles are approximated within 2 ** (1 / SUB_BUCKETS).
+    The buckets are preallocated and recording a duration is a few integer operations
+    """
+    SUB_BUCKETS = 4
+    SUB_BUCKET_BITS = 2
+    NUM_BUCKETS = 64 * SUB_BUCKETS
+
+    def __init__(self):
+        self.counts = [0] * self.NUM_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def add(self, duration_ns: int):
+        self.count += 1
+        self.total += duration_ns
+        if self.min is None or duration_ns < self.min:
+            self.min = duration_ns
+        if duration_ns > self.max:
+            self.max = duration_ns
+        self.counts[self.bucket(duration_ns)] += 1
+
+    def bucket(self, duration_ns: int) -> int:
+        num_bits = duration_ns.bit_length()
+        if num_bits <= self.SUB_BUCKET_BITS:
+            return duration_ns
+        sub_bucket = (duration_ns >> (num_bits - 1 - self.SUB_BUCKET_BITS)) & (self.SUB_BUCKETS - 1)
+        return (num_bits - self.SUB_BUCKET_BITS) * self.SUB_BUCKETS + sub_bucket
+
+    def bucket_upper_bound(self, bucket: int) -> int:
+        if bucket < self.SUB_BUCKETS:
+            return bucket
+        octave, sub_bucket = divmod(bucket, self.SUB_BUCKETS)
+        num_bits = octave + self.SUB_BUCKET_BITS
+        return ((self.SUB_BUCKETS + sub_bucket + 1) << (num_bits - 1 - self.SUB_BUCKET_BITS)) - 1
+
+    def quantile(self, q: float) -> int:
+        """ Upper bound of the bucket holding the q-th quantile, capped by the maximum duration """
+        if self.count == 0:
+            return 0
+        rank = q * self.count
+        cumulative_count = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative_count += count
+            if count and cumulative_count >= rank:
+                return min(self.bucket_upper_bound(bucket), self.max)
+        return self.max
+
+    def reset(self):
+        self.__init__()
+
+
+class PhaseTimer:
+    """ Records latency histograms of the phases of the training loop
+
+    Phases are timed with the monotonic nanosecond clock, either as `with timer.phase('learn'):` or with
+    start/stop. Phases may be nested (eg. 'target_update' within 'learn'), in which case the outer phase includes
+    the inner one. When disabled, timing is a no-op.
+
+    CUDA kernels run asynchronously, so without synchronize_cuda the phases launching them only measure the launch
+    """
+    def __init__(self, enabled: bool = True, synchronize_cuda: bool = False):
+        self.enabled = enabled
+        self.synchronize_cuda = synchronize_cuda
+        self.histograms = {}
+        self.start_times = {}
+        self.phases = {}
+        self.t_start = clock_ns()
+
+    def start(self, phase: str):
+        if self.enabled:
+            self.start_times[phase] = clock_ns()
+
+    def stop(self, phase: str):
+        if not self.enabled:
+            return
+        if self.synchronize_cuda:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+        duration_ns = clock_ns() - self.start_times[phase]
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = LatencyHistogram()
+        histogram.add(duration_ns)
+
+    def phase(self, phase: str) -> 'TimedPhase':
+        """ Context manager timing a phase, reused across calls """
+        timed_phase = self.phases.get(phase)
+        if timed_phase is None:
+            timed_phase = self.phases[phase] = TimedPhase(self, phase)
+        return timed_phase
+
+    def summary(self) -> dict:
+        """ Statistics of each phase, in microseconds, with the share of the wall time since the last reset """
+        wall_time_ns = max(clock_ns() - self.t_start, 1)
+        summary = {}
+        for phase, histogram in self.histograms.items():
+            summary[phase] = {
+                'count': histogram.count,
+                'total_ms': histogram.total / 1e6,
+                'share': histogram.total / wall_time_ns,
+                'mean_us': histogram.total / max(histogram.count, 1) / 1e3,
+                'min_us': (histogram.min or 0) / 1e3,
+                'p50_us': histogram.quantile(0.5) / 1e3,
+                'p90_us': histogram.quantile(0.9) / 1e3,
+                'p99_us': histogram.quantile(0.99) / 1e3,
+                'max_us': histogram.max / 1e3,
+            }
+        return summary
+
+    def format_summary(self) -> str:
+        lines = ['{:<20} {:>10} {:>12} {:>7} {:>10} {:>10} {:>10} {:>10}'.format(
+            'phase', 'count', 'total (ms)', 'share', 'mean (us)', 'p50 (us)', 'p99 (us)', 'max (us)')]
+        for phase, stats in sorted(self.summary().items(), key=lambda x: -x[1]['total_ms']):
+            lines.append('{:<20} {:>10d} {:>12.1f} {:>6.1%} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                phase, stats['count'], stats['total_ms'], stats['share'], stats['mean_us'], stats['p50_us'],
+                stats['p99_us'], stats['max_us']
+            ))
+        return '\n'.join(lines)
+
+    def to_json(self, path: str):
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def reset(self):
+        self.histograms = {}
+        self.start_times = {}
+        self.t_start = clock_ns()
+
+
+class TimedPhase:
+    __slots__ = ('timer', 'name')
+
+    def __init__(self, timer: PhaseTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.start(self.name)
+        return self
+
+    def __exit__(self, *args):
+        self.timer.stop(self.name)
+
+
+# Shared by agents until the simulator assigns its own timer
+DISABLED_TIMER = PhaseTimer(enabled=False)
@@ -0,0 +1,174 @@
+import os
+import re
+import ast
+import time
+import uuid
+import pickle
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+
+TRIALS_TABLE = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    trial_index INTEGER,
+    performance REAL,
+    mean_sliding_score REAL,
+    max_score REAL,
+    n_train_episodes INTEGER,
+    sliding_window_size INTEGER,
+    train_time REAL,
+    stopped_early INTEGER,
+    params TEXT,
+    scores_path TEXT,
+    created_at REAL
+)
+"""
+
+TRIALS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS trials_performance ON trials (performance)",
+    "CREATE INDEX IF NOT EXISTS trials_mean_sliding_score ON trials (mean_sliding_score)",
+    "CREATE INDEX IF NOT EXISTS trials_n_train_episodes ON trials (n_train_episodes)",
+)
+
+ORDERABLE_COLUMNS = ('performance', 'mean_sliding_score', 'max_score', 'n_train_episodes', 'train_time', 'created_at')
+
+
+class TuningResultsStore:
+    """ SQLite store of the results of tuning trials, one row per trial
+
+    A row holds the trial's parameters, summary metrics and the path of its episode scores, saved alongside the
+    database as a .npy file. Rows are only ever appended. The database is in write-ahead-logging mode, so that
+    trials can be added concurrently from several threads (each using its own connection) or processes while the
+    results are read
+    """
+    DATABASE_NAME = 'trials.db'
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Directory of the database and of the score series
+        """
+        self.directory = os.path.abspath(directory)
+        self.scores_directory = os.path.join(self.directory, 'scores')
+        os.makedirs(self.scores_directory, exist_ok=True)
+        self.database_path = os.path.join(self.directory, self.DATABASE_NAME)
+        self.local = threading.local()
+
+        connection = self.get_connection()
+        with connection:
+            connection.execute(TRIALS_TABLE)
+            for index in TRIALS_INDEXES:
+                connection.execute(index)
+
+    def get_connection(self) -> sqlite3.Connection:
+        """ The connection of the calling thread, as sqlite connections can not be shared across threads """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database_path, timeout=60)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+        return connection
+
+    def add(self, trial_index: int, performance: float, info: dict) -> int:
+        """
+        Append the result of a trial
+        :param trial_index: The index of the trial in its tuning run
+        :param performance: The performance of the trial
+        :param info: Supplementary information of the trial, as returned by get_agent_performance with its
+            'input_params'
+        :return: The id of the trial's row
+        """
+        train_scores = info.get('train_scores')
+        if train_scores is None:
+            train_scores = []
+        scores = np.asarray(getattr(train_scores, 'scores', train_scores), dtype=np.float32)
+        sliding_window_size = info.get('sliding_window_size', 100)
+
+        # The score series is written before its row, so that every row references an existing file
+        scores_path = os.path.join(self.scores_directory, '{}.npy'.format(uuid.uuid4().hex))
+        np.save(scores_path, scores)
+
+        connection = self.get_connection()
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO trials (trial_index, performance, mean_sliding_score, max_score, n_train_episodes, "
+                "sliding_window_size, train_time, stopped_early, params, scores_path, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    trial_index,
+                    float(performance),
+                    float(scores[-sliding_window_size:].mean()) if len(scores) else None,
+                    float(scores.max()) if len(scores) else None,
+                    info.get('n_train_episodes', len(scores)),
+                    sliding_window_size,
+                    info.get('train_time'),
+                    int(bool(info.get('stopped_early', False))),
+                    # Parameters are stored as a python literal, to recover tuples as tuples
+                    repr(info.get('input_params', {})),
+                    os.path.relpath(scores_path, self.directory),
+                    time.time(),
+                )
+            )
+        return cursor.lastrowid
+
+    def query(self, min_mean_sliding_score: Optional[float] = None, order_by: str = 'mean_sliding_score',
+              descending: bool = True, limit: Optional[int] = None) -> List[dict]:
+        """
+        Query the trials
+        :param min_mean_sliding_score: Only return the trials with a greater mean score over their last sliding window
+        :param order_by: Column to sort the trials by
+        :param descending: Whether to sort in descending order
+        :param limit: The maximum number of trials to return
+        :return: The trials, as dicts of the columns with the params parsed
+        """
+        if order_by not in ORDERABLE_COLUMNS:
+            raise ValueError("Can not order by {}, expected one of {}".format(order_by, ORDERABLE_COLUMNS))
+        sql = "SELECT * FROM trials"
+        args = []
+        if min_mean_sliding_score is not None:
+            sql += " WHERE mean_sliding_score > ?"
+            args.append(min_mean_sliding_score)
+        sql += " ORDER BY {} {}".format(order_by, 'DESC' if descending else 'ASC')
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+
+        trials = []
+        for row in self.get_connection().execute(sql, args):
+            trial = dict(row)
+            trial['params'] = ast.literal_eval(trial['params'])
+            trials.append(trial)
+        return trials
+
+    def best(self) -> Optional[Tuple[int, float]]:
+        """ The (trial_index, performance) of the best trial """
+        row = self.get_connection().execute(
+            "SELECT trial_index, performance FROM trials ORDER BY performance DESC LIMIT 1"
+        ).fetchone()
+        return (row['trial_index'], row['performance']) if row is not None else None
+
+    def load_scores(self, trial: dict) -> List[float]:
+        """ The episode scores of a trial returned by query """
+        return np.load(os.path.join(self.directory, trial['scores_path'])).tolist()
+
+    def import_pickles(self, directory: str) -> int:
+        """
+        Import the trials of a directory of trial_<index>_performance_<performance> pickles, as previously written
+        by the tuning scripts. Corrupted files are skipped
+        :return: The number of trials imported
+        """
+        num_imported = 0
+        for file_name in sorted(os.listdir(directory)):
+            match = re.match(r'trial_(\d+)_performance_(.+)$', file_name)
+            if match is None:
+                continue
+            try:
+                with open(os.path.join(directory, file_name), 'rb') as f:
+                    info = pickle.load(f)
+                self.add(int(match.group(1)), float(match.group(2)), info)
+                num_imported += 1
+            except Exception as e:
+                print("Skipping {}: {}".format(file_name, e))
+        return num_imported